@@ -0,0 +1,273 @@
+"""
+Name: batch_reports.py
+Author: Ari Bernstein
+Description: Runs several complaint reports on one dataset without any prompts.
+-The dataset is read once (through the cache of dataset_cache.py) and every index the reports use is built before
+ they start, so the reports only read shared data
+-run_reports runs a list of reports in a thread pool, writes what each one prints to its own file, and times it
+-ThreadLocalStdout sends what each thread prints to the file of the report it is running
+-load_report_config reads the list of reports from a JSON file, e.g.
+     [{"report": "statistics"},
+      {"report": "top_companies", "count": 5},
+      {"report": "state_query", "states": ["NY", "MN"], "max_count": 3, "output": "ny-mn.txt"},
+      {"report": "lookup", "ids": [468882, 468889]},
+      {"report": "phrase", "phrases": ["mortgage", "credit card"]}]
+ Every key other than "report" and "output" is passed to the report (see REPORTS).
+Usage: python batch_reports.py data/Long-20k.csv [reports.json] [output directory]
+Pre-condition: the modules of the other complaint tools work correctly and are in same directory, csv files are in
+subdirectory labeled 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from complaint_index import *
+from complaint_statistics import *
+from complaint_dates import *
+from dataset_cache import *
+from company_complaints import *
+from state_complaints import *
+from narrative_search import *
+import display_complaints
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
+import io
+import json
+import os
+import sys
+import threading
+import traceback
+
+
+class ThreadLocalStdout:
+    """
+    Stands in for sys.stdout while reports run. Text printed by a thread that has redirected its output goes to that
+    thread's buffer; text printed by any other thread goes to the real stdout.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def redirect(self, buffer):
+        """sends what the current thread prints to buffer (None to send it to the real stdout again)"""
+        self._local.buffer = buffer
+
+    def _target(self):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            return self.stream
+        return buffer
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+
+def _report_statistics(dataset, index, detailed=True):
+    """compute_statistics, followed by print_detailed_statistics unless detailed is False"""
+    compute_statistics(dataset, index)
+    if detailed:
+        print_detailed_statistics(dataset)
+
+
+def _report_top_companies(dataset, index, count=3):
+    """list_company_complaints for the 'count' companies with the most complaints"""
+    list_company_complaints(index, count)
+
+
+def _report_states(dataset, index):
+    """list_state_complaints for every state"""
+    list_state_complaints(index.state_counts())
+
+
+def _report_state_query(dataset, index, states, max_count=10):
+    """query_state_complaints for a list of state abbreviations"""
+    query_state_complaints(index.state_map(dataset), states, max_count)
+
+
+def _report_lookup(dataset, index, ids):
+    """display_complaint for each of a list of complaint IDs"""
+    for complaintID in ids:
+        display_complaints.display_complaint(display_complaints.returnClassFromID(dataset, str(complaintID)))
+        print('\n')
+
+
+def _report_phrase(dataset, index, phrases):
+    """dataFromPhrase for each of a list of phrases"""
+    for phrase in phrases:
+        print(phrase + ":")
+        dataFromPhrase(phrase, dataset, phrase_index(dataset))
+        print('')
+
+
+def _report_search(dataset, index, query, limit=10):
+    """print_search_results for a narrative search query"""
+    print_search_results(dataset, query, narrative_index(dataset), limit)
+
+
+def _report_time_series(dataset, index, period="month", by=None, start=None, end=None):
+    """print_time_series of time_series, once per value of 'by' if it is given"""
+    if by is None:
+        print_time_series(time_series(dataset, period, start=start, end=end), "Complaints per " + period)
+        return
+    for value, series in time_series(dataset, period, by, start=start, end=end).items():
+        print_time_series(series, (value if value != "" else "Undefined") + ", complaints per " + period)
+
+
+"""Report name -> function taking the dataset, its ComplaintIndex and the report's options"""
+REPORTS = {
+    "statistics": _report_statistics,
+    "top_companies": _report_top_companies,
+    "states": _report_states,
+    "state_query": _report_state_query,
+    "lookup": _report_lookup,
+    "phrase": _report_phrase,
+    "search": _report_search,
+    "time_series": _report_time_series,
+}
+
+"""Reports run by main when no configuration file is given"""
+DEFAULT_REPORTS = [{"report": "statistics"}, {"report": "top_companies", "count": 3}, {"report": "states"}]
+
+
+def load_report_config(filepath):
+    """
+    Reads a list of reports from a JSON file (see the description at the top of this file)
+    :param filepath: path name of the JSON file
+    :return: list of dictionaries, each with at least a "report" key naming one of REPORTS
+    """
+    with open(filepath) as config_file:
+        reports = json.load(config_file)
+    if not isinstance(reports, list):
+        raise ValueError(filepath + " must hold a list of reports")
+    for report in reports:
+        if not isinstance(report, dict) or report.get("report") not in REPORTS:
+            raise ValueError(filepath + ": unknown report " + repr(report) + ", expected one of " +
+                             ", ".join(REPORTS))
+    return reports
+
+
+def prepare_dataset(dataset, reports):
+    """
+    Builds, before any report starts, every cached structure the reports will use, so that the threads running them
+    only read the dataset
+    :param dataset: a ComplaintTable
+    :param reports: list of report dictionaries
+    :return: the dataset's ComplaintIndex
+    """
+    index = complaint_index(dataset)
+    names = set(report["report"] for report in reports)
+    if "phrase" in names:
+        phrase_index(dataset)
+    if "statistics" in names:
+        stats = complaint_statistics(dataset)
+        for name in STATISTICS_SLOTS:
+            stats.count_list(name)
+    if "search" in names:
+        narrative_index(dataset)
+    return index
+
+
+def _output_name(position, report):
+    """helper function returning the file name a report is written to, e.g. 01-statistics.txt"""
+    if "output" in report:
+        return report["output"]
+    return str(position + 1).zfill(2) + "-" + report["report"] + ".txt"
+
+
+def _output_paths(reports, outputDirectory):
+    """
+    helper function returning the path name each report is written to
+    :raise ValueError: if two reports would write to the same file, which would lose one report's output
+    """
+    paths = [os.path.join(outputDirectory, _output_name(position, report)) for position, report in enumerate(reports)]
+    seen = {}
+    for position, path in enumerate(paths):
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            raise ValueError("reports " + str(seen[key] + 1) + " (" + reports[seen[key]]["report"] + ") and " +
+                             str(position + 1) + " (" + reports[position]["report"] + ") both write to " + path)
+        seen[key] = position
+    return paths
+
+
+def _run_report(stdout, dataset, index, report, filepath):
+    """
+    helper function running one report in the current thread and writing what it prints to filepath
+    :return: (seconds taken, error message or None)
+    """
+    options = {key: value for key, value in report.items() if key not in ("report", "output")}
+    buffer = io.StringIO()
+    error = None
+    stdout.redirect(buffer)
+    running = instrumentation.span("report:" + report["report"])
+    try:
+        with running:
+            REPORTS[report["report"]](dataset, index, **options)
+    except Exception:
+        error = traceback.format_exc()
+        buffer.write("\n" + error)
+    finally:
+        stdout.redirect(None)
+    totalTime = running.seconds
+    with open(filepath, "w") as output_file:
+        output_file.write(buffer.getvalue())
+    return totalTime, error
+
+
+def run_reports(dataset, reports, outputDirectory, workers=None):
+    """
+    Runs reports concurrently over one dataset, writing each report's printed output to its own file.
+    :param dataset: a ComplaintTable (e.g. from cached_read_complaint_table)
+    :param reports: list of report dictionaries (see load_report_config)
+    :param outputDirectory: directory the report files are written to (created if needed)
+    :param workers: number of threads (default: one per report, at most os.cpu_count())
+    :return: list of (report name, output path name, seconds taken, error message or None), in the order of reports
+    printed output: one line per report giving its time and output file, or its error
+    :raise ValueError: if two reports would write to the same file (nothing is run then)
+    """
+    paths = _output_paths(reports, outputDirectory)
+    os.makedirs(outputDirectory, exist_ok=True)
+    index = prepare_dataset(dataset, reports)
+    if workers is None:
+        workers = min(len(reports), os.cpu_count() or 1)
+
+    realStdout = sys.stdout
+    stdout = ThreadLocalStdout(realStdout)
+    sys.stdout = stdout
+    try:
+        with ThreadPoolExecutor(max(workers, 1)) as pool:
+            futures = [pool.submit(_run_report, stdout, dataset, index, report, path)
+                       for report, path in zip(reports, paths)]
+            outcomes = [future.result() for future in futures]
+    finally:
+        sys.stdout = realStdout
+
+    results = []
+    for report, path, (totalTime, error) in zip(reports, paths, outcomes):
+        results.append((report["report"], path, totalTime, error))
+        if error is None:
+            print(report["report"].ljust(16) + '{:.3f}'.format(totalTime) + " s  -> " + path)
+        else:
+            print(report["report"].ljust(16) + "failed  -> " + path + ": " + error.strip().splitlines()[-1])
+    return results
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python batch_reports.py CSV_FILE [REPORTS.json] [OUTPUT_DIRECTORY]")
+        return
+    filepath = sys.argv[1]
+    reports = DEFAULT_REPORTS if len(sys.argv) < 3 else load_report_config(sys.argv[2])
+    outputDirectory = sys.argv[3] if len(sys.argv) > 3 else "reports"
+
+    with instrumentation.span("batch_reports") as running:
+        complaints = cached_read_complaint_table(filepath)
+        results = run_reports(complaints, reports, outputDirectory)
+    print("Ran " + str(len(results)) + " reports in " + '{:.3f}'.format(running.seconds) + " seconds.")
+
+
+if __name__ == '__main__':
+    main()
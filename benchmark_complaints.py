@@ -0,0 +1,294 @@
+"""
+Name: benchmark_complaints.py
+Author: Ari Bernstein
+Description: Timing comparisons for the hot paths of the complaint tools.
+-benchmark_construction compares building Complaint objects through the type-checked constructor with the trusted
+ constructor (Complaint.rowMaker) used by read_complaint_data.
+-replicate_dataset writes a large test file by repeating the rows of a small one under fresh Complaint_IDs.
+-benchmark_parallel_ingest times the parallel readers in parallel_ingest.py against the single process readers.
+-benchmark_compressed_ingest times reading gzip, bz2 and xz copies of a file against reading the file itself.
+-benchmark_narrative_search times building the narrative index of narrative_search.py and answering queries.
+-benchmark_rendering compares printing complaints line by line with display_complaint and ComplaintWriter.
+-benchmark_projection compares full reads with projected (fields=) and filtered (where=) reads: time and peak memory.
+Pre-condition: utilities.py works correctly and is in the same directory, csv files are in subdirectory called 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from parallel_ingest import *
+from narrative_search import *
+from display_complaints import *
+import contextlib
+import csv
+import gzip
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+def load_rows(filepath):
+    """helper function returning the data rows (heading excluded) of a CSV file as lists of strings"""
+    with open_complaint_file(filepath) as csv_file:
+        read_csv_file = csv.reader(csv_file, delimiter = ",")
+        next(read_csv_file, None)
+        return [row for row in read_csv_file]
+
+
+def best_time(function, repeat):
+    """helper function returning the fastest of 'repeat' runs of function(), in seconds"""
+    best = None
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        function()
+        totalTime = time.perf_counter() - startTime
+        if best is None or totalTime < best:
+            best = totalTime
+    return best
+
+
+def benchmark_construction(filepath, repeat=5):
+    """
+    Times building one Complaint per row of a CSV file through Complaint(*row) (18 type checks per row) and through
+    the trusted constructor returned by Complaint.rowMaker.
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param repeat: number of runs of each path; the fastest run is reported
+    :return: A dictionary mapping each construction path to its best time in seconds
+    printed output: rows per second for each path and the speedup of the trusted path
+    """
+    rows = load_rows(filepath)
+    checked = Complaint.rowMaker(check=True)
+
+    results = {
+        "Complaint(*row)": best_time(lambda: [Complaint(*row) for row in rows], repeat),
+        "rowMaker(check=True)": best_time(lambda: [checked(row) for row in rows], repeat),
+        "rowMaker()": best_time(lambda: [makeComplaint(row) for row in rows], repeat),
+    }
+
+    print("Constructing " + str(len(rows)) + " complaints from " + filepath)
+    for name in results:
+        print(name.ljust(24) + '{:.4f}'.format(results[name]) + " s  " +
+              '{:,.0f}'.format(len(rows) / results[name]) + " rows/s")
+    print("Speedup of rowMaker() over Complaint(*row): " +
+          '{:.1f}'.format(results["Complaint(*row)"] / results["rowMaker()"]) + "x")
+    return results
+
+
+def replicate_dataset(filepath, destination, totalRows):
+    """
+    Writes a CSV file of totalRows complaints by repeating the rows of another file. Complaint_IDs are renumbered
+    from 1 so every row stays unique.
+    :param filepath: A string, giving the path name of the CSV data file to copy rows from.
+    :param destination: path name of the file to write
+    :param totalRows: number of data rows to write
+    :return: destination
+    """
+    with open_complaint_file(filepath) as csv_file:
+        read_csv_file = csv.reader(csv_file, delimiter = ",")
+        heading = next(read_csv_file)
+        rows = [row for row in read_csv_file]
+    with open(destination, "w", newline="") as out_file:
+        write_csv_file = csv.writer(out_file, delimiter = ",")
+        write_csv_file.writerow(heading)
+        for i in range(totalRows):
+            row = rows[i % len(rows)][:]
+            row[17] = str(i + 1)
+            write_csv_file.writerow(row)
+    return destination
+
+
+def benchmark_parallel_ingest(filepath, processCounts=None, repeat=1):
+    """
+    Times read_complaint_data and read_complaint_table against their parallel versions for several pool sizes.
+    :param filepath: A string, giving the path name of a CSV data file (see replicate_dataset for making a big one)
+    :param processCounts: pool sizes to try (default: 1, 2, 4, ... up to the number of CPUs)
+    :param repeat: number of runs of each reader; the fastest run is reported
+    :return: A dictionary mapping (reader name, processes) to its best time in seconds
+    printed output: time and speedup over the single process reader for each run
+    """
+    if processCounts is None:
+        processCounts = [1]
+        while processCounts[-1] * 2 <= (os.cpu_count() or 1):
+            processCounts.append(processCounts[-1] * 2)
+
+    def quietly(reader, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            reader(*args)
+
+    results = {}
+    pairs = ((read_complaint_data, read_complaint_data_parallel),
+             (read_complaint_table, read_complaint_table_parallel))
+    print("Reading " + filepath + " (" + str(os.cpu_count()) + " CPUs)")
+    for serialReader, parallelReader in pairs:
+        serialTime = best_time(lambda: quietly(serialReader, filepath), repeat)
+        results[(serialReader.__name__, 1)] = serialTime
+        print(serialReader.__name__.ljust(36) + '{:.3f}'.format(serialTime) + " s")
+        for processes in processCounts:
+            parallelTime = best_time(lambda: quietly(parallelReader, filepath, processes), repeat)
+            results[(parallelReader.__name__, processes)] = parallelTime
+            print((parallelReader.__name__ + " x" + str(processes)).ljust(36) + '{:.3f}'.format(parallelTime) +
+                  " s  (" + '{:.2f}'.format(serialTime / parallelTime) + "x)")
+    return results
+
+
+def benchmark_compressed_ingest(filepath, repeat=1):
+    """
+    Times read_complaint_table on a CSV file and on gzip, bz2 and xz copies of it, which are decompressed while they
+    are read (see open_complaint_file).
+    :param filepath: A string, giving the path name of an uncompressed CSV data file.
+    :param repeat: number of runs of each read; the fastest run is reported
+    :return: A dictionary mapping "plain" and each compression to its best time in seconds
+    printed output: size, time and slowdown over the plain file of each read
+    """
+    """bz2 and lzma are None when this Python doesn't have them, see utilities.py"""
+    compressors = [(name, module, suffix) for name, module, suffix in
+                   (("gzip", gzip, ".gz"), ("bz2", bz2, ".bz2"), ("xz", lzma, ".xz")) if module is not None]
+    with open(filepath, "rb") as data_file:
+        data = data_file.read()
+
+    def quietly(path):
+        with contextlib.redirect_stdout(io.StringIO()):
+            read_complaint_table(path)
+
+    results = {"plain": best_time(lambda: quietly(filepath), repeat)}
+    print("Reading " + filepath + " (" + '{:.1f}'.format(len(data) / 2 ** 20) + " MiB)")
+    print("plain".ljust(8) + '{:.3f}'.format(results["plain"]) + " s")
+    for name, module, suffix in compressors:
+        compressedPath = os.path.join(tempfile.gettempdir(), os.path.basename(filepath) + suffix)
+        with open(compressedPath, "wb") as compressed_file:
+            compressed_file.write(module.compress(data))
+        try:
+            results[name] = best_time(lambda: quietly(compressedPath), repeat)
+        finally:
+            compressedSize = os.path.getsize(compressedPath)
+            os.remove(compressedPath)
+        print(name.ljust(8) + '{:.3f}'.format(results[name]) + " s  (" +
+              '{:.2f}'.format(results[name] / results["plain"]) + "x, " +
+              '{:.1f}'.format(compressedSize / 2 ** 20) + " MiB)")
+    return results
+
+
+"""Queries covering each clause type of narrative_search: words, prefixes, phrases and a mix"""
+SEARCH_QUERIES = ("foreclosure", "bank account", "foreclos*", "credit*", '"credit report"', '"late fee"',
+                  'mortgage "loan modification" escrow*')
+
+
+def benchmark_narrative_search(filepath, queries=SEARCH_QUERIES, repeat=20):
+    """
+    Times building a NarrativeIndex and answering queries against it.
+    :param filepath: A string, giving the path name of a CSV data file with narratives (e.g. LongLines1.csv; the
+    narratives of Long-20k.csv are empty)
+    :param queries: search queries to time
+    :param repeat: number of runs of each query; the fastest run is reported
+    :return: A dictionary mapping "build" and each query to its best time in seconds
+    printed output: index build time and size, then the latency and number of results of each query
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        complaints = read_complaint_table(filepath)
+    results = {}
+    startTime = time.perf_counter()
+    index = NarrativeIndex(complaints)
+    results["build"] = time.perf_counter() - startTime
+    print("Indexed " + str(len(index)) + " narratives (" + str(len(index.postings)) + " words) from " + filepath +
+          " in " + '{:.3f}'.format(results["build"]) + " s")
+    for query in queries:
+        results[query] = best_time(lambda: index.search(query), repeat)
+        print(query.ljust(40) + '{:.3f}'.format(results[query] * 1000) + " ms  " +
+              str(len(index.search(query, len(index)))) + " matches")
+    return results
+
+
+def print_complaint_by_line(complaint):
+    """the print path display_complaint used to take: one print call per slot, every value wrapped again"""
+    for name, wrap in DISPLAY_LAYOUT:
+        value = getattr(complaint, name)
+        print(eightSpace(name + " :", value if wrap is None else formatChars(value)))
+
+
+def benchmark_rendering(filepath, repeat=3):
+    """
+    Times writing every complaint of a CSV file to a file by printing it line by line (18 print calls per complaint),
+    with display_complaint, and with ComplaintWriter in each of its formats.
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param repeat: number of runs of each path; the fastest run is reported
+    :return: A dictionary mapping each path to its best time in seconds
+    printed output: time, complaints per second and size of the output of each path
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        complaints = list(read_complaint_table(filepath).values())
+    outputPath = os.path.join(tempfile.gettempdir(), "benchmark_rendering.out")
+
+    def printed(display):
+        with open(outputPath, "w") as out_file, contextlib.redirect_stdout(out_file):
+            for complaint in complaints:
+                display(complaint)
+
+    def written(format):
+        with open(outputPath, "w") as out_file, ComplaintWriter(out_file, format) as writer:
+            writer.write_complaints(complaints)
+
+    paths = (("print by line", lambda: printed(print_complaint_by_line)),
+             ("display_complaint", lambda: printed(display_complaint)),
+             ("ComplaintWriter plain", lambda: written("plain")),
+             ("ComplaintWriter jsonl", lambda: written("jsonl")),
+             ("ComplaintWriter csv", lambda: written("csv")))
+    results = {}
+    print("Writing " + str(len(complaints)) + " complaints from " + filepath)
+    for name, function in paths:
+        results[name] = best_time(function, repeat)
+        print(name.ljust(24) + '{:.3f}'.format(results[name]) + " s  " +
+              '{:,.0f}'.format(len(complaints) / results[name]) + " complaints/s  " +
+              '{:.1f}'.format(os.path.getsize(outputPath) / 2 ** 20) + " MiB")
+    os.remove(outputPath)
+    return results
+
+
+def benchmark_projection(filepath, fields=("Company", "Product", "State"), where=None):
+    """
+    Times read_complaint_data and read_complaint_table reading every field, reading only some fields (column
+    projection) and reading only matching rows (predicate pushdown), and measures each read's peak memory.
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param fields: slot names kept by the projected reads
+    :param where: row predicates of the filtered reads (default: complaints from NY)
+    :return: A dictionary mapping (reader name, read) to a (seconds, peak bytes, complaints read) tuple
+    printed output: time, peak memory and number of complaints of each read
+    """
+    if where is None:
+        where = {"State": "NY"}
+    reads = (("full", {}), ("fields", {"fields": fields}), ("where", {"where": where}),
+             ("fields+where", {"fields": fields, "where": where}))
+    results = {}
+    print("Reading " + filepath)
+    for reader in (read_complaint_data, read_complaint_table):
+        for name, options in reads:
+            tracemalloc.start()
+            startTime = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                complaints = reader(filepath, **options)
+            totalTime = time.perf_counter() - startTime
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[(reader.__name__, name)] = (totalTime, peak, len(complaints))
+            print((reader.__name__ + " " + name).ljust(36) + '{:.3f}'.format(totalTime) + " s  " +
+                  '{:.1f}'.format(peak / 2 ** 20) + " MiB peak  " + str(len(complaints)) + " complaints")
+            del complaints
+    return results
+
+
+def main():
+    filePath = getFilePath()
+    benchmark_construction(filePath)
+    benchmark_narrative_search(filePath)
+    benchmark_projection(filePath)
+    benchmark_compressed_ingest(filePath)
+    benchmark_rendering(filePath)
+    rows = input("Enter number of rows for the parallel ingest benchmark or press ENTER to skip: ")
+    if rows != "":
+        bigFile = replicate_dataset(filePath, filePath + ".replicated", int(rows))
+        benchmark_parallel_ingest(bigFile)
+        os.remove(bigFile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""
+Name: benchmark_suite.py
+Author: Ari Bernstein
+Description: Benchmark suite for the complaint tools: ingest, indexing, queries and rendering, on datasets of any size.
+-synthesize_dataset writes a CSV file of any number of complaints with the columns of data/Heading.csv. Each row
+ takes its Company, Product, State, dates, ... from a row of the sample files, so values keep the frequencies and
+ combinations of real complaints, and its narrative from LongLines1.csv / LongLines3.csv, so about half the rows carry
+ a long narrative. Complaint_IDs are numbered from 1.
+-BENCHMARKS lists the measured steps: read_complaint_data, make_company_map, make_state_map, compute_statistics,
+ list_company_complaints, query_state_complaints, dataFromPhrase and returnClassFromID
+-run_suite measures, for each dataset size, the wall time of each step (fastest of 'repeat' runs) and the peak memory
+ it allocates (one more run under tracemalloc); the results are plain dictionaries, written as JSON by save_results
+-compare_results compares results with a stored baseline and lists the steps that got slower or use more memory
+ than a tolerance allows
+Usage: python benchmark_suite.py [SIZES] [RESULTS.json] [BASELINE.json]
+       e.g. python benchmark_suite.py 10000,100000,1000000 results.json baseline.json
+       Synthesized files are kept in data/synthetic and used again by later runs. The exit status is 1 if the results
+       regressed against the baseline.
+Pre-condition: the modules of the other complaint tools work correctly and are in same directory, csv files are in
+subdirectory labeled 'data'
+"""
+
+from utilities import *
+from company_complaints import *
+from state_complaints import *
+import display_complaints
+import contextlib
+import csv
+import datetime
+import gc
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+HEADING_FILE = "./data/Heading.csv"
+
+"""Files whose rows give the values of synthesized complaints, and files whose narratives are used"""
+SAMPLE_FILES = ("./data/Long-20k.csv", "./data/Med-10k.csv", "./data/Short-05k.csv")
+NARRATIVE_FILES = ("./data/LongLines1.csv", "./data/LongLines3.csv")
+
+DEFAULT_SIZES = (10000, 100000)
+SYNTHETIC_DIRECTORY = "./data/synthetic"
+
+"""Phrases looked up by the dataFromPhrase step, and number of IDs looked up by the returnClassFromID step"""
+BENCHMARK_PHRASES = ("mortgage", "credit card", "student loan", "debt collection", "payday loan")
+LOOKUPS = 10000
+
+"""Rows written per call to csv.writer.writerows while synthesizing"""
+SYNTHESIS_CHUNK = 10000
+
+"""Results format, stored in the results so files of an older format are not compared"""
+RESULTS_VERSION = 1
+
+
+def _sample_rows(filepaths):
+    """helper function reading every row (in Complaint._slots order) of the files that exist"""
+    rows = []
+    for filepath in filepaths:
+        if os.path.exists(filepath):
+            rows.extend(iter_complaint_rows(filepath))
+    if rows == []:
+        raise FileNotFoundError("none of " + ", ".join(filepaths) + " exists")
+    return rows
+
+
+def synthesize_dataset(destination, totalRows, seed=0, heading=HEADING_FILE, samples=SAMPLE_FILES,
+                       narratives=NARRATIVE_FILES):
+    """
+    Writes a CSV file of synthetic complaints (see the description at the top of this file). The same arguments
+    always give the same file.
+    :param destination: path name of the file to write
+    :param totalRows: number of data rows to write
+    :param seed: seed of the random choices
+    :param heading: CSV file whose first row is written as the heading; columns are filled by name, so any column
+    order works
+    :param samples: CSV files the rows' values are drawn from
+    :param narratives: CSV files the narratives are drawn from, empty narratives included
+    :return: destination
+    """
+    with open(heading) as heading_file:
+        headingRow = next(csv.reader(heading_file, delimiter = ","))
+    columns = heading_columns(headingRow, heading)
+    slotOfColumn = {position: slot for slot, position in enumerate(columns) if position is not None}
+    order = [slotOfColumn.get(position) for position in range(len(headingRow))]
+
+    narrativeSlot = SLOT_NAMES.index("Consumer_complaint_narrative")
+    idSlot = SLOT_NAMES.index("Complaint_ID")
+    templates = _sample_rows(samples)
+    narrativePool = [row[narrativeSlot] for row in _sample_rows(narratives)]
+    rng = random.Random(seed)
+
+    with open(destination, "w", newline="") as out_file:
+        write_csv_file = csv.writer(out_file, delimiter = ",")
+        write_csv_file.writerow(headingRow)
+        written = 0
+        while written < totalRows:
+            size = min(SYNTHESIS_CHUNK, totalRows - written)
+            chunk = []
+            for template, narrative in zip(rng.choices(templates, k=size), rng.choices(narrativePool, k=size)):
+                written += 1
+                row = list(template)
+                row[narrativeSlot] = narrative
+                row[idSlot] = str(written)
+                chunk.append(["" if slot is None else row[slot] for slot in order])
+            write_csv_file.writerows(chunk)
+    return destination
+
+
+def synthetic_dataset(totalRows, seed=0, directory=SYNTHETIC_DIRECTORY):
+    """
+    Returns the path name of a synthesized file of totalRows complaints, writing it only if an earlier run hasn't
+    :param totalRows: number of data rows
+    :param seed: seed of the random choices (see synthesize_dataset)
+    :param directory: directory keeping the synthesized files (created if needed)
+    """
+    os.makedirs(directory, exist_ok=True)
+    filepath = os.path.join(directory, "synthetic-" + str(totalRows) + "-" + str(seed) + ".csv")
+    if not os.path.exists(filepath):
+        partial = filepath + ".partial"
+        synthesize_dataset(partial, totalRows, seed)
+        os.replace(partial, filepath)
+    return filepath
+
+
+"""
+Each benchmark step is a function taking the context of the dataset being measured and returning the function to
+time (called without arguments). The context holds 'filepath', 'rows', 'seed' and, under each step's name, what the
+step returned, so later steps use the dictionary, company map and state map built by earlier ones.
+"""
+
+def _step_read(context):
+    """read_complaint_data of the whole file"""
+    filepath = context["filepath"]
+    return lambda: read_complaint_data(filepath)
+
+
+def _step_company_map(context):
+    """make_company_map of the dictionary"""
+    complaints = context["read_complaint_data"]
+    return lambda: make_company_map(complaints)
+
+
+def _step_state_map(context):
+    """make_state_map of the dictionary"""
+    complaints = context["read_complaint_data"]
+    return lambda: make_state_map(complaints)
+
+
+def _step_statistics(context):
+    """compute_statistics of the dictionary"""
+    complaints = context["read_complaint_data"]
+    return lambda: compute_statistics(complaints)
+
+
+def _step_company_list(context):
+    """list_company_complaints of the 10 companies with the most complaints"""
+    companyMap = context["make_company_map"]
+    return lambda: list_company_complaints(companyMap, 10)
+
+
+def _step_state_query(context):
+    """query_state_complaints of the 5 states with the most complaints, 10 complaints each"""
+    stateMap = context["make_state_map"]
+    states = sorted(stateMap, key=lambda state: complaint_count(stateMap[state]), reverse=True)[:5]
+    return lambda: query_state_complaints(stateMap, states, 10)
+
+
+def _step_phrase(context):
+    """phrase_index of the dictionary followed by dataFromPhrase for each of BENCHMARK_PHRASES"""
+    complaints = context["read_complaint_data"]
+
+    def run():
+        index = phrase_index(complaints)
+        for phrase in BENCHMARK_PHRASES:
+            dataFromPhrase(phrase, complaints, index)
+    return run
+
+
+def _step_lookup(context):
+    """returnClassFromID for LOOKUPS complaint IDs of the dictionary, in random order, one in ten missing"""
+    complaints = context["read_complaint_data"]
+    rng = random.Random(context["seed"])
+    ids = list(complaints)
+    largest = max(ids) if ids else 0
+    wanted = [str(rng.choice(ids)) if ids and i % 10 else str(largest + 1 + i) for i in range(LOOKUPS)]
+
+    def run():
+        for complaintID in wanted:
+            display_complaints.returnClassFromID(complaints, complaintID)
+    return run
+
+
+"""Step name -> function preparing it, in the order the steps run"""
+BENCHMARKS = (
+    ("read_complaint_data", _step_read),
+    ("make_company_map", _step_company_map),
+    ("make_state_map", _step_state_map),
+    ("compute_statistics", _step_statistics),
+    ("list_company_complaints", _step_company_list),
+    ("query_state_complaints", _step_state_query),
+    ("dataFromPhrase", _step_phrase),
+    ("returnClassFromID", _step_lookup),
+)
+
+
+def measure(function, repeat=3):
+    """
+    Measures a function, with what it prints discarded.
+    :param function: function called without arguments
+    :param repeat: number of timed runs
+    :return: the fastest run's time in seconds, the peak memory allocated during one more run traced by tracemalloc
+    (in bytes, not counting memory allocated before the call), and the value the function returned
+    """
+    best = None
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(max(repeat, 1)):
+            gc.collect()
+            startTime = time.perf_counter()
+            result = function()
+            totalTime = time.perf_counter() - startTime
+            if best is None or totalTime < best:
+                best = totalTime
+            del result
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+
+def run_suite(sizes=DEFAULT_SIZES, repeat=3, seed=0, directory=SYNTHETIC_DIRECTORY):
+    """
+    Runs every step of BENCHMARKS on a synthesized dataset of each size.
+    :param sizes: numbers of complaints, e.g. (10000, 100000, 10000000)
+    :param repeat: number of timed runs of each step
+    :param seed: seed of the synthesized datasets
+    :param directory: directory keeping the synthesized files
+    :return: A dictionary (see save_results) whose "sizes" entry maps each size (as a string) to a dictionary mapping
+    each step name to {"seconds", "peak_bytes", "rows_per_second"}
+    printed output: one line per size and step
+    """
+    results = {
+        "version": RESULTS_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": importlib.util.find_spec("numpy") is not None,
+        "repeat": repeat,
+        "seed": seed,
+        "sizes": {},
+    }
+    for size in sizes:
+        filepath = synthetic_dataset(size, seed, directory)
+        print("\n" + filepath + " (" + '{:.1f}'.format(os.path.getsize(filepath) / 2 ** 20) + " MiB)")
+        context = {"filepath": filepath, "rows": size, "seed": seed}
+        steps = {}
+        for name, prepare in BENCHMARKS:
+            seconds, peak, context[name] = measure(prepare(context), repeat)
+            steps[name] = {"seconds": seconds, "peak_bytes": peak,
+                           "rows_per_second": size / seconds if seconds > 0 else None}
+            print("    " + name.ljust(26) + '{:.4f}'.format(seconds).rjust(10) + " s" +
+                  '{:.1f}'.format(peak / 2 ** 20).rjust(10) + " MiB peak")
+        results["sizes"][str(size)] = steps
+        del context
+    return results
+
+
+def save_results(results, filepath):
+    """writes results of run_suite to a JSON file"""
+    with open(filepath, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+
+def load_results(filepath):
+    """reads results of run_suite from a JSON file written by save_results"""
+    with open(filepath) as results_file:
+        results = json.load(results_file)
+    if results.get("version") != RESULTS_VERSION:
+        raise ValueError(filepath + " holds results of another format (version " + repr(results.get("version")) +
+                         ", expected " + str(RESULTS_VERSION) + ")")
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.25, memoryTolerance=0.10, minSeconds=0.005):
+    """
+    Compares results of run_suite with a baseline. Only the sizes and steps found in both are compared.
+    :param results: results of run_suite
+    :param baseline: earlier results, e.g. from load_results
+    :param tolerance: largest accepted increase in time, as a fraction (0.25: 25% slower)
+    :param memoryTolerance: largest accepted increase in peak memory, as a fraction
+    :param minSeconds: times below this in both runs are too short to compare and are never regressions
+    :return: list of regressions, each a dictionary with "size", "step", "measure" ("seconds" or "peak_bytes"),
+    "baseline", "current" and "ratio" (current / baseline)
+    """
+    regressions = []
+    for size, steps in results["sizes"].items():
+        baselineSteps = baseline["sizes"].get(size, {})
+        for step, values in steps.items():
+            if step not in baselineSteps:
+                continue
+            old = baselineSteps[step]
+            for measure, allowed in (("seconds", tolerance), ("peak_bytes", memoryTolerance)):
+                if measure == "seconds" and max(values[measure], old[measure]) < minSeconds:
+                    continue
+                if old[measure] > 0 and values[measure] > old[measure] * (1 + allowed):
+                    regressions.append({"size": size, "step": step, "measure": measure, "baseline": old[measure],
+                                        "current": values[measure], "ratio": values[measure] / old[measure]})
+    return regressions
+
+
+def print_comparison(results, baseline):
+    """
+    Prints, for each size and step found in both, the ratio of the current time and peak memory to the baseline's
+    :param results: results of run_suite
+    :param baseline: earlier results
+    """
+    for size, steps in results["sizes"].items():
+        baselineSteps = baseline["sizes"].get(size)
+        if baselineSteps is None:
+            continue
+        print("\n" + size + " complaints, compared with the baseline of " + baseline.get("created", "?") + ":")
+        for step, values in steps.items():
+            if step not in baselineSteps:
+                continue
+            old = baselineSteps[step]
+            ratios = []
+            for measure in ("seconds", "peak_bytes"):
+                ratios.append('{:.2f}'.format(values[measure] / old[measure]) + "x" if old[measure] > 0 else "-")
+            print("    " + step.ljust(26) + ("time " + ratios[0]).rjust(12) + ("memory " + ratios[1]).rjust(16))
+
+
+def main():
+    sizes = DEFAULT_SIZES
+    if len(sys.argv) > 1:
+        sizes = [int(size) for size in sys.argv[1].replace("_", "").split(",")]
+    resultsPath = sys.argv[2] if len(sys.argv) > 2 else "benchmark-results.json"
+    baselinePath = sys.argv[3] if len(sys.argv) > 3 else None
+
+    results = run_suite(sizes)
+    save_results(results, resultsPath)
+    print("\nResults written to " + resultsPath)
+    if baselinePath is None:
+        return
+    baseline = load_results(baselinePath)
+    print_comparison(results, baseline)
+    regressions = compare_results(results, baseline)
+    for regression in regressions:
+        print("REGRESSION: " + regression["size"] + " complaints, " + regression["step"] + " " +
+              regression["measure"] + " " + '{:.2f}'.format(regression["ratio"]) + "x the baseline")
+    if regressions:
+        sys.exit(1)
+    print("No regression against " + baselinePath)
+
+
+if __name__ == '__main__':
+    main()
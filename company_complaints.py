@@ -9,17 +9,31 @@ subdirectory labeled 'data'
 """
 
 from utilities import *
+from complaint_table import *
+from complaint_index import *
+from dataset_cache import *
+from mapped_reader import *
 from display_complaints import *
+from complaint_statistics import *
+import instrumentation
+import heapq
 
-def make_company_map(dataset):
+@instrumentation.instrumented(countRows=True)
+def make_company_map(dataset, index=None):
     """
     A dictionary mapping integer complaint ID values to unique Complaint objects.
     :param dataset: (returned from read_complaint_data in utilities.py) a dictionary whose keys are complaint IDs and
     values are the associated instance of the complaint class
+    :param index: optional ComplaintIndex of the dataset (from complaint_index) to build the map from instead of
+    scanning the dataset
 
     :return: A dictionary mapping each company name value to a dictionary mapping each product value to lists of
     Complaint objects related to the company and product.
     """
+    if index is not None:
+        return index.company_map(dataset)
+    if isinstance(dataset, ComplaintTable):
+        return dataset.group_rows("Company", "Product")
     companyDict = {}
     for key in dataset:
         """iterates through every single complaint"""
@@ -38,15 +52,22 @@ def make_company_map(dataset):
     return companyDict
 
 
-def make_company_map_for_stats(dataset):
+@instrumentation.instrumented(countRows=True)
+def make_company_map_for_stats(dataset, index=None):
     """Accidentally wrote make_company_map the wrong way and only realized after having written compute_statistics.
     Functions as a helper fucntion to compute_statistics
 
     :param dataset: (returned from read_complaint_data in utilities.py) a dictionary whose keys are complaint IDs and
     values are the associated instance of the complaint class
 
+    :param index: optional ComplaintIndex of the dataset, see make_company_map
+
     :return: A dictionary whose keys are states and values are lists of complaints from those states.
     """
+    if index is not None:
+        return index.company_map_for_stats(dataset)
+    if isinstance(dataset, ComplaintTable):
+        return dataset.group_rows("Company")
     companyDict_for_Stats = {}
     for key in dataset:
         if not dataset[key].Company in companyDict_for_Stats:
@@ -56,14 +77,21 @@ def make_company_map_for_stats(dataset):
     return companyDict_for_Stats
 
 
-def make_product_map(dataset):
+@instrumentation.instrumented(countRows=True)
+def make_product_map(dataset, index=None):
     """Similarly to 'make_company_map_for_stats', acts as helper function to compute_statistics.
 
     :param dataset: (returned from read_complaint_data in utilities.py) a dictionary whose keys are complaint IDs and
     values are the associated instance of the complaint class
 
+    :param index: optional ComplaintIndex of the dataset, see make_company_map
+
     :return: A dictionary whose keys are products and values are lists of complaints from those products.
     """
+    if index is not None:
+        return index.product_map(dataset)
+    if isinstance(dataset, ComplaintTable):
+        return dataset.group_rows("Product")
     productDict = {}
     for key in dataset:
         if not dataset[key].Product in productDict:
@@ -73,65 +101,86 @@ def make_product_map(dataset):
     return productDict
 
 
-def compute_statistics(dataset):
+@instrumentation.instrumented(countRows=True)
+def make_complaint_counts(complaints):
+    """
+    Streaming reducer counting complaints by company and product in a single pass. Only the counts are kept, so
+    memory grows with the number of distinct companies and products rather than with the number of complaints.
+
+    :param complaints: any iterable of Complaint objects, e.g. iter_complaints in utilities.py or the values of the
+    dictionary returned from read_complaint_data
+
+    :return: companyCounts, a dictionary mapping each company name to a dictionary mapping each product to its number
+    of complaints (the same shape as make_company_map, with counts in place of lists), and productCounts, a
+    dictionary mapping each product to its number of complaints.
+    """
+    companyCounts = {}
+    productCounts = {}
+    for complaint in complaints:
+        products = companyCounts.get(complaint.Company)
+        if products is None:
+            products = companyCounts[complaint.Company] = {}
+        products[complaint.Product] = products.get(complaint.Product, 0) + 1
+        productCounts[complaint.Product] = productCounts.get(complaint.Product, 0) + 1
+    return companyCounts, productCounts
+
+
+@instrumentation.instrumented(countRows=True)
+def compute_statistics(dataset, index=None):
     """
 
     :param dataset:(returned from read_complaint_data in utilities.py) a dictionary whose keys are complaint IDs and
-    values are the associated instance of the complaint class
+    values are the associated instance of the complaint class. A ComplaintTable, a MappedComplaintFile, any iterable
+    of complaints (such as iter_complaints) or the path name of a CSV file works too; only the complaints per company
+    and per product are counted, in a single pass (see count_by_fields in complaint_statistics.py).
+    :param index: optional ComplaintIndex of the dataset; if given, the dataset is not read at all
     :return: Not applicable
-    :printed output: Print a report of basic statistics on the dataset.
+    :printed output: Print a report of basic statistics on the dataset. See print_detailed_statistics in
+    complaint_statistics.py for percentiles, rates and per state / per product breakdowns.
     """
-    companyMap = make_company_map_for_stats(dataset)
-    productMap = make_product_map(dataset)
-
-    worstCompany = [0, None]
-    totalComplaints = 0
-    totalCompanies = 0
+    if index is not None:
+        companyCounts = index.company_product_counts()
+        productCounts = index.product_counts()
+    else:
+        counts = count_by_fields(dataset, ("Company", "Product"))
+        companyCounts = counts["Company"]
+        productCounts = counts["Product"]
+    print_statistics(companyCounts, productCounts)
 
-    totalProducts = 0
-    worstProduct = [0, None]
 
+def print_statistics(companyCounts, productCounts):
+    """
+    Prints the report of compute_statistics from complaint counts
+    :param companyCounts: (returned from make_complaint_counts or count_by) a dictionary mapping each company name to
+    a dictionary mapping each product to its number of complaints, or directly to its number of complaints
+    :param productCounts: (returned from make_complaint_counts) a dictionary mapping each product to its number of
+    complaints
+    :return: Not applicable
+    :printed output: Print a report of basic statistics on the dataset.
+    """
+    companyNames = list(companyCounts)
+    """complaints per company, in the same order as companyNames"""
     medianlist = []
+    for key in companyNames:
+        if isinstance(companyCounts[key], dict):
+            medianlist.append(sum(companyCounts[key].values()))
+        else:
+            medianlist.append(companyCounts[key])
+    productNames = list(productCounts)
+    productTotals = [productCounts[key] for key in productNames]
 
-    for key in companyMap:
-        """
-        populates:
-        totalCompany list
-        worstCompany list
-        medianlist
-        """
-        totalCompanies += 1
-        totalComplaintsPerCo = 0
-
-        for complaint in companyMap[key]:
-            totalComplaintsPerCo += 1
-
-        medianlist.append(totalComplaintsPerCo)
-        totalComplaints += totalComplaintsPerCo
-
-        if totalComplaintsPerCo > worstCompany[0]:
-            worstCompany[0] = totalComplaintsPerCo
-            worstCompany[1] = key
-
-    for key in productMap:
-        """
-        Populates:
-        totalProducts
-        worstProduct
-        """
-        totalComplaintsPerProd = 0
-        totalProducts += 1
-
-        for complaint in productMap[key]:
-            totalComplaintsPerProd += 1
-
-        if totalComplaintsPerProd > worstProduct[0]:
-            worstProduct[0] = totalComplaintsPerProd
-            worstProduct[1] = key
+    totalCompanies = len(companyNames)
+    totalProducts = len(productNames)
+    totalComplaints = sum(medianlist)
+
+    """top_k lists the first of several equal maxima first"""
+    worst = top_k(medianlist, 1)[0]
+    worstCompany = [medianlist[worst], companyNames[worst]]
+    worst = top_k(productTotals, 1)[0]
+    worstProduct = [productTotals[worst], productNames[worst]]
 
     averageComplaintPerCo = totalComplaints/totalCompanies
-    medianlist = sorted(medianlist)
-    medianComplaints = medianlist[len(medianlist)//2]
+    medianComplaints = percentiles(medianlist, (50,))[50]
     print(len(medianlist))
     worstCoPercent = '{:.3%}'.format(worstCompany[0]/totalComplaints)
     worstProdPercent = '{:.3%}'.format(worstProduct[0]/totalComplaints)
@@ -146,7 +195,7 @@ def compute_statistics(dataset):
 
 def getTotalComplaintsPerCo(companyDict, companyName):
     """Helper function to return number of complaints in regard to a company
-    :param companyDict:
+    :param companyDict: (use make_company_map or make_complaint_counts function)
     :param companyName: company name as a string
     :return: (use make_company_map function) A dictionary mapping each company name value to a dictionary mapping each product value to lists of
     Complaint objects related to the company and product.
@@ -154,52 +203,70 @@ def getTotalComplaintsPerCo(companyDict, companyName):
     complaints = companyDict[companyName]
     totalComplaints = 0
     for key in complaints.keys():
-        totalComplaints += len(complaints[key])
+        totalComplaints += complaint_count(complaints[key])
     return totalComplaints
 
 
+def top_companies(companymap, count=3):
+    """
+    Finds the companies with the most complaints, keeping only 'count' candidates on a heap rather than sorting
+    every company.
+    :param companymap: a ComplaintIndex (whose running company totals are used as they are), or a dictionary mapping
+    company name values to a dictionary mapping product values to lists of Complaint objects or to complaint counts
+    (make_company_map, make_complaint_counts, ComplaintIndex.company_product_counts)
+    :param count: number of companies to return; if there are fewer companies, all of them are returned
+    :return: list of (company name, number of complaints, dictionary mapping each product to its number of
+    complaints) tuples, most complaints first. Companies with the same number of complaints keep their order in
+    companymap.
+    """
+    if isinstance(companymap, ComplaintIndex):
+        companymap.compact()
+        totals = companymap.companyCounts.items()
+        products = companymap.companyProducts
+    else:
+        totals = ((key, getTotalComplaintsPerCo(companymap, key)) for key in companymap)
+        products = companymap
+    """nlargest keeps equal totals in input order, as a stable sort would"""
+    worst = heapq.nlargest(max(count, 0), totals, key=lambda item: item[1])
+    return [(company, total, {product: complaint_count(entry) for product, entry in products[company].items()})
+            for company, total in worst]
+
+
+@instrumentation.instrumented()
 def list_company_complaints(companymap, count=3):
     """
 
     :param companymap: A dictionary mapping company name values to a dictionary mapping product values to lists of
-    Complaint objects related to the company and product. topnumber
-    :param count: Number of complaints you would like to print per company (default is 3)
-    :return: Not Applicable
+    Complaint objects related to the company and product. topnumber (the product values may also be complaint counts,
+    as returned from make_complaint_counts, and companymap may be a ComplaintIndex)
+    :param count: Number of companies you would like to print (default is 3). May be a string, as typed by the user;
+    an empty string means the default.
+    :return: list of the companies printed, see top_companies
     :printedOutput: The output has a heading ”Top < N > Companies” where the < N > is the number printed. The rest of
     the list prints summary information for the companies starting with the company with the largest number of
     complaints and proceeding to the next largest number, and so on.
     """
-    print("\nTop " + str(count) + " Companies and their Complaints: ")
-
-    list = []
-    for key in companymap:
-        """populates list of company names to be sorted"""
-        val = (getTotalComplaintsPerCo(companymap, key))
-        list.append([key, val])
-
-#   newList = list.sort(key=lambda x: x[1])
-    sorted_list = sorted(list, key=lambda x: x[1], reverse = True)
-    """Sorts list by number of complaints per company"""
+    if isinstance(count, str):
+        count = int(count) if count.strip() != "" else 3
+    worst = top_companies(companymap, count)
+    print("\nTop " + str(len(worst)) + " Companies and their Complaints: ")
 
-    for i in range(int(count)):
+    for company, total, products in worst:
         """Handles printing"""
-        print(sorted_list[i][0] + " : " + str(sorted_list[i][1]) + " complaints.")
-        newKey = str(sorted_list[i][0])
-        j = companymap[newKey]
-        keys = j.keys()
-        # print(keys)
-        for l in keys:
-            newk = str(l)
-            print('\t\t\t' + str(len(j[newk])) + ' ' + newk + ' complaints.')
+        print(company + " : " + str(total) + " complaints.")
+        for product in products:
+            print('\t\t\t' + str(products[product]) + ' ' + str(product) + ' complaints.')
 
         print('')
+    return worst
 
 def main():
-    complaints = read_complaint_data(getFilePath())
-    compute_statistics(complaints)
-    companyMap = make_company_map(complaints)
+    complaints = open_report_dataset(getFilePath())
+    index = complaint_index(complaints)
+    compute_statistics(complaints, index)
+    print_detailed_statistics(complaints)
     summaryCount = str(input("\nEnter number to change length of the summary(default=3) "))
-    list_company_complaints(companyMap, summaryCount)
+    list_company_complaints(index, summaryCount)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,278 @@
+"""
+Name: complaint_dates.py
+Author: Ari Bernstein
+Description: Time-series analysis of the Date_received and Date_sent_to_company slots.
+-DateIndex parses a date slot once per distinct value into integer day ordinals (datetime.date.toordinal), keeps
+ one ordinal per row, and keeps the rows sorted by date for date-range queries
+-complaints_between returns the complaints received (or sent) between two dates
+-time_series counts complaints per day, week, month or year, optionally per company, state, product or any other
+ slot
+-response_lag gives percentiles of the number of days between a complaint being received and being sent to the
+ company, overall or per company
+Counting is done on the dictionary-encoded columns (see complaint_statistics.py): the rows sharing a date (and
+company, state, ...) are counted first, then each distinct date is put in its period, so no date string is parsed
+per row.
+Pre-condition: utilities.py, complaint_table.py, complaint_index.py, complaint_statistics.py and dataset_cache.py work
+correctly and are in same directory, csv files are in subdirectory labeled 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from complaint_index import *
+from complaint_statistics import *
+from dataset_cache import *
+from array import array
+from bisect import bisect_left, bisect_right
+import datetime
+
+DATE_SLOTS = ("Date_received", "Date_sent_to_company")
+PERIODS = ("day", "week", "month", "year")
+
+"""Ordinal of an empty or unreadable date; real ordinals start at 1 (January 1st of year 1)"""
+NO_DATE = 0
+
+
+def parse_date(text):
+    """
+    Converts a date as written in complaint files to a day ordinal
+    :param text: "MM/DD/YYYY" (as in the sample files) or "YYYY-MM-DD" (as in newer CFPB exports)
+    :return: datetime.date(...).toordinal() of the date, or NO_DATE if text is empty or not a valid date
+    """
+    try:
+        if "/" in text:
+            month, day, year = text.split("/")
+        else:
+            year, month, day = text.split("-")
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return NO_DATE
+
+
+def to_ordinal(day):
+    """helper function accepting a datetime.date, a date string (see parse_date) or a day ordinal"""
+    if isinstance(day, datetime.date):
+        return day.toordinal()
+    if isinstance(day, str):
+        ordinal = parse_date(day)
+        if ordinal == NO_DATE:
+            raise ValueError("not a date: " + repr(day))
+        return ordinal
+    return day
+
+
+def period_start(ordinal, period):
+    """
+    returns the day ordinal of the first day of the period holding a day: the day itself, the Monday of its week,
+    the first of its month or of its year
+    """
+    if period == "day":
+        return ordinal
+    if period == "week":
+        """ordinal 1 is a Monday"""
+        return ordinal - (ordinal - 1) % 7
+    day = datetime.date.fromordinal(ordinal)
+    if period == "month":
+        return day.replace(day=1).toordinal()
+    if period == "year":
+        return day.replace(month=1, day=1).toordinal()
+    raise ValueError("period must be one of " + ", ".join(PERIODS) + ", not " + repr(period))
+
+
+class DateIndex:
+    """
+    Parsed dates of one slot of a dataset. 'codeOrdinals' holds the day ordinal of each distinct value of the slot's
+    dictionary-encoded column, so every distinct date string is parsed once; 'ordinals' holds the day ordinal of
+    each row. 'order' lists the rows with a date sorted by date (rows with the same date in row order), and
+    'sortedOrdinals' their dates, for binary searches.
+    """
+
+    def __init__(self, column):
+        self.codeOrdinals = array("i", map(parse_date, column.values))
+        self.ordinals = array("i", map(self.codeOrdinals.__getitem__, column.codes))
+        ordinals = self.ordinals
+        """sort the distinct dates, then list the rows of each date: linear in the number of rows"""
+        rowsOfCode = [array("I") for value in column.values]
+        for row, code in enumerate(column.codes):
+            rowsOfCode[code].append(row)
+        self.order = array("I")
+        for code in sorted(range(len(column.values)), key=self.codeOrdinals.__getitem__):
+            if self.codeOrdinals[code] != NO_DATE:
+                self.order.extend(rowsOfCode[code])
+        self.sortedOrdinals = array("i", map(ordinals.__getitem__, self.order))
+
+    def __len__(self):
+        """number of rows with a date"""
+        return len(self.order)
+
+    def first(self):
+        """returns the earliest date (datetime.date), or None if no row has a date"""
+        if len(self.order) == 0:
+            return None
+        return datetime.date.fromordinal(self.sortedOrdinals[0])
+
+    def last(self):
+        """returns the latest date (datetime.date), or None if no row has a date"""
+        if len(self.order) == 0:
+            return None
+        return datetime.date.fromordinal(self.sortedOrdinals[-1])
+
+    def rows_between(self, start=None, end=None):
+        """
+        Finds the rows dated between two days, both included, with two binary searches.
+        :param start: first day (datetime.date, date string or day ordinal), or None for no lower bound
+        :param end: last day, or None for no upper bound
+        :return: array of row numbers, sorted by date
+        """
+        low = 0 if start is None else bisect_left(self.sortedOrdinals, to_ordinal(start))
+        high = len(self.order) if end is None else bisect_right(self.sortedOrdinals, to_ordinal(end))
+        return self.order[low:high]
+
+
+def date_index(dataset, slot="Date_received"):
+    """
+    Returns the DateIndex of a date slot of a dataset, kept in the cache of a ComplaintTable so it is only built once.
+    Row numbers follow the dataset's order (e.g. the key order of a dictionary from read_complaint_data).
+    :param dataset: dictionary of complaints from read_complaint_data or a ComplaintTable
+    :param slot: "Date_received" or "Date_sent_to_company"
+    """
+    cache = getattr(dataset, "cache", None)
+    key = "dates:" + slot
+    if cache is not None and key in cache:
+        return cache[key]
+    index = DateIndex(encode_columns(dataset, (slot,))[slot])
+    if cache is not None:
+        cache[key] = index
+    return index
+
+
+def complaints_between(dataset, start=None, end=None, slot="Date_received"):
+    """
+    Finds the complaints dated between two days, both included.
+    :param dataset: dictionary of complaints from read_complaint_data or a ComplaintTable
+    :param start: first day (datetime.date, "MM/DD/YYYY" / "YYYY-MM-DD" string or day ordinal), or None
+    :param end: last day, or None
+    :param slot: "Date_received" or "Date_sent_to_company"
+    :return: lazy list of the complaints, sorted by date
+    """
+    rows = date_index(dataset, slot).rows_between(start, end)
+    if isinstance(dataset, ComplaintTable):
+        return dataset.rows(rows)
+    ids = list(dataset)
+    return ComplaintsByID(dataset, array("q", [ids[row] for row in rows]))
+
+
+def _in_range(ordinal, start, end):
+    """helper function testing whether a day ordinal is a date between start and end (either may be None)"""
+    return ordinal != NO_DATE and (start is None or ordinal >= start) and (end is None or ordinal <= end)
+
+
+def time_series(dataset, period="month", by=None, slot="Date_received", start=None, end=None):
+    """
+    Counts complaints per period.
+    :param dataset: dictionary of complaints from read_complaint_data, a ComplaintTable, a MappedComplaintFile or any
+    iterable of complaints
+    :param period: "day", "week" (starting on Monday), "month" or "year"
+    :param by: optional slot to break the counts down by, e.g. "Company", "State" or "Product"
+    :param slot: "Date_received" or "Date_sent_to_company"
+    :param start: optional first day counted (datetime.date, date string or day ordinal)
+    :param end: optional last day counted
+    :return: A dictionary mapping the first day (datetime.date) of each period holding complaints to their number,
+    in date order. With 'by', a dictionary mapping each value of that slot to such a dictionary, values in the order
+    they first occur. Complaints without a valid date are not counted.
+    """
+    period_start(1, period)
+    start = None if start is None else to_ordinal(start)
+    end = None if end is None else to_ordinal(end)
+    names = (slot,) if by is None else (by, slot)
+    columns = encode_columns(dataset, names)
+    dates = columns[slot]
+    """each distinct date is parsed and put in its period once"""
+    periodOfCode = []
+    for value in dates.values:
+        ordinal = parse_date(value)
+        periodOfCode.append(period_start(ordinal, period) if _in_range(ordinal, start, end) else None)
+
+    if by is None:
+        counts = {}
+        for code, count in enumerate(count_codes(dates.codes, len(dates.values))):
+            periodOrdinal = periodOfCode[code]
+            if count > 0 and periodOrdinal is not None:
+                counts[periodOrdinal] = counts.get(periodOrdinal, 0) + count
+        return {datetime.date.fromordinal(ordinal): counts[ordinal] for ordinal in sorted(counts)}
+
+    groups = columns[by]
+    counts = {}
+    for (groupCode, code), count in count_code_tuples([groups, dates]).items():
+        periodOrdinal = periodOfCode[code]
+        if periodOrdinal is not None:
+            level = counts.setdefault(groupCode, {})
+            level[periodOrdinal] = level.get(periodOrdinal, 0) + count
+    return {groups.values[groupCode]: {datetime.date.fromordinal(ordinal): counts[groupCode][ordinal]
+                                       for ordinal in sorted(counts[groupCode])}
+            for groupCode in sorted(counts)}
+
+
+def response_lag(dataset, by=None, points=(50,), start=None, end=None):
+    """
+    Percentiles of the number of days from a complaint being received (Date_received) to being sent to the company
+    (Date_sent_to_company).
+    :param dataset: see time_series
+    :param by: optional slot to break the lags down by, e.g. "Company"
+    :param points: percentiles to compute (default: only the median, 50)
+    :param start: optional first day of Date_received counted
+    :param end: optional last day of Date_received counted
+    :return: A dictionary mapping each point to its number of days, or, with 'by', a dictionary mapping each value
+    of that slot to such a dictionary. Complaints missing either date are left out, as are values of 'by' with no
+    complaint left.
+    """
+    start = None if start is None else to_ordinal(start)
+    end = None if end is None else to_ordinal(end)
+    names = DATE_SLOTS if by is None else (by,) + DATE_SLOTS
+    columns = encode_columns(dataset, names)
+    received = [parse_date(value) for value in columns["Date_received"].values]
+    sent = [parse_date(value) for value in columns["Date_sent_to_company"].values]
+
+    """lag counts per group, from the number of rows sharing each (group,) received date and sent date"""
+    lags = {}
+    for codes, count in count_code_tuples([columns[name] for name in names]).items():
+        receivedOrdinal = received[codes[-2]]
+        sentOrdinal = sent[codes[-1]]
+        if sentOrdinal != NO_DATE and _in_range(receivedOrdinal, start, end):
+            group = lags.setdefault(codes[0] if by is not None else None, {})
+            lag = sentOrdinal - receivedOrdinal
+            group[lag] = group.get(lag, 0) + count
+    if by is None:
+        if None not in lags:
+            return {}
+        return percentiles_of_counts(lags[None], points)
+    values = columns[by].values
+    return {values[code]: percentiles_of_counts(lags[code], points) for code in sorted(lags)}
+
+
+def print_time_series(series, title="Complaints"):
+    """
+    Prints the result of time_series (without 'by') as one line per period with a bar of # characters
+    :param series: dictionary mapping datetime.date to a number of complaints
+    :param title: heading printed above the lines
+    """
+    print("\n" + title + ":")
+    if not series:
+        print("    none")
+        return
+    largest = max(series.values())
+    for day, count in series.items():
+        print("    " + day.isoformat() + str(count).rjust(8) + "  " + "#" * max(1, round(40 * count / largest)))
+
+
+def main():
+    complaints = cached_read_complaint_table(getFilePath())
+    index = date_index(complaints)
+    print("\nReceived from " + str(index.first()) + " to " + str(index.last()))
+    print_time_series(time_series(complaints, "month"), "Complaints per month")
+    lag = response_lag(complaints, points=(50, 90))
+    if lag:
+        print("\nDays from receipt to company: median " + str(lag[50]) + ", 90th percentile " + str(lag[90]))
+
+
+if __name__ == '__main__':
+    main()
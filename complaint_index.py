@@ -0,0 +1,203 @@
+"""
+Name: complaint_index.py
+Author: Ari Bernstein
+Description: Builds, in a single pass over a dataset, every grouping the reports need:
+-company -> product -> complaint IDs (make_company_map)
+-company -> number of complaints (compute_statistics, list_company_complaints)
+-product -> complaint IDs (make_product_map)
+-state -> complaint IDs (make_state_map)
+so that opening a file and running every report scans the complaints once instead of once per map.
+Pre-condition: utilities.py, complaint_table.py and mapped_reader.py work correctly and are in same directory
+"""
+
+from utilities import *
+from complaint_table import *
+from mapped_reader import *
+from array import array
+from collections.abc import Sequence
+
+
+class ComplaintsByID(Sequence):
+    """
+    Lazy list of the complaints with the given IDs in a dataset. Its length is known without touching the dataset;
+    complaints are looked up (or, for a ComplaintTable, built) only when indexed or iterated.
+    """
+    __slots__ = ("dataset", "ids")
+
+    def __init__(self, dataset, ids):
+        self.dataset = dataset
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ComplaintsByID(self.dataset, self.ids[index])
+        return self.dataset[self.ids[index]]
+
+    def __iter__(self):
+        dataset = self.dataset
+        for complaintID in self.ids:
+            yield dataset[complaintID]
+
+    def __repr__(self):
+        return "ComplaintsByID( " + str(len(self)) + " complaints )"
+
+
+class ComplaintIndex:
+    """
+    Complaint IDs grouped by company and product, by product and by state, plus the number of complaints per
+    company. Every dictionary keeps its keys in the order they first occur in the dataset, so the maps built from
+    the index list companies, products and states in the same order as the original map builders did.
+
+    Removing a complaint is only recorded (see PendingRemovals), so it costs the same however large its groups are;
+    the groups are compacted by compact, which every method reading them calls first. A complaint removed and then
+    added back to a group before compacting keeps its old place there; otherwise an added complaint is listed last
+    in its groups.
+    """
+
+    def __init__(self):
+        self.companyProducts = {}
+        self.companyCounts = {}
+        self.products = {}
+        self.states = {}
+        self.pending = PendingRemovals()
+
+    def add(self, complaintID, company, product, state):
+        """adds one complaint to every grouping"""
+        pending = self.pending
+        products = self.companyProducts.get(company)
+        if products is None:
+            products = self.companyProducts[company] = {}
+            self.companyCounts[company] = 0
+        if product not in products:
+            products[product] = array("q")
+        if not (pending.groups and pending.restore(products[product], complaintID)):
+            products[product].append(complaintID)
+        self.companyCounts[company] += 1
+
+        if product not in self.products:
+            self.products[product] = array("q")
+        if not (pending.groups and pending.restore(self.products[product], complaintID)):
+            self.products[product].append(complaintID)
+
+        if state not in self.states:
+            self.states[state] = array("q")
+        if not (pending.groups and pending.restore(self.states[state], complaintID)):
+            self.states[state].append(complaintID)
+
+    def remove(self, complaintID, company, product, state):
+        """removes one complaint from every grouping, dropping groups left empty"""
+        pending = self.pending
+        products = self.companyProducts[company]
+        if pending.remove(products[product], complaintID) == 0:
+            pending.drop(products[product])
+            del products[product]
+        self.companyCounts[company] -= 1
+        if self.companyCounts[company] == 0:
+            del self.companyProducts[company]
+            del self.companyCounts[company]
+
+        if pending.remove(self.products[product], complaintID) == 0:
+            pending.drop(self.products[product])
+            del self.products[product]
+
+        if pending.remove(self.states[state], complaintID) == 0:
+            pending.drop(self.states[state])
+            del self.states[state]
+
+    def compact(self):
+        """takes the complaints removed since the last call out of their groups (see PendingRemovals)"""
+        self.pending.compact()
+
+    def company_product_counts(self):
+        """returns a dictionary mapping each company to a dictionary mapping each product to its number of complaints"""
+        self.compact()
+        return {company: {product: len(ids) for product, ids in products.items()}
+                for company, products in self.companyProducts.items()}
+
+    def product_counts(self):
+        """returns a dictionary mapping each product to its number of complaints"""
+        self.compact()
+        return {product: len(ids) for product, ids in self.products.items()}
+
+    def state_counts(self):
+        """returns a dictionary mapping each state to its number of complaints"""
+        self.compact()
+        return {state: len(ids) for state, ids in self.states.items()}
+
+    def company_map(self, dataset):
+        """returns make_company_map's result for dataset, with lazy lists of complaints"""
+        self.compact()
+        return {company: {product: ComplaintsByID(dataset, ids) for product, ids in products.items()}
+                for company, products in self.companyProducts.items()}
+
+    def company_map_for_stats(self, dataset):
+        """
+        returns make_company_map_for_stats's result for dataset, with lazy lists of complaints. Each company's
+        complaints are listed product by product rather than in dataset order.
+        """
+        self.compact()
+        companyDict = {}
+        for company, products in self.companyProducts.items():
+            ids = array("q")
+            for productIDs in products.values():
+                ids.extend(productIDs)
+            companyDict[company] = ComplaintsByID(dataset, ids)
+        return companyDict
+
+    def product_map(self, dataset):
+        """returns make_product_map's result for dataset, with lazy lists of complaints"""
+        self.compact()
+        return {product: ComplaintsByID(dataset, ids) for product, ids in self.products.items()}
+
+    def state_map(self, dataset):
+        """returns make_state_map's result for dataset, with lazy lists of complaints"""
+        self.compact()
+        return {state: ComplaintsByID(dataset, ids) for state, ids in self.states.items()}
+
+
+def build_complaint_index(dataset):
+    """
+    Builds a ComplaintIndex with one pass over a dataset.
+
+    :param dataset: (returned from read_complaint_data in utilities.py) a dictionary whose keys are complaint IDs and
+    values are the associated instance of the complaint class, a ComplaintTable or a MappedComplaintFile
+
+    :return: A ComplaintIndex of the dataset
+    """
+    index = ComplaintIndex()
+    add = index.add
+    if isinstance(dataset, ComplaintTable):
+        """read the three columns directly instead of building each Complaint"""
+        for complaintID, company, product, state in zip(dataset.ids, dataset.column("Company"),
+                                                        dataset.column("Product"), dataset.column("State")):
+            add(complaintID, company, product, state)
+    elif isinstance(dataset, MappedComplaintFile):
+        """decode only these three columns; iterating the file gives the IDs in the order of its columns"""
+        for complaintID, company, product, state in zip(dataset, dataset.column("Company"), dataset.column("Product"),
+                                                        dataset.column("State")):
+            add(complaintID, company, product, state)
+    else:
+        for complaintID in dataset:
+            complaint = dataset[complaintID]
+            add(complaintID, complaint.Company, complaint.Product, complaint.State)
+    return index
+
+
+def complaint_index(dataset):
+    """
+    Returns the ComplaintIndex of a dataset. The index of a ComplaintTable is built once and kept in the table's
+    cache until the table changes; for a dictionary, a new index is built on every call, so callers running several
+    reports should build it once and pass it along.
+
+    :param dataset: a dictionary from read_complaint_data or a ComplaintTable
+    :return: A ComplaintIndex of the dataset
+    """
+    if isinstance(dataset, ComplaintTable):
+        index = dataset.cache.get("index")
+        if index is None:
+            index = dataset.cache["index"] = build_complaint_index(dataset)
+        return index
+    return build_complaint_index(dataset)
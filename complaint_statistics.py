@@ -0,0 +1,490 @@
+"""
+Name: complaint_statistics.py
+Author: Ari Bernstein
+Description: Statistics over dictionary-encoded complaint columns.
+-count_codes / count_codes_matching count the rows holding each code of a CategoricalColumn
+-count_code_tuples counts the rows sharing each combination of codes of several columns
+-percentiles / percentiles_of_counts / top_k work on lists of counts
+-encode_columns gives the dictionary-encoded columns of any dataset
+-count_by / count_by_fields count the complaints per value of a slot, streaming a CSV file without keeping its rows
+-ComplaintStatistics computes, in one pass over a dataset's Company, Product, State, Timely_response and
+ Consumer_disputed columns, the number of complaints per value, percentiles of complaints per company, and per state
+ and per product breakdowns with timely-response and dispute rates
+-print_detailed_statistics prints those figures
+NumPy is used when it is installed (bincount, partition, argpartition); otherwise every function falls back to pure
+Python and returns the same results. compare_engines checks that both give the same results on the sample files:
+python complaint_statistics.py [csv files]
+Pre-condition: utilities.py, complaint_table.py and mapped_reader.py work correctly and are in same directory
+"""
+
+from utilities import *
+from complaint_table import *
+from mapped_reader import *
+import instrumentation
+from collections import Counter
+import heapq
+import operator
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""Slots ComplaintStatistics reads; every other slot is ignored"""
+STATISTICS_SLOTS = ("Company", "Product", "State", "Timely_response", "Consumer_disputed")
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+
+def _as_numpy(codes):
+    """helper function viewing an array of codes (e.g. CategoricalColumn.codes) as a NumPy array without copying"""
+    if isinstance(codes, array):
+        return numpy.frombuffer(codes, dtype="u" + str(codes.itemsize))
+    return numpy.asarray(codes)
+
+
+def count_codes(codes, size):
+    """
+    Counts the rows holding each code of a dictionary-encoded column.
+    :param codes: the column's codes, one per row (e.g. CategoricalColumn.codes)
+    :param size: number of distinct codes (e.g. len(CategoricalColumn.values))
+    :return: list of 'size' integers, the number of rows holding each code
+    """
+    if numpy is not None:
+        return numpy.bincount(_as_numpy(codes), minlength=size).tolist()
+    counts = [0] * size
+    for code, count in Counter(codes).items():
+        counts[code] = count
+    return counts
+
+
+def count_codes_matching(codes, size, otherCodes, otherCode):
+    """
+    Counts, for each code of one column, the rows whose value in another column has a given code, e.g. the
+    complaints of each state that got a timely response.
+    :param codes: codes of the column to count by, one per row
+    :param size: number of distinct codes in that column
+    :param otherCodes: codes of the other column, one per row
+    :param otherCode: code of the value to match in the other column, or None if no row holds it
+    :return: list of 'size' integers
+    """
+    if otherCode is None:
+        return [0] * size
+    if numpy is not None:
+        matches = _as_numpy(otherCodes) == otherCode
+        return numpy.bincount(_as_numpy(codes)[matches], minlength=size).tolist()
+    counts = [0] * size
+    for code, count in Counter(code for code, other in zip(codes, otherCodes) if other == otherCode).items():
+        counts[code] = count
+    return counts
+
+
+def count_code_tuples(columns):
+    """
+    Counts the rows sharing each combination of codes of several dictionary-encoded columns.
+    :param columns: list of CategoricalColumn (or anything with 'codes' and 'values'), all with one code per row
+    :return: A dictionary mapping each combination held by at least one row (a tuple, one code per column) to its
+    number of rows
+    """
+    if numpy is None:
+        return Counter(zip(*[column.codes for column in columns]))
+    """one integer key per row: the codes as digits of a mixed-radix number"""
+    sizes = [max(len(column.values), 1) for column in columns]
+    keys = numpy.zeros(len(columns[0].codes), dtype=numpy.int64)
+    for column, size in zip(columns, sizes):
+        keys = keys * size + _as_numpy(column.codes)
+    combinations, counts = numpy.unique(keys, return_counts=True)
+    result = {}
+    for key, count in zip(combinations.tolist(), counts.tolist()):
+        codes = []
+        for size in reversed(sizes):
+            codes.append(key % size)
+            key //= size
+        result[tuple(reversed(codes))] = count
+    return result
+
+
+def percentiles(values, points=DEFAULT_PERCENTILES):
+    """
+    Nearest-rank percentiles of a list of numbers: percentile p is the value at position min(n - 1, n * p // 100) of
+    the sorted list, so the 50th percentile is the same median compute_statistics has always reported.
+    :param values: list of numbers (at least one)
+    :param points: percentiles to compute, between 0 and 100
+    :return: A dictionary mapping each point to its value
+    """
+    n = len(values)
+    positions = [min(n - 1, n * point // 100) for point in points]
+    if numpy is not None:
+        """a partial sort is enough to put each requested position in place"""
+        ordered = numpy.partition(numpy.asarray(values), sorted(set(positions)))
+    else:
+        ordered = sorted(values)
+    return {point: int(ordered[position]) for point, position in zip(points, positions)}
+
+
+def percentiles_of_counts(valueCounts, points=DEFAULT_PERCENTILES):
+    """
+    Same as percentiles, for numbers given with the number of times each occurs (e.g. response lags in days), so the
+    full list never has to be built.
+    :param valueCounts: dictionary mapping each number to how many times it occurs (at least one number)
+    :param points: percentiles to compute, between 0 and 100
+    :return: A dictionary mapping each point to its value
+    """
+    n = sum(valueCounts.values())
+    wanted = sorted((min(n - 1, n * point // 100), point) for point in points)
+    result = {}
+    seen = 0
+    for value in sorted(valueCounts):
+        seen += valueCounts[value]
+        while wanted and wanted[0][0] < seen:
+            result[wanted.pop(0)[1]] = value
+    return {point: result[point] for point in points}
+
+
+def top_k(values, k):
+    """
+    Positions of the k largest values of a list, largest first; equal values are listed in position order, so the
+    first of several equal maxima comes first, as in compute_statistics.
+    :param values: list of numbers
+    :param k: number of positions to return
+    :return: list of at most k positions
+    """
+    if k <= 0 or len(values) == 0:
+        return []
+    if numpy is None:
+        return heapq.nlargest(k, range(len(values)), key=lambda position: (values[position], -position))
+    values = numpy.asarray(values)
+    if k < len(values):
+        """every value tied with the k-th largest is a candidate, so ties are broken by position below"""
+        threshold = numpy.partition(values, len(values) - k)[len(values) - k]
+        candidates = numpy.flatnonzero(values >= threshold)
+    else:
+        candidates = numpy.arange(len(values))
+    order = numpy.lexsort((candidates, -values[candidates]))
+    return candidates[order][:k].tolist()
+
+
+def encode_columns(dataset, names):
+    """
+    Dictionary-encodes some slots of a dataset.
+    :param dataset: a ComplaintTable (whose own columns are returned), a MappedComplaintFile (whose columns are
+    decoded directly) or any other dataset (read one complaint at a time, see dataset_complaints)
+    :param names: slot names, other than Consumer_complaint_narrative and Complaint_ID
+    :return: A dictionary mapping each name to a CategoricalColumn
+    """
+    if isinstance(dataset, ComplaintTable):
+        return {name: dataset.columns[name] for name in names}
+    columns = {name: CategoricalColumn() for name in names}
+    if isinstance(dataset, MappedComplaintFile):
+        for name in names:
+            column = columns[name]
+            column.codes.extend(map(column.encode, dataset.column(name)))
+        return columns
+    encoders = [(columns[name].codes.append, columns[name].encode, name) for name in names]
+    for complaint in dataset_complaints(dataset):
+        for append, encode, name in encoders:
+            append(encode(getattr(complaint, name)))
+    return columns
+
+
+@instrumentation.instrumented(countRows=True)
+def count_by_fields(dataset, fields):
+    """
+    Counts the complaints holding each value of one or more slots, keeping nothing but the counts.
+    :param dataset: path name of a CSV file (streamed one row at a time, so memory grows with the number of distinct
+    values only), a ComplaintTable (counted from its dictionary-encoded columns), a MappedComplaintFile (only these
+    columns are decoded), a dictionary of complaints from read_complaint_data or any iterable of complaints
+    :param fields: slot names, e.g. ("Company", "Product")
+    :return: A dictionary mapping each field to a Counter of its values, values in the order they first occur. Each
+    slot is counted on its own (see ComplaintTable.count_rows for counts of combinations). As in iter_complaints, a
+    Complaint_ID appearing more than once in a file or iterable is counted each time; a MappedComplaintFile, like the
+    dictionary from read_complaint_data, counts it once.
+    """
+    fields = tuple(fields)
+    if isinstance(dataset, str):
+        positions = [SLOT_NAMES.index(name) for name in fields]
+        rows = iter_complaint_rows(dataset)
+        if len(fields) == 1:
+            return {fields[0]: Counter(map(operator.itemgetter(positions[0]), rows))}
+        counters = {name: Counter() for name in fields}
+        pairs = [(counters[name], position) for name, position in zip(fields, positions)]
+        for row in rows:
+            for counter, position in pairs:
+                counter[row[position]] += 1
+        return counters
+    if isinstance(dataset, ComplaintTable):
+        counters = {}
+        stats = dataset.cache.get("statistics")
+        for name in fields:
+            if stats is not None and name in STATISTICS_SLOTS:
+                counters[name] = Counter(stats.counts(name))
+            elif name in TEXT_SLOTS or name == "Complaint_ID":
+                counters[name] = Counter(dataset.column(name))
+            else:
+                column = dataset.columns[name]
+                counts = count_codes(column.codes, len(column.values))
+                counters[name] = Counter({column.values[code]: count
+                                          for code, count in enumerate(counts) if count > 0})
+        return counters
+    if isinstance(dataset, MappedComplaintFile):
+        return {name: Counter(dataset.count_values(name)) for name in fields}
+    counters = {name: Counter() for name in fields}
+    pairs = [(counters[name], operator.attrgetter(name)) for name in fields]
+    for complaint in dataset_complaints(dataset):
+        for counter, getter in pairs:
+            counter[getter(complaint)] += 1
+    return counters
+
+
+def count_by(dataset, field):
+    """
+    Counts the complaints holding each value of one slot, e.g. count_by("data/Long-20k.csv", "State") reads the file
+    keeping one count per state.
+    :param dataset: see count_by_fields
+    :param field: slot name
+    :return: Counter mapping each value to its number of complaints, values in the order they first occur
+    """
+    return count_by_fields(dataset, (field,))[field]
+
+
+class ComplaintStatistics:
+    """
+    Statistics of a dataset computed from its dictionary-encoded columns. Only the columns are read, once; no
+    Complaint object is built for a ComplaintTable.
+    """
+
+    def __init__(self, dataset):
+        self.columns = encode_columns(dataset, STATISTICS_SLOTS)
+        self._counts = {}
+
+    @property
+    def totalComplaints(self):
+        return len(self.columns["Company"].codes)
+
+    def update(self, previous, values):
+        """
+        Keeps the counts computed so far up to date after a row of the ComplaintTable was added or replaced (see
+        ComplaintTable.upsert), instead of counting every row again.
+        :param previous: dictionary mapping slot names to the row's values before, or None if the row is new
+        :param values: dictionary mapping slot names to the row's values now
+        """
+        for name, counts in self._counts.items():
+            column = self.columns[name]
+            if len(counts) < len(column.values):
+                counts.extend([0] * (len(column.values) - len(counts)))
+            counts[column.code_of(values[name])] += 1
+            if previous is not None:
+                counts[column.code_of(previous[name])] -= 1
+
+    def count_list(self, name):
+        """returns the number of rows holding each code of slot 'name' (see count_codes), computed once"""
+        if name not in self._counts:
+            column = self.columns[name]
+            self._counts[name] = count_codes(column.codes, len(column.values))
+        return self._counts[name]
+
+    def counts(self, name):
+        """
+        returns a dictionary mapping each value of slot 'name' to its number of complaints, in the order the values
+        first occur
+        """
+        values = self.columns[name].values
+        return {values[code]: count for code, count in enumerate(self.count_list(name)) if count > 0}
+
+    def top(self, name, k):
+        """returns the k values of slot 'name' with the most complaints, as (value, count) pairs, most first"""
+        counts = self.count_list(name)
+        values = self.columns[name].values
+        return [(values[code], counts[code]) for code in top_k(counts, k) if counts[code] > 0]
+
+    def percentiles(self, name="Company", points=DEFAULT_PERCENTILES):
+        """returns percentiles of the number of complaints per value of slot 'name' (by default, per company)"""
+        return percentiles([count for count in self.count_list(name) if count > 0], points)
+
+    def _answer_counts(self, groupName, name):
+        """
+        helper function returning, for each code of slot groupName, the number of rows whose slot 'name' is "Yes"
+        and the number answered at all ("Yes" or "No")
+        """
+        group = self.columns[groupName]
+        answer = self.columns[name]
+        size = len(group.values)
+        yes = count_codes_matching(group.codes, size, answer.codes, answer.code_of("Yes"))
+        no = count_codes_matching(group.codes, size, answer.codes, answer.code_of("No"))
+        return yes, [y + n for y, n in zip(yes, no)]
+
+    def rate(self, name):
+        """
+        returns the share of complaints answering "Yes" in slot 'name' (e.g. "Timely_response") among those
+        answering "Yes" or "No", or None if none did
+        """
+        column = self.columns[name]
+        counts = self.count_list(name)
+        yesCode = column.code_of("Yes")
+        noCode = column.code_of("No")
+        yes = 0 if yesCode is None else counts[yesCode]
+        answered = yes + (0 if noCode is None else counts[noCode])
+        if answered == 0:
+            return None
+        return yes / answered
+
+    def breakdown(self, groupName):
+        """
+        Breaks the complaints down by the values of one slot, e.g. "State" or "Product".
+        :param groupName: slot to group by
+        :return: A dictionary mapping each value to a dictionary holding its number of complaints ("complaints"), its
+        share of all complaints ("share"), and its timely-response and dispute rates ("timely", "disputed"; see
+        rate), in the order the values first occur
+        """
+        values = self.columns[groupName].values
+        counts = self.count_list(groupName)
+        timely, timelyAnswered = self._answer_counts(groupName, "Timely_response")
+        disputed, disputedAnswered = self._answer_counts(groupName, "Consumer_disputed")
+        result = {}
+        for code, count in enumerate(counts):
+            if count > 0:
+                result[values[code]] = {
+                    "complaints": count,
+                    "share": count / self.totalComplaints,
+                    "timely": timely[code] / timelyAnswered[code] if timelyAnswered[code] else None,
+                    "disputed": disputed[code] / disputedAnswered[code] if disputedAnswered[code] else None,
+                }
+        return result
+
+
+def complaint_statistics(dataset):
+    """
+    Returns the ComplaintStatistics of a dataset, kept in the cache of a ComplaintTable so it is only computed once.
+    :param dataset: dictionary of complaints from read_complaint_data, a ComplaintTable, a MappedComplaintFile or
+    any iterable of complaints
+    """
+    cache = getattr(dataset, "cache", None)
+    if cache is None:
+        return ComplaintStatistics(dataset)
+    if "statistics" not in cache:
+        cache["statistics"] = ComplaintStatistics(dataset)
+    return cache["statistics"]
+
+
+def _format_rate(rate):
+    """helper function formatting a rate from ComplaintStatistics, or N/A if there is none"""
+    if rate is None:
+        return "N/A"
+    return '{:.1%}'.format(rate)
+
+
+@instrumentation.instrumented(countRows=True)
+def print_detailed_statistics(dataset, stats=None, top=10):
+    """
+    Prints percentiles of complaints per company, overall timely-response and dispute rates, and per state and per
+    product breakdowns.
+    :param dataset: see complaint_statistics
+    :param stats: ComplaintStatistics of the dataset (computed if not given)
+    :param top: number of states listed in the per state breakdown (most complaints first); every product is listed
+    :return: Not applicable
+    """
+    if stats is None:
+        stats = complaint_statistics(dataset)
+    if stats.totalComplaints == 0:
+        print("\nNo complaints.")
+        return
+
+    print("\nComplaints Per Company Percentiles: " +
+          ", ".join("p" + str(point) + " " + str(value) for point, value in stats.percentiles().items()))
+    print("Timely Response Rate: " + _format_rate(stats.rate("Timely_response")) +
+          "\nDispute Rate: " + _format_rate(stats.rate("Consumer_disputed")))
+
+    for groupName, title, limit in (("Product", "Products", None), ("State", "States", top)):
+        breakdown = stats.breakdown(groupName)
+        keys = sorted(breakdown, key=lambda key: -breakdown[key]["complaints"])
+        if limit is not None:
+            keys = keys[:limit]
+            title = "Top " + str(len(keys)) + " " + title
+        print("\n" + (title + ":").ljust(40) + "Complaints   Share   Timely   Disputed")
+        for key in keys:
+            row = breakdown[key]
+            print("    " + (key if key != "" else "(none)").ljust(36)[:36] + str(row["complaints"]).rjust(10) +
+                  '{:.1%}'.format(row["share"]).rjust(8) + _format_rate(row["timely"]).rjust(9) +
+                  _format_rate(row["disputed"]).rjust(11))
+
+
+"""Files compare_engines reads when none are given"""
+ENGINE_CHECK_FILES = ("./data/Short-05k.csv", "./data/Med-10k.csv", "./data/Long-20k.csv", "./data/LongLines1.csv",
+                      "./data/LongLines3.csv")
+
+"""Lists of counts with ties at every position, so that top_k's tie order is checked for every k"""
+ENGINE_CHECK_LISTS = ([5, 3, 5, 3, 3, 1, 5, 3], [1, 1, 1, 1], [0, 2, 0, 2, 0], [7], [4, 9, 4, 9, 4, 9, 2, 2])
+
+
+def _engine_results(table, k):
+    """
+    helper function to compare_engines, returning every result of this module's NumPy or pure Python paths for a
+    ComplaintTable
+    """
+    columns = table.columns
+    results = {}
+    for name in STATISTICS_SLOTS:
+        column = columns[name]
+        counts = count_codes(column.codes, len(column.values))
+        results["count_codes " + name] = counts
+        results["percentiles " + name] = percentiles(counts)
+        for size in (1, 3, k, len(counts) + 1):
+            results["top_k " + name + " " + str(size)] = top_k(counts, size)
+        answer = columns["Timely_response"]
+        results["count_codes_matching " + name] = count_codes_matching(column.codes, len(column.values),
+                                                                       answer.codes, answer.code_of("Yes"))
+    for names in (("Company", "Product"), ("State", "Date_received", "Date_sent_to_company")):
+        results["count_code_tuples " + ", ".join(names)] = dict(count_code_tuples([columns[name] for name in names]))
+    stats = ComplaintStatistics(table)
+    results["ComplaintStatistics.top"] = stats.top("Company", k)
+    results["ComplaintStatistics.percentiles"] = stats.percentiles()
+    for name in ("Product", "State"):
+        results["ComplaintStatistics.breakdown " + name] = stats.breakdown(name)
+    for position, values in enumerate(ENGINE_CHECK_LISTS):
+        results["percentiles list " + str(position)] = percentiles(values)
+        for size in range(1, len(values) + 2):
+            results["top_k list " + str(position) + " " + str(size)] = top_k(values, size)
+    return results
+
+
+def compare_engines(filepaths=ENGINE_CHECK_FILES, k=10):
+    """
+    Checks that the NumPy paths of this module (count_codes, count_codes_matching, count_code_tuples, percentiles,
+    top_k and so ComplaintStatistics) give the same results as the pure Python ones, top_k's order of ties included.
+    :param filepaths: path names of CSV data files, each read into a ComplaintTable
+    :param k: number of largest values asked of top_k (besides 1, 3 and every value)
+    :return: list of the results that differ, as "file: result" strings; empty if both paths agree
+    :raise RuntimeError: if NumPy is not installed, since only the pure Python path can then run
+    """
+    global numpy
+    installed = numpy
+    if installed is None:
+        raise RuntimeError("NumPy is not installed, so there is no NumPy path to compare")
+    differences = []
+    for filepath in filepaths:
+        table = read_complaint_table(filepath)
+        try:
+            withNumpy = _engine_results(table, k)
+            numpy = None
+            withoutNumpy = _engine_results(table, k)
+        finally:
+            numpy = installed
+        for name in withNumpy:
+            if withNumpy[name] != withoutNumpy[name]:
+                differences.append(filepath + ": " + name)
+    return differences
+
+
+def main():
+    filepaths = sys.argv[1:] or ENGINE_CHECK_FILES
+    differences = compare_engines(filepaths)
+    for difference in differences:
+        print("NumPy and pure Python results differ: " + difference)
+    if differences:
+        sys.exit(1)
+    print("NumPy and pure Python results agree on " + ", ".join(filepaths))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Name: complaint_table.py
+Author: Ari Bernstein
+Description: Column-oriented storage for complaint data.
+-ComplaintTable keeps one list/array per Complaint slot instead of one Complaint object per row. Low-cardinality
+ slots (Product, Company, State, Submitted_via, etc.) are dictionary-encoded so each distinct string is stored once.
+-ComplaintRows is a lazy list of rows in a table, used in place of the lists of Complaint objects held by the
+ company and state maps.
+-read_complaint_table populates a ComplaintTable from spreadsheets
+Complaint objects are only built when a row is actually asked for (e.g. to be displayed).
+Pre-condition: utilities.py works correctly and is in the same directory, csv files are in subdirectory called 'data'
+"""
+
+from utilities import *
+from array import array
+from collections import Counter
+from collections.abc import Mapping, Sequence
+import instrumentation
+
+SLOT_NAMES = Complaint.__slots__
+
+"""Slots stored as plain lists of strings: the narrative is (nearly) unique per row and Complaint_ID is the key.
+Every other slot repeats heavily across rows and is dictionary-encoded."""
+TEXT_SLOTS = ("Consumer_complaint_narrative",)
+"""Position of Complaint_ID in a row; a row may hold extra fields after it (e.g. from a trailing comma)"""
+ID_POSITION = SLOT_NAMES.index("Complaint_ID")
+CATEGORICAL_SLOTS = tuple(name for name in SLOT_NAMES if name not in TEXT_SLOTS and name != "Complaint_ID")
+
+
+class CategoricalColumn:
+    """
+    Dictionary-encoded column. Each distinct value is stored once in 'values'; 'codes' holds, for every row, the
+    index of that row's value in 'values'.
+    """
+    __slots__ = ("values", "codes", "_lookup")
+
+    def __init__(self):
+        self.values = []
+        self.codes = array("I")
+        self._lookup = {}
+
+    def encode(self, value):
+        """returns the code of value, adding value to the dictionary if it has not been seen before"""
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self._lookup[value] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value):
+        """returns the code of value, or None if no row holds that value"""
+        return self._lookup.get(value)
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def __setitem__(self, row, value):
+        self.codes[row] = self.encode(value)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        values = self.values
+        for code in self.codes:
+            yield values[code]
+
+
+class ComplaintTable(Mapping):
+    """
+    Columnar replacement for the dictionary returned by read_complaint_data. It behaves like that dictionary
+    (integer complaint ID -> Complaint), but rows are stored column by column and a Complaint object is only built
+    when one is looked up. Rows keep the order in which they were first added.
+
+    'cache' holds structures derived from the rows (such as the ComplaintIndex of complaint_index.py) so that they
+    are built once per table; it is emptied whenever rows are added or replaced, except by upsert.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        for name in SLOT_NAMES:
+            if name in TEXT_SLOTS:
+                self.columns[name] = []
+            elif name != "Complaint_ID":
+                self.columns[name] = CategoricalColumn()
+        self.ids = array("q")
+        self._rowOfID = {}
+        self.cache = {}
+
+    def append(self, values):
+        """
+        Adds a row to the table. A row whose Complaint_ID is already in the table replaces the old row in place,
+        just as assigning to an existing key of the dictionary from read_complaint_data would.
+        :param values: sequence of strings, one per Complaint slot, in Complaint._slots order
+        """
+        if self.cache:
+            self.cache.clear()
+        self.upsert(values)
+
+    def upsert(self, values):
+        """
+        Same as append, but leaves the cache alone, for callers that update the cached structures themselves (see
+        incremental_ingest.py).
+        :param values: sequence of strings, one per Complaint slot, in Complaint._slots order; fields past the last slot
+        are ignored
+        :return: the row number holding the row, and the list of values the row held before (in Complaint._slots
+        order), or None if its Complaint_ID is new
+        """
+        complaintID = int(values[ID_POSITION])
+        row = self._rowOfID.get(complaintID)
+        if row is None:
+            self._rowOfID[complaintID] = len(self.ids)
+            self.ids.append(complaintID)
+            for name, value in zip(SLOT_NAMES, values):
+                if name != "Complaint_ID":
+                    self.columns[name].append(value)
+            return len(self.ids) - 1, None
+        previous = [self.value(row, name) for name in SLOT_NAMES]
+        for name, value in zip(SLOT_NAMES, values):
+            if name != "Complaint_ID":
+                self.columns[name][row] = value
+        return row, previous
+
+    def extend(self, other):
+        """
+        Adds every row of another ComplaintTable (e.g. one read from a later part of the same file), in its row
+        order. Rows whose Complaint_ID is already in this table replace the old rows, as in append.
+        :param other: a ComplaintTable
+        """
+        self.cache.clear()
+        if any(complaintID in self._rowOfID for complaintID in other.ids):
+            for row in range(len(other)):
+                self.append([other.value(row, name) for name in SLOT_NAMES])
+            return
+        """No IDs in common: copy whole columns, translating the other table's codes into this table's"""
+        firstRow = len(self.ids)
+        self.ids.extend(other.ids)
+        self._rowOfID.update(zip(other.ids, range(firstRow, len(self.ids))))
+        for name in self.columns:
+            column = self.columns[name]
+            otherColumn = other.columns[name]
+            if isinstance(column, CategoricalColumn):
+                newCodes = [column.encode(value) for value in otherColumn.values]
+                column.codes.extend(map(newCodes.__getitem__, otherColumn.codes))
+            else:
+                column.extend(otherColumn)
+
+    def row_of(self, complaintID):
+        """returns the row number holding complaintID, or None if it is not in the table"""
+        return self._rowOfID.get(complaintID)
+
+    def value(self, row, name):
+        """returns the value of slot 'name' in a given row without building a Complaint"""
+        if name == "Complaint_ID":
+            return str(self.ids[row])
+        return self.columns[name][row]
+
+    def row(self, row):
+        """builds the Complaint object for a given row number"""
+        values = [self.columns[name][row] for name in SLOT_NAMES[:-1]]
+        values.append(str(self.ids[row]))
+        return makeComplaint(values)
+
+    def rows(self, rowNumbers=None):
+        """returns a lazy list (ComplaintRows) of the given row numbers, or of every row if none are given"""
+        if rowNumbers is None:
+            rowNumbers = range(len(self.ids))
+        return ComplaintRows(self, rowNumbers)
+
+    def column(self, name):
+        """returns the values of slot 'name' for every row, in row order"""
+        if name == "Complaint_ID":
+            return [str(i) for i in self.ids]
+        return self.columns[name]
+
+    def group_rows(self, *names):
+        """
+        Groups the rows of the table by the values of one or more categorical slots.
+        :param names: one or more categorical slot names, e.g. "State" or "Company", "Product"
+        :return: A dictionary mapping each value of the first slot to a dictionary for the next slot, and so on, ending
+        in ComplaintRows for the rows sharing those values. Keys appear in the order they first occur in the table.
+        """
+        columns = [self.columns[name] for name in names]
+        groups = {}
+        for row in range(len(self.ids)):
+            level = groups
+            for column in columns[:-1]:
+                key = column[row]
+                if key not in level:
+                    level[key] = {}
+                level = level[key]
+            key = columns[-1][row]
+            if key not in level:
+                level[key] = array("I")
+            level[key].append(row)
+        return self._wrap_groups(groups)
+
+    def count_rows(self, *names):
+        """
+        Counts the rows of the table sharing the values of one or more categorical slots, without building any
+        Complaint or list of rows.
+        :param names: one or more categorical slot names, e.g. "State" or "Company", "Product"
+        :return: Same shape as group_rows, but ending in the number of rows instead of ComplaintRows.
+        """
+        columns = [self.columns[name] for name in names]
+        counts = Counter(zip(*[column.codes for column in columns]))
+        result = {}
+        for codes in counts:
+            level = result
+            for column, code in zip(columns[:-1], codes):
+                value = column.values[code]
+                if value not in level:
+                    level[value] = {}
+                level = level[value]
+            level[columns[-1].values[codes[-1]]] = counts[codes]
+        return result
+
+    def _wrap_groups(self, groups):
+        """helper function to group_rows, replaces each array of row numbers with ComplaintRows"""
+        for key in groups:
+            if isinstance(groups[key], dict):
+                self._wrap_groups(groups[key])
+            else:
+                groups[key] = ComplaintRows(self, groups[key])
+        return groups
+
+    def __getitem__(self, complaintID):
+        return self.row(self._rowOfID[complaintID])
+
+    def __contains__(self, complaintID):
+        return complaintID in self._rowOfID
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ComplaintRows(Sequence):
+    """
+    Lazy list of Complaint objects backed by rows of a ComplaintTable. Its length is known without building any
+    Complaint; indexing and iterating build the Complaint objects one at a time.
+    """
+    __slots__ = ("table", "rowNumbers")
+
+    def __init__(self, table, rowNumbers):
+        self.table = table
+        self.rowNumbers = rowNumbers
+
+    def __len__(self):
+        return len(self.rowNumbers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ComplaintRows(self.table, self.rowNumbers[index])
+        return self.table.row(self.rowNumbers[index])
+
+    def __iter__(self):
+        row = self.table.row
+        for rowNumber in self.rowNumbers:
+            yield row(rowNumber)
+
+    def __repr__(self):
+        return "ComplaintRows( " + str(len(self)) + " rows )"
+
+
+def read_complaint_table(filepath, fields=None, where=None):
+    """
+    Populates a ComplaintTable from inputted CSV files. Drop-in replacement for read_complaint_data that stores the
+    data column by column.
+
+    :param filepath: A string, giving the path name of a CSV data file.
+
+    :param fields: optional column projection, see read_complaint_data
+
+    :param where: optional row predicates, see read_complaint_data
+
+    :return: A ComplaintTable mapping integer complaint ID values to Complaint objects.
+
+    printed output: same as read_complaint_data.
+    """
+    table = ComplaintTable()
+
+    instrumentation.progress("Reading " + filepath)
+
+    with instrumentation.span("read_complaint_table", bytesRead=instrumentation.file_size(filepath)) as reading:
+        for row in iter_complaint_rows(filepath, fields, where):
+            table.append(row)
+        reading.rows = len(table)
+
+    instrumentation.report_read(reading, len(table))
+    return table
@@ -0,0 +1,174 @@
+"""
+Name: dataset_cache.py
+Author: Ari Bernstein
+Description: On-disk cache of parsed datasets, so that only the first run of a tool on a CSV file pays for parsing it.
+-cached_read_complaint_table returns the same ComplaintTable as read_complaint_table, together with its prebuilt
+ ComplaintIndex and ProductPhraseIndex, loading it from a binary cache file when one is up to date
+-open_report_dataset memory-maps a plain CSV file instead, for reports that only count complaints and show a few
+The cache files live in data/.cache (next to the CSV files). A cache file is used when the CSV file's size and
+modification time are unchanged, or, if only the modification time changed, when its content hash is unchanged.
+Pre-condition: utilities.py, complaint_table.py, complaint_index.py and mapped_reader.py work correctly and are in
+same directory, csv files are in subdirectory labeled 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from complaint_index import *
+from mapped_reader import *
+import hashlib
+import instrumentation
+import os
+import pickle
+import struct as binary
+
+"""Bump when ComplaintTable or the cached indexes change shape, so old cache files are ignored"""
+CACHE_VERSION = 2
+CACHE_MAGIC = b"CTBL"
+CACHE_DIRECTORY = ".cache"
+
+"""File layout: magic, version, CSV size, CSV mtime (ns), 20 byte SHA-1 of the CSV file, then the pickled table"""
+CACHE_HEADER = binary.Struct("<4sIqq20s")
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def cache_path(filepath):
+    """helper function returning the cache file of a CSV file, e.g. ./data/.cache/Long-20k.csv.table"""
+    directory, name = os.path.split(os.path.abspath(filepath))
+    return os.path.join(directory, CACHE_DIRECTORY, name + ".table")
+
+
+def file_hash(filepath):
+    """returns the SHA-1 digest (20 bytes) of a file's contents"""
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as data_file:
+        block = data_file.read(HASH_BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = data_file.read(HASH_BLOCK_SIZE)
+    return digest.digest()
+
+
+def _read_header(cacheFile):
+    """helper function returning the header fields of a cache file, or None if it is not a current cache file"""
+    try:
+        with open(cacheFile, "rb") as cache_file:
+            header = cache_file.read(CACHE_HEADER.size)
+    except OSError:
+        return None
+    if len(header) != CACHE_HEADER.size:
+        return None
+    magic, version, size, mtime, digest = CACHE_HEADER.unpack(header)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    return size, mtime, digest
+
+
+def _refresh_mtime(cacheFile, mtime):
+    """helper function recording a new CSV modification time in a cache file, so its contents aren't hashed again"""
+    try:
+        with open(cacheFile, "r+b") as cache_file:
+            magic, version, size, oldMtime, digest = CACHE_HEADER.unpack(cache_file.read(CACHE_HEADER.size))
+            cache_file.seek(0)
+            cache_file.write(CACHE_HEADER.pack(magic, version, size, mtime, digest))
+    except OSError:
+        pass
+
+
+def load_cached_table(filepath):
+    """
+    Loads the cached ComplaintTable of a CSV file if the cache is up to date.
+    :param filepath: A string, giving the path name of a CSV data file.
+    :return: the ComplaintTable, or None if there is no usable cache file
+    """
+    cacheFile = cache_path(filepath)
+    header = _read_header(cacheFile)
+    if header is None:
+        return None
+    size, mtime, digest = header
+    stat = os.stat(filepath)
+    if stat.st_size != size:
+        return None
+    if stat.st_mtime_ns != mtime:
+        """touched or copied: only trust the cache if the contents are the same"""
+        if file_hash(filepath) != digest:
+            return None
+        _refresh_mtime(cacheFile, stat.st_mtime_ns)
+    with open(cacheFile, "rb") as cache_file:
+        cache_file.seek(CACHE_HEADER.size)
+        try:
+            table = pickle.load(cache_file)
+        except Exception:
+            """a truncated or corrupted cache file can fail in many ways; reading the CSV file again rebuilds it"""
+            return None
+    if not isinstance(table, ComplaintTable):
+        return None
+    return table
+
+
+def save_cached_table(filepath, table):
+    """
+    Writes the cache file of a CSV file. The file is written under a temporary name and then renamed, so a reader
+    never sees a partly written cache.
+    :param filepath: A string, giving the path name of the CSV data file table was read from.
+    :param table: a ComplaintTable; whatever is in its cache (e.g. its ComplaintIndex) is saved with it
+    :return: path name of the cache file
+    """
+    cacheFile = cache_path(filepath)
+    os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+    stat = os.stat(filepath)
+    temporaryFile = cacheFile + "." + str(os.getpid())
+    with open(temporaryFile, "wb") as cache_file:
+        cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, stat.st_size, stat.st_mtime_ns,
+                                           file_hash(filepath)))
+        pickle.dump(table, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporaryFile, cacheFile)
+    return cacheFile
+
+
+def cached_read_complaint_table(filepath):
+    """
+    Same as read_complaint_table, but the parsed table is saved in a cache file on first read and loaded from it on
+    later reads of an unchanged file. The table's ComplaintIndex and ProductPhraseIndex are built before saving, so
+    they come back from the cache too.
+
+    :param filepath: A string, giving the path name of a CSV data file.
+
+    :return: A ComplaintTable mapping integer complaint ID values to Complaint objects.
+
+    printed output: same as read_complaint_data, noting when the table was loaded from the cache.
+    """
+    cacheSize = instrumentation.file_size(cache_path(filepath))
+    with instrumentation.span("load_cached_table", bytesRead=cacheSize) as reading:
+        table = load_cached_table(filepath)
+        if table is not None:
+            reading.rows = len(table)
+    if table is None:
+        table = read_complaint_table(filepath)
+        complaint_index(table)
+        phrase_index(table)
+        try:
+            save_cached_table(filepath, table)
+        except OSError as error:
+            print("Could not write cache for " + filepath + ": " + str(error))
+        return table
+
+    instrumentation.progress("Reading " + filepath + " (cached)")
+    instrumentation.report_read(reading, len(table))
+    return table
+
+
+def open_report_dataset(filepath):
+    """
+    Opens a CSV data file for the reports that count complaints and show only a few of them (state_complaints.py,
+    company_complaints.py).
+    :param filepath: A string, giving the path name of a CSV data file.
+    :return: a MappedComplaintFile for a plain CSV file, so a report only decodes the columns it reads, or the
+    ComplaintTable (see cached_read_complaint_table) of a compressed file, which can't be mapped
+    """
+    if compression_of(filepath) is None:
+        with instrumentation.span("MappedComplaintFile", bytesRead=instrumentation.file_size(filepath)) as mapping:
+            dataset = MappedComplaintFile(filepath)
+            mapping.rows = len(dataset.recordStarts)
+        return dataset
+    return cached_read_complaint_table(filepath)
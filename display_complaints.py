@@ -2,11 +2,21 @@
 Name: company_complaints.py
 Author: Ari Bernstein
 Description: Prints contents of instances of complaint classes in a clear, concise, and pretty way.
+-format_complaint returns the text display_complaint prints, as one string
+-ComplaintWriter writes many complaints to a file or stdout through one buffer, as plain text, JSON lines or CSV
 Pre-conditions, utilities.py works correctly and is the in same directory, csv files are in
 subdirectory labeled 'data'
 """
 
 from utilities import *
+from complaint_table import *
+from dataset_cache import *
+import instrumentation
+import csv
+import functools
+import json
+import operator
+import sys
 
 def eightSpace(slotName, value):
     """
@@ -34,11 +44,11 @@ def returnClassFromID(dictionary, id):
     if id == "":
         print("Complaint ID field is empty.")
         return None
-    else:
-        id = int(id)
-        for key in dictionary:
-            if key == id:
-                return dictionary[key]
+    complaintID = parse_complaint_id(id)
+    if complaintID is not None:
+        complaint = dictionary.get(complaintID)
+        if complaint is not None:
+            return complaint
     print(str(id) + " is not in dataset.")
 
 
@@ -46,26 +56,65 @@ def formatChars(slot):
     """
     Formats long lines so that they stack every 67 characters
     :param slot: String from the value of a slot in an instance of complaint class
-    :return: string formatted so that it has a newLine character every 67 characters
+    :return: string formatted so that it has a newLine character every 67 characters; a word that doesn't fit on a
+    line starts the next one
     """
-    if slot is not '':
-        slot = slot.split()
-        line = ''
-        fullString = ''
-        for i in slot:
-            if len(line) + len(i) < 66:
-                line += i + ' '
-            else:
-                fullString += line + '\n' + (' ' * 8)
-                line = ''
-        fullString += line + (' ' * 8)
-        return fullString
+    if slot != '':
+        lines = []
+        line = []
+        length = 0
+        for word in slot.split():
+            """each word is followed by a space, as in the printed line"""
+            if line and length + len(word) >= 66:
+                lines.append(' '.join(line) + ' ')
+                line = []
+                length = 0
+            line.append(word)
+            length += len(word) + 1
+        lines.append(' '.join(line) + ' ' if line else '')
+        return ('\n' + (' ' * 8)).join(lines) + (' ' * 8)
     else:
         return slot
 
 
+"""Number of distinct values cachedFormatChars remembers"""
+FORMAT_CACHE_SIZE = 4096
+
+"""formatChars for slots with few distinct values (Product, Issue, Company, ...), which repeat across thousands of
+complaints and so are wrapped once each"""
+cachedFormatChars = functools.lru_cache(maxsize=FORMAT_CACHE_SIZE)(formatChars)
+
+
+"""Slots display_complaint prints as they are, without wrapping"""
+UNWRAPPED_SLOTS = ("Date_received", "State", "ZIP_code", "Consumer_consent_provided", "Date_sent_to_company",
+                   "Timely_response", "Consumer_disputed", "Complaint_ID")
+
+"""Lines printed by display_complaint: slot name, and the function wrapping its value (None if it isn't wrapped).
+Narratives are nearly unique, so they are wrapped every time rather than filling the cache."""
+DISPLAY_LAYOUT = tuple((name, None if name in UNWRAPPED_SLOTS else
+                        formatChars if name in TEXT_SLOTS else cachedFormatChars)
+                       for name in SLOT_NAMES)
 
+FORMATS = ("plain", "jsonl", "csv")
 
+_slotValues = operator.attrgetter(*SLOT_NAMES)
+
+
+def format_complaint(complaint):
+    """
+    Returns the text display_complaint prints for a complaint, as a single string
+    :param complaint: instance of Complaint class
+    :return: one line per slot name and its (indented) value, each ending in a newline
+    """
+    lines = []
+    for name, wrap in DISPLAY_LAYOUT:
+        value = getattr(complaint, name)
+        lines.append(eightSpace(name + " :", value if wrap is None else wrap(value)))
+    lines.append("")
+    return "\n".join(lines)
+
+
+@instrumentation.instrumented()
 def display_complaint(complaint):
     """
 
@@ -74,24 +123,8 @@ def display_complaint(complaint):
     printed output: All data from an instance of the complaint class in a pretty manner
     """
     if complaint is not None:
-        print(eightSpace("Date_received :", complaint.Date_received))
-        print(eightSpace("Product :", formatChars(complaint.Product)))
-        print(eightSpace("Sub_product :", formatChars(complaint.Sub_product)))
-        print(eightSpace("Issue :", formatChars(complaint.Issue)))
-        print(eightSpace("Sub_issue :", formatChars(complaint.Sub_issue)))
-        print(eightSpace("Consumer_complaint_narrative :", formatChars(complaint.Consumer_complaint_narrative)))
-        print(eightSpace("Company_public_response :", formatChars(complaint.Company_public_response)))
-        print(eightSpace("Company :", formatChars(complaint.Company)))
-        print(eightSpace("State :", complaint.State))
-        print(eightSpace("ZIP_code :", complaint.ZIP_code))
-        print(eightSpace("Tags :", formatChars(complaint.Tags)))
-        print(eightSpace("Consumer_consent_provided :", complaint.Consumer_consent_provided))
-        print(eightSpace("Submitted_via :", formatChars(complaint.Submitted_via)))
-        print(eightSpace("Date_sent_to_company :", complaint.Date_sent_to_company))
-        print(eightSpace("Company_response_to_consumer :", formatChars(complaint.Company_response_to_consumer)))
-        print(eightSpace("Timely_response :", complaint.Timely_response))
-        print(eightSpace("Consumer_disputed :", complaint.Consumer_disputed))
-        print(eightSpace("Complaint_ID :", complaint.Complaint_ID))
+        """formatted in full first, so the complaint is printed with a single write"""
+        print(format_complaint(complaint), end="")
 
     elif complaint is None:
         return
@@ -99,10 +132,86 @@ def display_complaint(complaint):
         print(str(complaint) + " not in dataset")
 
 
+class ComplaintWriter:
+    """
+    Writes complaints to a file or stdout in one of FORMATS:
+    "plain": the text display_complaint prints
+    "jsonl": one JSON object per line, mapping each slot name to its value
+    "csv": a heading row of slot names, then one row per complaint
+    Text is collected in a buffer and written in blocks of about bufferSize characters, so writing thousands of
+    complaints takes few writes. Complaints are formatted as they are given, so a generator of complaints (e.g.
+    iter_complaints) is never held in memory. Call close (or use a with statement) to write what is left.
+    """
+
+    def __init__(self, stream=None, format="plain", bufferSize=1 << 16):
+        """
+        :param stream: file object opened for writing text (default: sys.stdout); it is not closed by close
+        :param format: one of FORMATS
+        :param bufferSize: number of characters collected before they are written
+        """
+        if format not in FORMATS:
+            raise ValueError("format must be one of " + ", ".join(FORMATS) + ", not " + repr(format))
+        self.stream = sys.stdout if stream is None else stream
+        self.format = format
+        self.bufferSize = bufferSize
+        self.count = 0
+        self._parts = []
+        self._size = 0
+        if format == "csv":
+            self._csv = csv.writer(self, lineterminator="\n")
+            self._csv.writerow(SLOT_NAMES)
+
+    def write(self, text):
+        """adds text to the buffer, writing the buffer out once it is full"""
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.bufferSize:
+            self.flush()
+
+    def write_complaint(self, complaint):
+        """adds one complaint (None is skipped, as by display_complaint)"""
+        if complaint is None:
+            return
+        if self.format == "plain":
+            self.write(format_complaint(complaint))
+        elif self.format == "jsonl":
+            self.write(json.dumps(dict(zip(SLOT_NAMES, _slotValues(complaint)))) + "\n")
+        else:
+            self._csv.writerow(_slotValues(complaint))
+        self.count += 1
+
+    @instrumentation.instrumented("ComplaintWriter.write_complaints")
+    def write_complaints(self, complaints):
+        """
+        adds every complaint of an iterable, one at a time
+        :return: the number of complaints written so far
+        """
+        for complaint in complaints:
+            self.write_complaint(complaint)
+        return self.count
+
+    def flush(self):
+        """writes the buffer out"""
+        if self._parts:
+            self.stream.write("".join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def close(self):
+        self.flush()
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 def main():
     complaintIDList = []
     filePath = "./data/" + input("Enter CSV file name: ")
-    complaints = read_complaint_data(filePath)
+    complaints = cached_read_complaint_table(filePath)
 
     id = input("Enter a Complaint_ID (e.g. 13002) or press ENTER key to stop: ")
     complaintIDList.append(id)
@@ -2,138 +2,232 @@
 Name: graph_complaints.py
 Author: Ari Bernstein
 Description: produces a bar graph of the number of complaints per state using Python Turtles.
+-layout_bar_chart lays out a bar chart of complaint counts (per state, company, product, ...) once, as a list of
+ lines, bars and labels
+-a rendering backend draws that list: SVGBackend writes an SVG file without any display, TurtleBackend draws it
+ with Python Turtles without animating each move
+-render_charts writes the SVG charts of many CSV files in one run
+Usage without a display: python graph_complaints.py --svg OUTPUT_DIRECTORY data/Long-20k.csv [more csv files]
 Pre-conditions: utilities.py and state_complaints.py work correctly and are in same directory, csv files are in
 subdirectory labeled 'data'
 """
 
 from state_complaints import *
-import turtle as t
+from complaint_statistics import *
+from xml.sax.saxutils import escape
+import heapq
+import instrumentation
 import math
+import os
+import sys
 
-def axes(stateMap):
+"""turtle (and tkinter) is only needed to draw on screen; SVG charts are written without it"""
+try:
+    import turtle as t
+except ImportError:
+    t = None
+
+"""Bar chart geometry, in pixels"""
+BAR_SPACING = 18
+BAR_WIDTH = 12
+PLOT_HEIGHT = 400
+MARGIN = 60
+LABEL_SPACE = 130
+TICKS = 10
+
+
+def chart_counts(dataset, slot="State", top=None, index=None):
     """
-    Finds the largest number of complaints per state and the number of states
-    :param stateMap: (returned from make_state_map) A dictionary mapping upper case state abbreviation values to lists
-    of Complaint objects originating in the state.
-    :return: height(largest number of complaints for any state), number of states in stateMap
+    Counts complaints for a bar chart, without building any Complaint or list of complaints
+    :param dataset: path name of a CSV file (streamed, keeping one count per value), dictionary of complaints from
+    read_complaint_data, a ComplaintTable, a MappedComplaintFile or any iterable of complaints (see count_by)
+    :param slot: slot to count by, e.g. "State", "Company" or "Product"
+    :param top: if given, only the 'top' values with the most complaints are kept
+    :param index: optional ComplaintIndex of the dataset, used for states and products
+    :return: A dictionary mapping each value of the slot to its number of complaints. Without 'top', values are
+    sorted alphabetically, as the turtle graph always ordered states; with it, most complaints first.
     """
-    height = 0
-    num_states = 0
-    for key in stateMap:
-        num_states += 1
-        if len(stateMap[key]) > height:
-            height = len(stateMap[key])
-    return height, num_states
-
-def drawYAxis(height):
+    if index is not None and slot == "State":
+        counts = index.state_counts()
+    elif index is not None and slot == "Product":
+        counts = index.product_counts()
+    else:
+        counts = count_by(dataset, slot)
+    return _chart_order(counts, top)
+
+
+def _chart_order(counts, top=None):
+    """helper function to chart_counts, orders counts alphabetically or keeps the 'top' largest, most first"""
+    if top is not None:
+        keys = [key for key, count in heapq.nlargest(top, counts.items(), key=lambda item: item[1])]
+        return {key: counts[key] for key in keys}
+    return {key: counts[key] for key in sorted(counts)}
+
+
+def _tick_step(maximum, ticks=TICKS):
+    """helper function returning a round step (1, 2 or 5 times a power of ten) giving about 'ticks' axis ticks"""
+    if maximum <= 0:
+        return 1
+    rough = maximum / ticks
+    power = 10 ** math.floor(math.log10(rough))
+    for multiple in (1, 2, 5, 10):
+        if multiple * power >= rough:
+            return max(1, int(multiple * power))
+
+
+def layout_bar_chart(counts, title=""):
     """
-    Draws Y axis with increments according to its height
-    :param height: max number of complaints per a given state
-    :return: Not applicable, draws stuff
+    Lays out a bar chart, once, as drawing instructions that any rendering backend can draw. Coordinates are in
+    pixels, with y growing downwards, as in SVG.
+    :param counts: dictionary mapping each label to its number of complaints, in the order the bars are drawn
+    (see chart_counts); an empty label is shown as "Undefined"
+    :param title: text written above the chart
+    :return: A dictionary with the chart's "width" and "height" and its "shapes", a list of
+    ("line", x1, y1, x2, y2), ("bar", x, y, width, height) and ("text", x, y, text, anchor, angle) tuples, where
+    anchor is "start", "middle" or "end" and angle is the rotation of the text in degrees
     """
-    """rounds height down to the nearest 10s place"""
-    height = (round(height, -2))
-
-    """allows for y axis to height in 20 increments"""
-    increment_per_complaint = (height/20)
-    increments = int(round(height/increment_per_complaint))
-    graphHeight = height/3 #setworldcoordinates takes care of scaling
-
-    t.pendown()
-    t.left(90)
-    t.forward(graphHeight)
-    t.penup()
-    t.backward(graphHeight)
-    level = 0
-    for i in range(increments):
-        level += increment_per_complaint
-        t.forward(increment_per_complaint/3)
-        t.pendown()
-        t.left(90)
-        t.forward(50)
-        t.penup()
-
-        t.right(90)
-        t.forward(5)
-        t.write(str(level))
-        t.backward(5)
-        t.left(90)
-
-        t.backward(50)
-        t.right(90)
-
-    t.backward(graphHeight)
-    t.right(90)
-
-def drawGraph(num_states, statemap, height):
+    labels = list(counts)
+    maximum = max(counts.values(), default=0)
+    step = _tick_step(maximum)
+    top = max(step, step * math.ceil(maximum / step))
+    scale = PLOT_HEIGHT / top
+    width = 2 * MARGIN + BAR_SPACING * max(len(labels), 1)
+    height = PLOT_HEIGHT + LABEL_SPACE + MARGIN
+    baseline = MARGIN + PLOT_HEIGHT
+    """labels longer than a state abbreviation are written at an angle so they don't overlap"""
+    angle = -60 if any(len(label) > 3 for label in labels) else 0
+
+    shapes = [("text", width / 2, MARGIN / 2, title, "middle", 0),
+              ("line", MARGIN, MARGIN, MARGIN, baseline),
+              ("line", MARGIN, baseline, width - MARGIN, baseline)]
+    for level in range(0, top + 1, step):
+        y = baseline - level * scale
+        shapes.append(("line", MARGIN - 5, y, MARGIN, y))
+        shapes.append(("text", MARGIN - 8, y + 4, str(level), "end", 0))
+    for position, label in enumerate(labels):
+        x = MARGIN + BAR_SPACING * position + (BAR_SPACING - BAR_WIDTH) / 2
+        barHeight = counts[label] * scale
+        shapes.append(("bar", x, baseline - barHeight, BAR_WIDTH, barHeight))
+        text = label if label != "" else "Undefined"
+        if angle == 0:
+            shapes.append(("text", x + BAR_WIDTH / 2, baseline + 14, text, "middle", 0))
+        else:
+            shapes.append(("text", x + BAR_WIDTH / 2, baseline + 10, text[:30], "end", angle))
+    return {"width": width, "height": height, "shapes": shapes}
+
+
+class SVGBackend:
+    """Renders a chart from layout_bar_chart as an SVG document, built in one pass and written with one write"""
+
+    def render(self, chart):
+        """returns the SVG document of a chart as a string"""
+        parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="' + str(chart["width"]) + '" height="' +
+                 str(chart["height"]) + '" font-family="sans-serif" font-size="10">',
+                 '<rect width="100%" height="100%" fill="white"/>']
+        for shape in chart["shapes"]:
+            kind = shape[0]
+            if kind == "line":
+                x1, y1, x2, y2 = shape[1:]
+                parts.append('<line x1="' + _number(x1) + '" y1="' + _number(y1) + '" x2="' + _number(x2) +
+                             '" y2="' + _number(y2) + '" stroke="black"/>')
+            elif kind == "bar":
+                x, y, width, height = shape[1:]
+                parts.append('<rect x="' + _number(x) + '" y="' + _number(y) + '" width="' + _number(width) +
+                             '" height="' + _number(height) + '" fill="steelblue"/>')
+            else:
+                x, y, text, anchor, angle = shape[1:]
+                rotation = ''
+                if angle != 0:
+                    rotation = ' transform="rotate(' + str(angle) + ' ' + _number(x) + ' ' + _number(y) + ')"'
+                parts.append('<text x="' + _number(x) + '" y="' + _number(y) + '" text-anchor="' + anchor + '"' +
+                             rotation + '>' + escape(text) + '</text>')
+        parts.append('</svg>\n')
+        return "\n".join(parts)
+
+    def write(self, chart, filepath):
+        """writes the SVG document of a chart to a file"""
+        with open(filepath, "w") as svg_file:
+            svg_file.write(self.render(chart))
+
+
+def _number(value):
+    """helper function formatting a coordinate with at most two decimals"""
+    return '{:.2f}'.format(value).rstrip("0").rstrip(".")
+
+
+class TurtleBackend:
     """
-    Draws entire graph apart from Y axis
-    :param num_states: total number of states represented
-    :param statemap: (returned from make_state_map) A dictionary mapping upper case state abbreviation values to lists
-    of Complaint objects originating in the state.
-    :param height: height(largest number of complaints for any state), number of states in stateMap
-    :return: Not applicable - draws stuff
+    Draws a chart from layout_bar_chart with Python Turtles. Animation is turned off and the screen is updated once,
+    after every shape has been drawn.
     """
-    t.pendown()
-    state_abrevs = []
-    for key in statemap:
-        state_abrevs.append(key)
-
-    state_abrevs.sort() # sorts list of state abbreviations alphabetically
-    state_abrevs.remove(state_abrevs[0])
 
-    t.forward(15 * num_states)
-    t.backward(15 * num_states)
-    t.width(5)
-
-    for i in state_abrevs:
-        """Draws bars in bar graph"""
-        t.penup()
-        t.forward(15)
-        t.left(90)
-        t.pendown()
-        t.forward(len(statemap[i])/3)
+    def render(self, chart):
+        if t is None:
+            raise RuntimeError("turtle is not available, use SVGBackend instead")
+        screen = t.Screen()
+        screen.setup(min(chart["width"] + 40, 1600), chart["height"] + 40)
+        """y grows downwards in the layout, as on the screen"""
+        screen.setworldcoordinates(0, chart["height"], chart["width"], 0)
+        screen.tracer(0, 0)
+        t.hideturtle()
         t.penup()
-        t.backward(len(statemap[i])/3)
-        t.right(90)
-    t.width(1)
-    t.backward(15 * (num_states -2))
-    count = 0
-
-    t.penup()
-
-    increment_per_state = (height/3)/35
-
-    for i in state_abrevs:
-        """Draws states below graph"""
-        t.right(90)
-        t.forward(increment_per_state)
-        t.write(i)
-        t.left(90)
-        t.forward(15)
-        count += 1
-        if count == 4:
-            t.left(90)
-            t.forward(increment_per_state * 4)
-            t.right(90)
-            count = 0
-
-    t.backward(15 * num_states)
-
-
-def init(height, num_states):
-    """Initiates starting point, speed, and world coordinates of graph"""
-    # Sets screen aspect ratio depending on size of graph
-    t.speed(0)
-    t.penup()
-    t.goto(-num_states, height/20)
+        for shape in chart["shapes"]:
+            kind = shape[0]
+            if kind == "line":
+                x1, y1, x2, y2 = shape[1:]
+                t.goto(x1, y1)
+                t.pendown()
+                t.goto(x2, y2)
+                t.penup()
+            elif kind == "bar":
+                x, y, width, height = shape[1:]
+                t.goto(x, y + height)
+                t.begin_fill()
+                for cornerX, cornerY in ((x + width, y + height), (x + width, y), (x, y), (x, y + height)):
+                    t.goto(cornerX, cornerY)
+                t.end_fill()
+            else:
+                """turtle can't rotate text; it is written horizontally"""
+                x, y, text, anchor, angle = shape[1:]
+                t.goto(x, y)
+                t.write(text, align={"start": "left", "middle": "center", "end": "right"}[anchor])
+        screen.update()
+
+
+def render_charts(filepaths, outputDirectory, slots=("State",), top=None):
+    """
+    Writes an SVG bar chart per CSV file and slot, without any display. Each file is streamed once, keeping only the
+    counts of each slot (see count_by_fields), so memory does not grow with the size of the file.
+    :param filepaths: path names of CSV data files
+    :param outputDirectory: directory the charts are written to (created if needed), named e.g. Long-20k-State.svg
+    :param slots: slots to chart, e.g. ("State", "Company", "Product")
+    :param top: number of bars per chart for slots other than State (default: every value); see chart_counts
+    :return: list of the path names written
+    """
+    os.makedirs(outputDirectory, exist_ok=True)
+    backend = SVGBackend()
+    written = []
+    for filepath in filepaths:
+        countsBySlot = count_by_fields(filepath, slots)
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        for slot in slots:
+            counts = _chart_order(countsBySlot[slot], None if slot == "State" else top)
+            chart = layout_bar_chart(counts, "Complaints per " + slot.replace("_", " ").lower() + ", " + name)
+            chartPath = os.path.join(outputDirectory, name + "-" + slot + ".svg")
+            backend.write(chart, chartPath)
+            written.append(chartPath)
+    return written
+
 
 def main():
-    stateMap = make_state_map(read_complaint_data(getFilePath()))
-    height, num_states = axes(stateMap)
-    init(height, num_states)
-    drawYAxis(height)
-    drawGraph(num_states, stateMap, height)
+    if len(sys.argv) > 3 and sys.argv[1] == "--svg":
+        with instrumentation.span("render_charts") as rendering:
+            written = render_charts(sys.argv[3:], sys.argv[2], ("State", "Company", "Product"), top=40)
+        print("Wrote " + str(len(written)) + " charts in " + str(rendering.seconds) + " seconds.")
+        return
+    """only the count of each state is kept while the file is read"""
+    stateCounts = chart_counts(getFilePath(), "State")
+    TurtleBackend().render(layout_bar_chart(stateCounts, "Complaints per state"))
     print("Please close the canvas to quit.")
     t.done()
 
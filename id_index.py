@@ -0,0 +1,208 @@
+"""
+Name: id_index.py
+Author: Ari Bernstein
+Description: On-disk index of complaint IDs, for looking up complaints without reading the whole CSV file.
+-build_id_index scans a CSV file once and saves, next to it, the byte offset of the record holding each Complaint_ID
+-ComplaintIDIndex loads a saved index and reads single records straight from the CSV file. It can be passed to
+ get_complaints and returnClassFromID in place of the dictionary from read_complaint_data.
+The index remembers the size and modification time of its CSV file and is rebuilt by open_id_index when they change.
+Pre-condition: utilities.py works correctly and is in same directory, csv files are in subdirectory labeled 'data'
+"""
+
+from utilities import *
+from array import array
+from bisect import bisect_left
+import csv
+import io
+import locale
+import os
+import struct as binary
+
+"""File layout: magic, version, CSV size, CSV mtime (ns), number of entries, then the sorted IDs and their offsets"""
+INDEX_MAGIC = b"CIDX"
+INDEX_VERSION = 1
+INDEX_HEADER = binary.Struct("<4sIqqq")
+
+
+def id_index_path(filepath):
+    """helper function returning where the index of a CSV file is saved"""
+    return filepath + ".idx"
+
+
+def _decode_record(data):
+    """helper function parsing one CSV record (as bytes) the same way read_complaint_data does"""
+    text = io.StringIO(data.decode(locale.getpreferredencoding(False)), newline=None)
+    return next(csv.reader(text, delimiter = ","))
+
+
+def _records(data_file):
+    """
+    Helper function yielding (offset, bytes) for every record of a CSV file opened in binary mode. A line ends a
+    record only if the record so far holds an even number of quote characters, so quoted multi-line narratives are
+    kept whole.
+    """
+    offset = data_file.tell()
+    record = b""
+    quotes = 0
+    for line in data_file:
+        record += line
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            yield offset, record
+            offset += len(record)
+            record = b""
+            quotes = 0
+    if record:
+        yield offset, record
+
+
+def build_id_index(filepath, indexPath=None):
+    """
+    Scans a CSV data file and saves the byte offset of each complaint's record, sorted by Complaint_ID. When an ID
+    appears more than once, the last record wins, as in read_complaint_data.
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param indexPath: where to save the index (default: the CSV path name followed by .idx)
+    :return: the ComplaintIDIndex that was saved
+    """
+    require_uncompressed(filepath, "build_id_index")
+    if indexPath is None:
+        indexPath = id_index_path(filepath)
+    offsets = {}
+    with open(filepath, "rb") as data_file:
+        stat = os.fstat(data_file.fileno())
+        records = _records(data_file)
+        heading = next(records, None)
+        if heading is None:
+            idColumn = len(Complaint._slots) - 1
+        else:
+            idColumn = heading_columns(_decode_record(heading[1]), filepath)[-1]
+        for offset, record in records:
+            row = _decode_record(record)
+            offsets[int(row[idColumn])] = offset
+
+    ids = array("q", sorted(offsets))
+    positions = array("q", [offsets[complaintID] for complaintID in ids])
+    with open(indexPath, "wb") as index_file:
+        index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns, len(ids)))
+        ids.tofile(index_file)
+        positions.tofile(index_file)
+    return ComplaintIDIndex(filepath, indexPath)
+
+
+def open_id_index(filepath, indexPath=None):
+    """
+    Returns the ComplaintIDIndex of a CSV data file, building (or rebuilding) it first if there is no saved index or
+    the CSV file changed since it was saved.
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param indexPath: where the index is saved (default: the CSV path name followed by .idx)
+    :return: a ComplaintIDIndex
+    """
+    if indexPath is None:
+        indexPath = id_index_path(filepath)
+    try:
+        index = ComplaintIDIndex(filepath, indexPath)
+    except (OSError, ValueError):
+        return build_id_index(filepath, indexPath)
+    if index.is_stale():
+        index.close()
+        return build_id_index(filepath, indexPath)
+    return index
+
+
+class ComplaintIDIndex:
+    """
+    Read-only view of a CSV data file through its saved ID index. Looking up an ID is a binary search over the sorted
+    IDs followed by reading and parsing that one record, so no other row of the file is read.
+    Supports the lookups used on the dictionary from read_complaint_data: index[id], id in index, index.get(id).
+    """
+
+    def __init__(self, filepath, indexPath):
+        self.filepath = filepath
+        with open(indexPath, "rb") as index_file:
+            header = index_file.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                raise ValueError(indexPath + " is not a complaint ID index")
+            magic, version, self.csvSize, self.csvMtime, count = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                raise ValueError(indexPath + " is not a complaint ID index")
+            self.ids = array("q")
+            self.ids.fromfile(index_file, count)
+            self.offsets = array("q")
+            self.offsets.fromfile(index_file, count)
+        self._data_file = None
+        self._extract = None
+
+    def is_stale(self):
+        """returns True if the CSV file's size or modification time differ from when the index was built"""
+        stat = os.stat(self.filepath)
+        return stat.st_size != self.csvSize or stat.st_mtime_ns != self.csvMtime
+
+    def close(self):
+        if self._data_file is not None:
+            self._data_file.close()
+            self._data_file = None
+
+    def _offset_of(self, complaintID):
+        """helper function returning the byte offset of complaintID's record, or None"""
+        if not isinstance(complaintID, int):
+            """as in a dictionary keyed by int IDs, any other key (e.g. None or "12x") is simply not found"""
+            return None
+        position = bisect_left(self.ids, complaintID)
+        if position < len(self.ids) and self.ids[position] == complaintID:
+            return self.offsets[position]
+        return None
+
+    def _read_at(self, offset):
+        """helper function reading and building the Complaint whose record starts at offset"""
+        if self._data_file is None:
+            self._data_file = open(self.filepath, "rb")
+            """the heading is read once, when the file is opened, to map its columns to slots"""
+            offset0, heading = next(_records(self._data_file))
+            self._extract = compile_schema(_decode_record(heading), self.filepath)
+        self._data_file.seek(offset)
+        offset, record = next(_records(self._data_file))
+        row = _decode_record(record)
+        if self._extract is not None:
+            row = self._extract(row)
+        return makeComplaint(row)
+
+    def get(self, complaintID, default=None):
+        offset = self._offset_of(complaintID)
+        if offset is None:
+            return default
+        return self._read_at(offset)
+
+    def get_many(self, complaintIDs):
+        """
+        Looks up many IDs at once, reading their records in file order.
+        :param complaintIDs: iterable of integer complaint IDs
+        :return: A dictionary mapping each ID found to its Complaint
+        """
+        wanted = []
+        for complaintID in set(complaintIDs):
+            offset = self._offset_of(complaintID)
+            if offset is not None:
+                wanted.append((offset, complaintID))
+        wanted.sort()
+        return {complaintID: self._read_at(offset) for offset, complaintID in wanted}
+
+    def __getitem__(self, complaintID):
+        complaint = self.get(complaintID)
+        if complaint is None:
+            raise KeyError(complaintID)
+        return complaint
+
+    def __contains__(self, complaintID):
+        return self._offset_of(complaintID) is not None
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,111 @@
+"""
+Name: incremental_ingest.py
+Author: Ari Bernstein
+Description: Merges new complaint CSV files (e.g. daily deliveries) into a ComplaintTable that has already been read.
+-upsert_complaints adds rows, or replaces the rows with the same Complaint_ID, and updates the table's cached
+ ComplaintIndex, ComplaintStatistics and phrase/narrative indexes in place instead of rebuilding them
+-merge_complaint_file does the same for every row of a CSV file, so a refresh only reads the new file
+Pre-condition: utilities.py, complaint_table.py, complaint_index.py, complaint_statistics.py and narrative_search.py
+work correctly and are in same directory, csv files are in subdirectory labeled 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from complaint_index import *
+from complaint_statistics import *
+from narrative_search import *
+import instrumentation
+
+"""Cached structures upsert_complaints keeps up to date; anything else in a table's cache is dropped"""
+UPDATED_CACHES = ("index", "statistics", "phrases", "narratives")
+
+
+def upsert_complaints(table, rows):
+    """
+    Adds rows to a ComplaintTable, replacing the row already holding the same Complaint_ID if there is one (the last
+    row wins, as in read_complaint_data). The table's ComplaintIndex, ComplaintStatistics and ProductPhraseIndex, if
+    it has them, are updated row by row. Its NarrativeIndex is extended with new narratives, but dropped (to be built
+    again when next needed) if an existing narrative changed.
+
+    A replaced complaint that moves to another company, product or state is listed last in its new groups of the
+    index (and keeps its place in the groups it stays in), where building the index again would list it at its row's
+    position. Removals from the index and phrase index are compacted once, after the last row.
+
+    :param table: a ComplaintTable, e.g. from cached_read_complaint_table
+    :param rows: iterable of rows, each a sequence of strings in Complaint._slots order (see iter_complaint_rows)
+    :return: the number of complaints added and the number replaced
+    """
+    cache = table.cache
+    for key in list(cache):
+        if key not in UPDATED_CACHES:
+            del cache[key]
+    index = cache.get("index")
+    stats = cache.get("statistics")
+    phrases = cache.get("phrases")
+    narratives = cache.get("narratives")
+
+    added = 0
+    updated = 0
+    for row in rows:
+        position, previous = table.upsert(row)
+        complaintID = table.ids[position]
+        values = dict(zip(SLOT_NAMES, row))
+        if previous is None:
+            added += 1
+        else:
+            updated += 1
+            previous = dict(zip(SLOT_NAMES, previous))
+
+        if index is not None:
+            if previous is None:
+                index.add(complaintID, values["Company"], values["Product"], values["State"])
+            elif (previous["Company"], previous["Product"], previous["State"]) != \
+                    (values["Company"], values["Product"], values["State"]):
+                index.remove(complaintID, previous["Company"], previous["Product"], previous["State"])
+                index.add(complaintID, values["Company"], values["Product"], values["State"])
+        if stats is not None:
+            stats.update(previous, values)
+        if phrases is not None:
+            phrases.update(position, complaintID, previous, values)
+        if narratives is not None:
+            text = values[narratives.field]
+            if previous is None:
+                if text != "":
+                    narratives.add(complaintID, text)
+            elif previous[narratives.field] != text:
+                narratives = None
+                del cache["narratives"]
+    if index is not None:
+        index.compact()
+    if phrases is not None:
+        phrases.compact()
+    return added, updated
+
+
+def merge_complaint_file(table, filepath, where=None):
+    """
+    Reads a CSV file of new or updated complaints into an existing ComplaintTable (see upsert_complaints). Only the
+    new file is read; the table's cached indexes and statistics are updated rather than rebuilt. Every column is
+    read: a replaced row takes all of its values from the new file, so a projected row would blank the others.
+
+    :param table: a ComplaintTable
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param where: optional row predicates, see read_complaint_data
+
+    :return: the number of complaints added and the number replaced
+
+    printed output: a message at the start of merging; the number of new, updated and total entries; elapsed time;
+    and a message at the end of merging.
+    """
+    instrumentation.progress("Merging " + filepath)
+
+    with instrumentation.span("merge_complaint_file", bytesRead=instrumentation.file_size(filepath)) as merging:
+        added, updated = upsert_complaints(table, iter_complaint_rows(filepath, where=where))
+        merging.rows = added + updated
+
+    instrumentation.progress("New entries: " + str(added))
+    instrumentation.progress("Updated entries: " + str(updated))
+    instrumentation.progress("Total entries: " + str(len(table)))
+    instrumentation.progress("Time elapsed: " + str(merging.seconds) + " seconds.")
+    instrumentation.progress("Merge complete.")
+    return added, updated
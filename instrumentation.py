@@ -0,0 +1,357 @@
+"""
+Name: instrumentation.py
+Author: Ari Bernstein
+Description: Timing and profiling spans for the complaint tools.
+-span(name) is a context manager timing one stage (reading a file, building a map, printing a report, ...); the code
+ inside may note on the span the number of rows and bytes it processed
+-instrumented does the same for every call of a function, as a decorator
+-enable_instrumentation starts recording each span: wall time, rows per second, bytes read and, for the stages
+ chosen, the peak memory allocated (tracemalloc) and a cProfile profile. disable_instrumentation stops recording.
+ While recording is off (the default), a span only reads the clock twice and decorated functions are called directly.
+-instrumentation_summary adds up the records per stage; export_instrumentation writes records and summary as JSON
+-progress and report_read print the messages of the readers ("Reading ...", "Total entries: ...", "Time elapsed: ...",
+ "Reading complete."), unless set_progress(False) turned them off
+Environment variables, read when this module is first imported:
+ COMPLAINTS_INSTRUMENTATION=path.json records every span and writes the JSON file when the program exits;
+ COMPLAINTS_PROFILE and COMPLAINTS_TRACEMALLOC name the stages (comma separated) to profile and trace;
+ COMPLAINTS_QUIET=1 turns the progress messages off.
+Pre-condition: none
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+"""Number of functions listed in the profile of a record, by cumulative time"""
+PROFILE_LINES = 25
+
+_enabled = False
+_progress = True
+_records = []
+_profileStages = frozenset()
+_traceStages = frozenset()
+_profileDirectory = None
+_origin = time.perf_counter()
+_local = threading.local()
+_lock = threading.Lock()
+"""CPython runs one profiler at a time, so a profiled stage inside another one is not profiled again"""
+_profiling = False
+
+
+class Span:
+    """
+    One timed stage. 'rows' and 'bytesRead' may be set by the code inside the span, e.g. to the number of complaints
+    read and the size of the file; 'seconds' is set when the span ends, and 'peakBytes' too if the stage is traced.
+    """
+    __slots__ = ("name", "rows", "bytesRead", "seconds", "peakBytes", "parent", "_start", "_recording",
+                 "_profiler", "_traced", "_startedTracing", "_startMemory", "_childPeak")
+
+    def __init__(self, name, rows=None, bytesRead=None):
+        self.name = name
+        self.rows = rows
+        self.bytesRead = bytesRead
+        self.seconds = None
+        self.peakBytes = None
+        self.parent = None
+        self._recording = False
+
+    def __enter__(self):
+        if _enabled:
+            self._recording = True
+            _open(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self.seconds = time.perf_counter() - self._start
+        if self._recording:
+            _close(self, exceptionType is not None)
+        return False
+
+
+def span(name, rows=None, bytesRead=None):
+    """
+    Times a stage: with span("read_complaint_data", bytesRead=size) as reading: ...; reading.rows = count
+    :param name: name of the stage; records of spans with the same name are added up by instrumentation_summary
+    :param rows: number of rows processed, if already known
+    :param bytesRead: number of bytes read, if already known
+    :return: a Span, to use in a with statement
+    """
+    return Span(name, rows, bytesRead)
+
+
+def _length(value):
+    """helper function to instrumented, the number of complaints of a dataset, or None if it has no length"""
+    if isinstance(value, str):
+        """a path name, whose rows are not known before reading"""
+        return None
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def instrumented(name=None, countRows=False):
+    """
+    Decorator timing every call of a function as a span.
+    :param name: name of the stage (default: the function's name)
+    :param countRows: if True, the span's rows are the length of the first argument (e.g. the dataset)
+    """
+    def decorate(function):
+        stage = function.__name__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(stage) as timer:
+                if countRows and args:
+                    timer.rows = _length(args[0])
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def file_size(filepath):
+    """helper function returning the size in bytes of a file, or None if it can't be read"""
+    try:
+        return os.path.getsize(filepath)
+    except (OSError, TypeError):
+        return None
+
+
+def _stack():
+    """helper function returning the spans open in the current thread, innermost last"""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _traced_parent(timer):
+    """helper function returning the innermost traced span enclosing a span, or None"""
+    parent = timer.parent
+    while parent is not None and not parent._traced:
+        parent = parent.parent
+    return parent
+
+
+def _open(timer):
+    """helper function to Span, starts the profiler and tracemalloc for the stages chosen"""
+    global _profiling
+    stack = _stack()
+    timer.parent = stack[-1] if stack else None
+    stack.append(timer)
+
+    timer._traced = timer.name in _traceStages
+    timer._startedTracing = False
+    if timer._traced:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            timer._startedTracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        """the peak so far belongs to the enclosing traced span, which would lose it to reset_peak"""
+        parent = _traced_parent(timer)
+        if parent is not None:
+            parent._childPeak = max(parent._childPeak, peak)
+        tracemalloc.reset_peak()
+        timer._startMemory = current
+        timer._childPeak = current
+
+    timer._profiler = None
+    if timer.name in _profileStages:
+        with _lock:
+            if not _profiling:
+                _profiling = True
+                timer._profiler = cProfile.Profile()
+        if timer._profiler is not None:
+            timer._profiler.enable()
+
+
+def _profile_lines(profiler):
+    """helper function listing the functions of a profile taking the most cumulative time"""
+    stats = pstats.Stats(profiler).stats
+    lines = []
+    for (filename, line, function), (primitiveCalls, calls, own, cumulative, callers) in stats.items():
+        lines.append({"function": function + " (" + os.path.basename(filename) + ":" + str(line) + ")",
+                      "calls": calls, "seconds": own, "cumulative_seconds": cumulative})
+    lines.sort(key=lambda entry: entry["cumulative_seconds"], reverse=True)
+    return lines[:PROFILE_LINES]
+
+
+def _close(timer, failed):
+    """helper function to Span, stops the profiler and tracemalloc and records the span"""
+    global _profiling
+    profile = None
+    if timer._profiler is not None:
+        timer._profiler.disable()
+        profile = _profile_lines(timer._profiler)
+        if _profileDirectory is not None:
+            os.makedirs(_profileDirectory, exist_ok=True)
+            profilePath = os.path.join(_profileDirectory, timer.name + "-" + str(len(_records)) + ".prof")
+            timer._profiler.dump_stats(profilePath)
+        timer._profiler = None
+        with _lock:
+            _profiling = False
+
+    if timer._traced:
+        peak = max(tracemalloc.get_traced_memory()[1], timer._childPeak)
+        timer.peakBytes = peak - timer._startMemory
+        parent = _traced_parent(timer)
+        if parent is not None:
+            parent._childPeak = max(parent._childPeak, peak)
+        if timer._startedTracing:
+            tracemalloc.stop()
+
+    stack = _stack()
+    if stack and stack[-1] is timer:
+        stack.pop()
+    elif timer in stack:
+        """a generator's span may end after the spans opened while it was suspended"""
+        stack.remove(timer)
+
+    record = {"name": timer.name, "parent": None if timer.parent is None else timer.parent.name,
+              "thread": threading.current_thread().name, "start": timer._start - _origin,
+              "seconds": timer.seconds, "failed": failed}
+    if timer.rows is not None:
+        record["rows"] = timer.rows
+        record["rows_per_second"] = timer.rows / timer.seconds if timer.seconds > 0 else None
+    if timer.bytesRead is not None:
+        record["bytes"] = timer.bytesRead
+        record["bytes_per_second"] = timer.bytesRead / timer.seconds if timer.seconds > 0 else None
+    if timer.peakBytes is not None:
+        record["peak_bytes"] = timer.peakBytes
+    if profile is not None:
+        record["profile"] = profile
+    _records.append(record)
+
+
+def enable_instrumentation(profile=(), trace=(), profileDirectory=None):
+    """
+    Starts recording every span, forgetting the records of an earlier recording.
+    :param profile: names of the stages to run under cProfile, e.g. ("compute_statistics",)
+    :param trace: names of the stages whose peak memory allocation is measured with tracemalloc
+    :param profileDirectory: optional directory each profile is also written to, as a .prof file for pstats
+    """
+    global _enabled, _profileStages, _traceStages, _profileDirectory, _origin
+    _profileStages = frozenset(profile)
+    _traceStages = frozenset(trace)
+    _profileDirectory = profileDirectory
+    _origin = time.perf_counter()
+    del _records[:]
+    _enabled = True
+
+
+def disable_instrumentation():
+    """stops recording spans; the records so far are kept"""
+    global _enabled
+    _enabled = False
+
+
+def instrumentation_enabled():
+    """returns True while spans are recorded"""
+    return _enabled
+
+
+def instrumentation_records():
+    """
+    returns the list of records of the spans that ended, in the order they ended. Each is a dictionary with "name",
+    "parent" (name of the enclosing span or None), "thread", "start" and "seconds" (since enable_instrumentation),
+    "failed", and when known "rows", "rows_per_second", "bytes", "bytes_per_second", "peak_bytes" and "profile"
+    """
+    return list(_records)
+
+
+def instrumentation_summary(records=None):
+    """
+    Adds up records per stage.
+    :param records: list of records (default: instrumentation_records())
+    :return: A dictionary mapping each stage name, in the order they first ended, to a dictionary with "calls",
+    "seconds" (total), "rows" and "bytes" (totals, if any span noted them), "rows_per_second", "bytes_per_second",
+    "peak_bytes" (largest) and "failed" (number of spans ended by an exception)
+    """
+    if records is None:
+        records = instrumentation_records()
+    summary = {}
+    for record in records:
+        stage = summary.setdefault(record["name"], {"calls": 0, "seconds": 0.0, "failed": 0})
+        stage["calls"] += 1
+        stage["seconds"] += record["seconds"]
+        stage["failed"] += record["failed"]
+        for key in ("rows", "bytes"):
+            if key in record:
+                stage[key] = stage.get(key, 0) + record[key]
+        if "peak_bytes" in record:
+            stage["peak_bytes"] = max(stage.get("peak_bytes", 0), record["peak_bytes"])
+    for stage in summary.values():
+        for key in ("rows", "bytes"):
+            if key in stage:
+                stage[key + "_per_second"] = stage[key] / stage["seconds"] if stage["seconds"] > 0 else None
+    return summary
+
+
+def export_instrumentation(filepath):
+    """writes the records and their summary to a JSON file, {"records": [...], "summary": {...}}"""
+    records = instrumentation_records()
+    with open(filepath, "w") as json_file:
+        json.dump({"records": records, "summary": instrumentation_summary(records)}, json_file, indent=2)
+
+
+def print_instrumentation_summary():
+    """printed output: one line per stage with its calls, total time, rows per second and peak memory"""
+    for name, stage in instrumentation_summary().items():
+        line = (name.ljust(32) + str(stage["calls"]).rjust(6) + " calls" +
+                '{:.4f}'.format(stage["seconds"]).rjust(12) + " s")
+        if stage.get("rows_per_second") is not None:
+            line += '{:,.0f}'.format(stage["rows_per_second"]).rjust(14) + " rows/s"
+        if "peak_bytes" in stage:
+            line += '{:.1f}'.format(stage["peak_bytes"] / 2 ** 20).rjust(10) + " MiB peak"
+        print(line)
+
+
+def set_progress(enabled):
+    """turns the messages printed by progress and report_read on or off"""
+    global _progress
+    _progress = enabled
+
+
+def progress(message):
+    """prints a progress message of the readers, unless set_progress(False) turned them off"""
+    if _progress:
+        print(message)
+
+
+def report_read(timer, entries):
+    """
+    Prints the messages ending a read, unless set_progress(False) turned them off
+    :param timer: the ended Span of the read, giving the elapsed time
+    :param entries: number of entries read
+    """
+    if _progress:
+        print("Total entries: " + str(entries))
+        print("Time elapsed: " + str(timer.seconds) + " seconds.")
+        print("Reading complete.")
+
+
+def _stage_names(variable):
+    """helper function reading a comma separated list of stage names from an environment variable"""
+    return [name.strip() for name in os.environ.get(variable, "").split(",") if name.strip() != ""]
+
+
+def _configure_from_environment():
+    """helper function applying the environment variables described at the top of this file"""
+    if os.environ.get("COMPLAINTS_QUIET", "") not in ("", "0"):
+        set_progress(False)
+    output = os.environ.get("COMPLAINTS_INSTRUMENTATION")
+    if output:
+        enable_instrumentation(_stage_names("COMPLAINTS_PROFILE"), _stage_names("COMPLAINTS_TRACEMALLOC"))
+        atexit.register(export_instrumentation, output)
+
+
+_configure_from_environment()
@@ -0,0 +1,237 @@
+"""
+Name: mapped_reader.py
+Author: Ari Bernstein
+Description: Memory-mapped, zero-copy access to complaint CSV files.
+-MappedComplaintFile maps a CSV file into memory and scans it once, recording only where each record and field
+ starts. Field values are decoded from the mapped bytes when they are asked for, so a report that only needs the
+ State column (e.g. list_state_complaints) never builds a string for any other field, narratives included.
+ As in read_complaint_data, a Complaint_ID appearing more than once is one complaint, held by its last record.
+Pre-condition: utilities.py and complaint_table.py work correctly and are in same directory, csv files are in
+subdirectory labeled 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from itertools import repeat
+import csv
+import io
+import locale
+import mmap
+import operator
+import os
+import re
+
+SLOT_INDEX = {name: i for i, name in enumerate(Complaint._slots)}
+FIELD_COUNT = len(SLOT_INDEX)
+
+"""One field: quoted ("" is an escaped quote, line breaks are allowed) or unquoted"""
+_FIELD = rb'("[^"]*(?:""[^"]*)*"|[^,\r\n]*)'
+_LINE_END = rb'(?:\r\n|\n|\r|\Z)'
+
+"""A whole record, one group per field, so a single match gives the offsets of every field"""
+_RECORD = re.compile(b",".join([_FIELD] * FIELD_COUNT) + _LINE_END)
+_HEADING = re.compile(rb'(?:' + _FIELD + rb',)*' + _FIELD + _LINE_END)
+
+_start = operator.itemgetter(0)
+
+
+def _record_pattern(width):
+    """helper function returning the record regex for files with 'width' columns"""
+    if width == FIELD_COUNT:
+        return _RECORD
+    return re.compile(b",".join([_FIELD] * width) + _LINE_END)
+
+
+class MappedComplaintFile(Mapping):
+    """
+    Read-only, memory-mapped view of a CSV data file. Behaves like the dictionary returned by read_complaint_data
+    (integer complaint ID -> Complaint, building each Complaint when it is looked up), and gives access to single
+    fields and whole columns without decoding the rest of the row.
+
+    Columns are matched to slots by their heading names (see heading_columns), so the file may have its columns in
+    any order, and extra or missing ones; a slot the file doesn't have reads as an empty string. 'width' is the
+    number of columns in the file. For each record, 'recordStarts' holds its byte offset and 'fieldStarts' holds
+    width + 1 offsets relative to it: where each column starts, then one past the end of the last column. Column i
+    ends one byte (the comma) before column i + 1 starts.
+
+    A Complaint_ID appearing in more than one record is one complaint, whose values are those of its last record, as
+    in read_complaint_data; columns, counts and groups only look at those records (see records).
+    """
+
+    def __init__(self, filepath, encoding=None):
+        self.filepath = filepath
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        require_uncompressed(filepath, "MappedComplaintFile")
+        self._file = open(filepath, "rb")
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._map = b""
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.recordStarts = array("Q")
+        self.fieldStarts = array("I")
+        self._rowOfID = None
+        self._records = None
+        self._scan()
+
+    def _scan(self):
+        """helper function to the constructor, records the offsets of every field of every record after the heading"""
+        data = self._map
+        size = len(data)
+        position = _HEADING.match(data).end()
+        if position == 0:
+            """empty file"""
+            self.columns = tuple(range(FIELD_COUNT))
+            self.width = FIELD_COUNT
+        else:
+            text = io.StringIO(data[:position].decode(self.encoding), newline=None)
+            heading = next(csv.reader(text, delimiter = ","))
+            self.columns = heading_columns(heading, self.filepath)
+            self.width = len(heading)
+        width = self.width
+        match = _record_pattern(width).match
+        recordStarts = self.recordStarts
+        fieldStarts = self.fieldStarts
+        while position < size:
+            record = match(data, position)
+            if record is None:
+                raise ValueError(self.filepath + ": record at byte " + str(position) +
+                                 " is malformed or does not have " + str(width) + " fields")
+            recordStarts.append(position)
+            """start of each field (group) relative to the record, then one past the end of the last field"""
+            fieldStarts.extend(map(operator.sub, map(_start, record.regs[1:]), repeat(position)))
+            fieldStarts.append(record.end(width) - position + 1)
+            position = record.end()
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def raw_field(self, row, name):
+        """returns the bytes of a field, as stored in the file (quotes included), without decoding them"""
+        column = self.columns[SLOT_INDEX[name]]
+        if column is None:
+            return b""
+        base = self.recordStarts[row]
+        i = row * (self.width + 1) + column
+        return self._map[base + self.fieldStarts[i]:base + self.fieldStarts[i + 1] - 1]
+
+    def decode(self, raw):
+        """converts the bytes of a field to the string csv.reader would produce"""
+        if raw.startswith(b'"'):
+            raw = raw[1:-1].replace(b'""', b'"')
+        value = raw.decode(self.encoding)
+        if "\r" in value:
+            value = value.replace("\r\n", "\n").replace("\r", "\n")
+        return value
+
+    def field(self, row, name):
+        """returns the value of slot 'name' in a given row, decoding only that field"""
+        return self.decode(self.raw_field(row, name))
+
+    def records(self):
+        """
+        returns the record numbers of the complaints: for each Complaint_ID its last record, in the order the IDs
+        first occur (the order of the dictionary from read_complaint_data)
+        """
+        if self._records is None:
+            rowOfID = self._ids()
+            if len(rowOfID) == len(self.recordStarts):
+                """no ID appears twice: every record, in file order"""
+                self._records = range(len(self.recordStarts))
+            else:
+                self._records = array("Q", rowOfID.values())
+        return self._records
+
+    def column(self, name):
+        """generator of the decoded values of slot 'name', one per complaint, in the order of records"""
+        for row in self.records():
+            yield self.field(row, name)
+
+    def count_values(self, *names):
+        """
+        Counts the complaints sharing the values of one or more slots, decoding only the distinct values.
+        :param names: one or more slot names, e.g. "State" or "Company", "Product"
+        :return: A dictionary mapping each value of the first slot to a dictionary for the next slot, and so on, ending
+        in the number of complaints. Keys appear in the order they first occur among the complaints. As in
+        read_complaint_data, a Complaint_ID appearing more than once is counted once, with its last record's values.
+        """
+        rows = self.records()
+        raw = self.raw_field
+        if len(names) == 1:
+            counts = Counter((raw(row, names[0]),) for row in rows)
+        else:
+            counts = Counter(tuple(raw(row, name) for name in names) for row in rows)
+        """the same value may be stored both quoted and unquoted, so counts are added up after decoding"""
+        result = {}
+        for values in counts:
+            level = result
+            for value in values[:-1]:
+                value = self.decode(value)
+                if value not in level:
+                    level[value] = {}
+                level = level[value]
+            value = self.decode(values[-1])
+            level[value] = level.get(value, 0) + counts[values]
+        return result
+
+    def group_rows(self, name):
+        """
+        Groups the complaints by the value of one slot, decoding each distinct value once.
+        :param name: slot name, e.g. "State"
+        :return: A dictionary mapping each value to ComplaintRows of the records holding it (see complaint_table.py),
+        so a Complaint is only built when shown. Keys appear in the order they first occur among the complaints.
+        """
+        raw = self.raw_field
+        """the same value may be stored both quoted and unquoted, so records are grouped by decoded value"""
+        decoded = {}
+        groups = {}
+        for row in self.records():
+            rawValue = raw(row, name)
+            value = decoded.get(rawValue)
+            if value is None:
+                value = decoded[rawValue] = self.decode(rawValue)
+            group = groups.get(value)
+            if group is None:
+                group = groups[value] = array("Q")
+            group.append(row)
+        return {value: ComplaintRows(self, rows) for value, rows in groups.items()}
+
+    def row(self, row):
+        """builds the Complaint object for a given record number"""
+        return makeComplaint([self.field(row, name) for name in SLOT_INDEX])
+
+    def _ids(self):
+        """
+        helper function returning a dictionary mapping each complaint ID to its (last) record number, built on first
+        use by decoding only the Complaint_ID column
+        """
+        if self._rowOfID is None:
+            field = self.field
+            self._rowOfID = {int(field(row, "Complaint_ID")): row for row in range(len(self.recordStarts))}
+        return self._rowOfID
+
+    def row_of(self, complaintID):
+        """returns the record number holding complaintID (the last one, if it appears more than once), or None"""
+        return self._ids().get(complaintID)
+
+    def __getitem__(self, complaintID):
+        row = self.row_of(complaintID)
+        if row is None:
+            raise KeyError(complaintID)
+        return self.row(row)
+
+    def __iter__(self):
+        return iter(self._ids())
+
+    def __len__(self):
+        return len(self._ids())
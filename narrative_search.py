@@ -0,0 +1,226 @@
+"""
+Name: narrative_search.py
+Author: Ari Bernstein
+Description: Full-text search over the Consumer_complaint_narrative slot.
+-NarrativeIndex is an inverted index recording, for every word, the complaints whose narrative contains it and the
+ word's positions within each narrative
+-search supports single words, prefixes (e.g. foreclos*) and quoted phrases (e.g. "late fee"), and ranks the
+ complaints found with BM25
+-print_search_results pretty prints the best matches with display_complaint
+Pre-condition: utilities.py, complaint_table.py and display_complaints.py work correctly and are in same directory,
+csv files are in subdirectory labeled 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from display_complaints import *
+from array import array
+from bisect import bisect_left
+import heapq
+import instrumentation
+import math
+import re
+
+"""BM25 parameters: term frequency saturation and narrative length normalization"""
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+"""A query clause is a quoted phrase, a word ending in * (prefix), or a plain word"""
+_CLAUSE = re.compile(r'"([^"]*)"|(\w+)\*|(\w+)')
+
+
+class NarrativeIndex:
+    """
+    Positional inverted index of complaint narratives. 'postings' maps each lower case word to a dictionary mapping
+    the position of each complaint using it (in dataset order) to an array of the word's offsets in that narrative.
+    Complaints with an empty narrative are not indexed.
+    """
+
+    def __init__(self, dataset, field="Consumer_complaint_narrative"):
+        self.field = field
+        self.ids = array("q")
+        self.lengths = array("I")
+        self.postings = {}
+        self._sortedWords = None
+
+        if hasattr(dataset, "column"):
+            """ComplaintTable: read the narratives without building each Complaint"""
+            documents = zip(dataset.ids, dataset.column(field))
+        else:
+            documents = ((complaintID, getattr(dataset[complaintID], field)) for complaintID in dataset)
+        for complaintID, text in documents:
+            if text != "":
+                self.add(complaintID, text)
+
+    def add(self, complaintID, text):
+        """indexes one narrative"""
+        document = len(self.ids)
+        words = phrase_tokens(text)
+        self.ids.append(complaintID)
+        self.lengths.append(len(words))
+        postings = self.postings
+        for offset, word in enumerate(words):
+            documents = postings.get(word)
+            if documents is None:
+                documents = postings[word] = {}
+                self._sortedWords = None
+            offsets = documents.get(document)
+            if offsets is None:
+                offsets = documents[document] = array("I")
+            offsets.append(offset)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def average_length(self):
+        if len(self.lengths) == 0:
+            return 0
+        return sum(self.lengths) / len(self.lengths)
+
+    def words_with_prefix(self, prefix):
+        """returns every indexed word starting with prefix, using a sorted word list built on first use"""
+        if self._sortedWords is None:
+            self._sortedWords = sorted(self.postings)
+        words = []
+        start = bisect_left(self._sortedWords, prefix)
+        for word in self._sortedWords[start:]:
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        return words
+
+    def phrase_matches(self, words):
+        """
+        Finds the narratives containing words consecutively.
+        :param words: list of lower case words
+        :return: A dictionary mapping each matching document position to the number of times the phrase occurs
+        """
+        if words == []:
+            return {}
+        postingLists = [self.postings.get(word) for word in words]
+        if None in postingLists:
+            return {}
+        """start from the rarest word's documents"""
+        documents = set(min(postingLists, key=len))
+        for documentsOfWord in postingLists:
+            documents.intersection_update(documentsOfWord)
+
+        matches = {}
+        for document in documents:
+            starts = set(postingLists[0][document])
+            for shift in range(1, len(words)):
+                starts.intersection_update(offset - shift for offset in postingLists[shift][document])
+                if not starts:
+                    break
+            if starts:
+                matches[document] = len(starts)
+        return matches
+
+    def _term_frequencies(self, clause):
+        """helper function to search, returns {document: frequency} for one parsed query clause"""
+        kind, text = clause
+        if kind == "phrase":
+            return self.phrase_matches(phrase_tokens(text))
+        if kind == "prefix":
+            frequencies = {}
+            for word in self.words_with_prefix(text):
+                for document, offsets in self.postings[word].items():
+                    frequencies[document] = frequencies.get(document, 0) + len(offsets)
+            return frequencies
+        return {document: len(offsets) for document, offsets in self.postings.get(text, {}).items()}
+
+    def search(self, query, limit=10, mode="or"):
+        """
+        Ranks narratives against a query with BM25.
+        :param query: words, prefixes ending in * and quoted phrases, e.g. 'foreclos* "loan modification" bank'
+        :param limit: maximum number of results
+        :param mode: "or" to return narratives matching any clause, "and" for narratives matching every clause
+        :return: list of (complaint ID, score) pairs, best first
+        """
+        clauses = parse_query(query)
+        if clauses == [] or len(self.ids) == 0:
+            return []
+        total = len(self.ids)
+        averageLength = self.average_length()
+        scores = {}
+        matched = {}
+        for clause in clauses:
+            frequencies = self._term_frequencies(clause)
+            idf = math.log(1 + (total - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            for document, frequency in frequencies.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[document] / averageLength)
+                scores[document] = scores.get(document, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                matched[document] = matched.get(document, 0) + 1
+        if mode == "and":
+            scores = {document: score for document, score in scores.items() if matched[document] == len(clauses)}
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.ids[document], score) for document, score in best]
+
+
+def parse_query(query):
+    """
+    Splits a search query into clauses
+    :param query: string, e.g. 'foreclos* "loan modification" bank'
+    :return: list of (kind, text) pairs where kind is "phrase", "prefix" or "word", e.g.
+    [("prefix", "foreclos"), ("phrase", "loan modification"), ("word", "bank")]
+    """
+    clauses = []
+    for phrase, prefix, word in _CLAUSE.findall(query.lower()):
+        if phrase.strip() != "":
+            clauses.append(("phrase", phrase))
+        elif prefix != "":
+            clauses.append(("prefix", prefix))
+        elif word != "":
+            clauses.append(("word", word))
+    return clauses
+
+
+def narrative_index(dataset):
+    """
+    Returns the NarrativeIndex of a dataset, kept in the cache of a ComplaintTable so it is only built once.
+    :param dataset: dictionary of complaints from read_complaint_data, or a ComplaintTable
+    """
+    cache = getattr(dataset, "cache", None)
+    if cache is None:
+        return NarrativeIndex(dataset)
+    if "narratives" not in cache:
+        cache["narratives"] = NarrativeIndex(dataset)
+    return cache["narratives"]
+
+
+def print_search_results(dataset, query, index=None, limit=10):
+    """
+    Searches the narratives of a dataset and pretty prints the best matches
+    :param dataset: dictionary of complaints from read_complaint_data, or a ComplaintTable
+    :param query: see NarrativeIndex.search
+    :param index: NarrativeIndex of the dataset (built if not given)
+    :param limit: maximum number of complaints to print
+    :return: list of (complaint ID, score) pairs printed
+    printed output: "no narratives match" or, for each match, a line with its rank and score and the complaint
+    """
+    if index is None:
+        index = narrative_index(dataset)
+    results = index.search(query, limit)
+    if results == []:
+        print(query + ": no narratives match.")
+    for rank, (complaintID, score) in enumerate(results):
+        print('[ ' + str(rank + 1) + ' ]  score ' + '{:.3f}'.format(score) + "  ==============================")
+        display_complaint(dataset[complaintID])
+        print('\n')
+    return results
+
+
+def main():
+    complaints = read_complaint_table(getFilePath())
+    with instrumentation.span("narrative_index", rows=len(complaints)) as indexing:
+        index = narrative_index(complaints)
+    instrumentation.progress("Indexed " + str(len(index)) + " narratives in " + str(indexing.seconds) + " seconds.")
+
+    query = input("Enter search words, prefix* or \"phrase\" or press ENTER key to stop: ")
+    while query != "":
+        print_search_results(complaints, query, index)
+        query = input("Enter search words, prefix* or \"phrase\" or press ENTER key to stop: ")
+
+
+if __name__ == '__main__':
+    main()
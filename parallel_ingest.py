@@ -0,0 +1,201 @@
+"""
+Name: parallel_ingest.py
+Author: Ari Bernstein
+Description: Reads complaint CSV files with several processes at once.
+-find_record_boundaries splits a file into byte ranges that start and end on whole records. A newline only ends a
+ record if it is outside quotes, so the multi-line Consumer_complaint_narrative fields (see LongLines1.csv) are never
+ cut in half.
+-read_complaint_data_parallel / read_complaint_table_parallel parse those ranges in a process pool and merge the
+ results, in file order, into the same structures as read_complaint_data / read_complaint_table. Compressed files
+ can't be split, and are read by read_complaint_data / read_complaint_table instead.
+Pre-condition: utilities.py and complaint_table.py work correctly and are in same directory, csv files are in
+subdirectory labeled 'data'
+"""
+
+from utilities import *
+from complaint_table import *
+from multiprocessing import Pool
+import csv
+import instrumentation
+import io
+import locale
+import mmap
+import os
+
+"""Bytes read at a time while counting quote characters between boundaries"""
+SCAN_BLOCK_SIZE = 1 << 24
+
+
+def _count_quotes(mapped, start, end):
+    """helper function returning the number of double quote characters in mapped[start:end]"""
+    count = 0
+    while start < end:
+        blockEnd = min(start + SCAN_BLOCK_SIZE, end)
+        count += mapped[start:blockEnd].count(b'"')
+        start = blockEnd
+    return count
+
+
+def _next_record_end(mapped, start, position):
+    """
+    Helper function to find_record_boundaries. Returns the offset just past the first newline at or after position
+    that ends a record, i.e. that has an even number of quote characters between start (a record boundary) and itself.
+    An escaped quote ("") adds two, so only an unclosed quoted field leaves the count odd.
+    """
+    quotes = _count_quotes(mapped, start, position)
+    while True:
+        newline = mapped.find(b"\n", position)
+        if newline == -1:
+            return len(mapped)
+        quotes += _count_quotes(mapped, position, newline)
+        if quotes % 2 == 0:
+            return newline + 1
+        position = newline + 1
+
+
+def find_record_boundaries(filepath, chunks):
+    """
+    Splits a CSV file into roughly equal byte ranges that each hold whole records.
+
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param chunks: number of ranges wanted; fewer are returned for small files.
+
+    :return: A list of (start, end) byte offsets covering every record after the heading, in file order.
+    """
+    with open(filepath, "rb") as data_file:
+        size = os.fstat(data_file.fileno()).st_size
+        if size == 0:
+            return []
+        mapped = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = _next_record_end(mapped, 0, 0) # skips the heading row
+            boundaries = []
+            chunkSize = max(1, (size - start) // max(1, chunks))
+            while start < size:
+                end = size
+                if len(boundaries) < chunks - 1:
+                    end = _next_record_end(mapped, start, min(size, start + chunkSize))
+                boundaries.append((start, end))
+                start = end
+            return boundaries
+        finally:
+            mapped.close()
+
+
+def _read_chunk_rows(filepath, start, end):
+    """helper function returning the parsed rows of the records between two byte offsets of a CSV file"""
+    with open(filepath, "rb") as data_file:
+        data_file.seek(start)
+        data = data_file.read(end - start)
+    """decoded the same way open() does in read_complaint_data, with universal newlines"""
+    text = io.StringIO(data.decode(locale.getpreferredencoding(False)), newline=None)
+    return csv.reader(text, delimiter = ",")
+
+
+def _parse_rows(task):
+    """process pool worker: returns the rows of one byte range, in Complaint._slots order"""
+    filepath, start, end, columns, width = task
+    rows = _read_chunk_rows(filepath, start, end)
+    extract = compile_extractor(columns, width)
+    if extract is None:
+        return list(rows)
+    return [extract(row) for row in rows]
+
+
+def _parse_table(task):
+    """process pool worker: returns the rows of one byte range as a ComplaintTable"""
+    filepath, start, end, columns, width = task
+    extract = compile_extractor(columns, width)
+    table = ComplaintTable()
+    for row in _read_chunk_rows(filepath, start, end):
+        if extract is not None:
+            row = extract(row)
+        table.append(row)
+    return table
+
+
+def _pool_size(processes):
+    """helper function returning the number of worker processes to use (default: one per CPU)"""
+    if processes is None:
+        return os.cpu_count() or 1
+    return processes
+
+
+def _parallel_chunks(filepath, worker, processes, chunksPerProcess):
+    """helper function yielding the results of worker over every byte range of a file, in file order"""
+    with open(filepath) as csv_file:
+        heading = next(csv.reader(csv_file, delimiter = ","), [])
+    if heading == []:
+        """an empty file has no rows, as in iter_complaint_rows"""
+        return
+    """the column positions are sent to the workers, which each compile their own extractor"""
+    columns = heading_columns(heading, filepath)
+    tasks = [(filepath, start, end, columns, len(heading)) for start, end in
+             find_record_boundaries(filepath, processes * chunksPerProcess)]
+    with Pool(processes) as pool:
+        for result in pool.imap(worker, tasks):
+            yield result
+
+
+def read_complaint_data_parallel(filepath, processes=None, chunksPerProcess=4):
+    """
+    Parallel version of read_complaint_data: the file is split at record boundaries and each part is parsed by a
+    separate process. Rows are merged in file order, so the result is the same as read_complaint_data's.
+
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param processes: number of worker processes (default: one per CPU)
+    :param chunksPerProcess: the file is split into processes * chunksPerProcess parts, so that the merge in this
+    process overlaps with parsing in the workers
+
+    :return: A dictionary mapping integer complaint ID values to unique Complaint objects.
+
+    printed output: same as read_complaint_data.
+    """
+    processes = _pool_size(processes)
+    if processes == 1 or compression_of(filepath) is not None:
+        """nothing to overlap with a single process, splitting the file would only add work; a compressed file can
+        only be decompressed from its start, so it is read by one process (which decompresses in another thread)"""
+        return read_complaint_data(filepath)
+    complaintDict = {}
+
+    instrumentation.progress("Reading " + filepath)
+
+    fileSize = instrumentation.file_size(filepath)
+    with instrumentation.span("read_complaint_data_parallel", bytesRead=fileSize) as reading:
+        for rows in _parallel_chunks(filepath, _parse_rows, processes, chunksPerProcess):
+            for row in rows:
+                complaintDict[int(row[17])] = makeComplaint(row)
+        reading.rows = len(complaintDict)
+
+    instrumentation.report_read(reading, len(complaintDict))
+    return complaintDict
+
+
+def read_complaint_table_parallel(filepath, processes=None, chunksPerProcess=4):
+    """
+    Parallel version of read_complaint_table. Each worker builds a ComplaintTable for its part of the file; the
+    tables are compact to send between processes and are merged, in file order, with ComplaintTable.extend.
+
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param processes: number of worker processes (default: one per CPU)
+    :param chunksPerProcess: see read_complaint_data_parallel
+
+    :return: A ComplaintTable mapping integer complaint ID values to Complaint objects.
+
+    printed output: same as read_complaint_data.
+    """
+    processes = _pool_size(processes)
+    if processes == 1 or compression_of(filepath) is not None:
+        return read_complaint_table(filepath)
+    table = ComplaintTable()
+
+    instrumentation.progress("Reading " + filepath)
+
+    fileSize = instrumentation.file_size(filepath)
+    with instrumentation.span("read_complaint_table_parallel", bytesRead=fileSize) as reading:
+        for chunkTable in _parallel_chunks(filepath, _parse_table, processes, chunksPerProcess):
+            table.extend(chunkTable)
+        reading.rows = len(table)
+
+    instrumentation.report_read(reading, len(table))
+    return table
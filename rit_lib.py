@@ -31,6 +31,16 @@ for the name YOURCLASS
 
     YOURCLASS.__setattr__ = object.__setattr__
 
+For bulk construction of many objects from already-validated data (e.g.
+rows of a CSV file), use the trusted constructor instead, which skips
+the per-slot checks without turning them off for the class:
+
+    makeObj = YOURCLASS.rowMaker()
+    obj = makeObj( row )
+
+A class may also declare a real __slots__ alongside _slots, naming the
+same attributes, so that its instances do not carry a __dict__.
+
 """
 
 # Reasons for doing this:
@@ -144,11 +154,17 @@ class struct( object ):
         for struct
     """
 
+    # struct itself holds no instance attributes, so subclasses that
+    # declare a real __slots__ get objects without a __dict__.
+    #
+    __slots__ = ()
+
     # Initially the new class's slots may have some of its types
     # specified as strings. These need to be converted to real types.
     # The class-level boolean variable _typesScanned
     # indicates whether this class's type list has been scanned yet
-    # for str's. It's done in the instance constructor __init__.
+    # for str's. It's done in the instance constructor __init__
+    # (or in rowMaker).
     #
     _typesScanned = False
 
@@ -172,53 +188,7 @@ class struct( object ):
             raise TypeError( "struct itself may not be instantiated." )
 
         if not thisClass._typesScanned: # Do this upon FIRST instance creation.
-            # If __slots__ but no _slots, convert using type 'object'.
-            # or look for old, deprecated _types variable.
-            #
-            if "__slots__" in dir( thisClass ):
-                if "_slots" in dir( thisClass ):
-                    raise TypeError( "struct subclasses may not have " + \
-                                     "a '_slots' attribute declared if\n" + \
-                                     " the standard '__slots__' attribute " + \
-                                     "is present." )
-                slots = thisClass.__slots__
-                if not ( isinstance( slots, tuple ) or \
-                         isinstance( slots, list ) ):
-                    slots = ( slots, )
-
-                newSlots = []
-                if "_types" in dir( thisClass ):
-                    stderr.write( "struct warning: '_types' " + \
-                                  "variable is deprecated. (class " + \
-                                  className + ").\n" )
-                    types = thisClass._types
-                    if not ( isinstance( types, tuple ) or \
-                             isinstance( types, list ) ):
-                        types = ( types, )
-                    if len( types ) != len( slots ):
-                        raise TypeError(
-                               "No. of slots differs from no. of types" )
-                    for i in range( len( slots ) ):
-                        newSlots.append( ( types[ i ], slots[ i ] ) )
-                else:
-                    for attrName in thisClass.__slots__:
-                        newSlots.append( ( object, attrName ) )
-                thisClass._slots = tuple( newSlots )
-
-            if "_slots" not in dir( thisClass ):
-                raise TypeError( "struct subclasses must have " + \
-                                 "either a '_slots' or '__slots__' " + \
-                                 "attribute declared." )
-
-            # Do error checking and convert the _slots variable
-            # to a dictionary mapping each variable name to a set
-            # of types.
-            #
-            _normalizeSlotsConstruction( thisClass )
-
-            # The above code is only exectuted the first time an object is
-            # created from the new class.
-            thisClass._typesScanned = True
+            _scanSlots( thisClass )
 
         if len( kwargs ) != 0:
             # Make a copy of the slot dictionary so that it is easy to
@@ -256,6 +226,63 @@ class struct( object ):
                     setattr( self, key, args[ i ] )
                     i += 1
 
+    @classmethod
+    def rowMaker( cls, check=False ):
+        """ Return a function that builds a new instance of this class
+            from a single sequence of slot values, given in the same order
+            as the _slots declaration. This is the "trusted" constructor:
+            the values are stored without the per-slot type checks that
+            __init__ performs through __setattr__, and the sequence's
+            length is not checked (extra values are ignored).
+            It is meant for bulk construction where the caller has already
+            validated the data once, e.g. every field produced by
+            csv.reader is a str.
+
+            check: if True, the returned function type checks the new
+                   object once, after all slots are set (see checkTypes).
+
+            The function is generated once per class and cached.
+            Example:
+                makeStudent = Student.rowMaker()
+                students = [ makeStudent( row ) for row in rows ]
+        """
+        if not cls._typesScanned:
+            _scanSlots( cls )
+        maker = cls.__dict__.get( "_rowMakerFunction" )
+        if maker is None:
+            maker = _makeRowMaker( cls )
+            cls._rowMakerFunction = maker
+        if check:
+            def checkedMaker( values ):
+                obj = maker( values )
+                obj.checkTypes()
+                return obj
+            return checkedMaker
+        return maker
+
+    @classmethod
+    def fromRow( cls, values, check=False ):
+        """ Build a new instance from a sequence of slot values without
+            per-slot type checking. See rowMaker; for tight loops, call
+            rowMaker once and reuse the function it returns.
+        """
+        return cls.rowMaker( check )( values )
+
+    def checkTypes( self ):
+        """ Check every slot's value against its declared type(s) at once,
+            raising TypeError on the first violation. Useful for objects
+            built with fromRow/rowMaker, e.g. checking one sample per batch.
+        """
+        slots = self.__class__._slots
+        for name in slots:
+            value = getattr( self, name )
+            for paramType in slots[ name ]:
+                if isinstance( value, paramType ):
+                    break
+            else:
+                raise TypeError( "Type of " + name + \
+                                 " may not be " + type( value ).__name__ )
+
     def __eq__( self, other ):
         """ (DO NOT call this function directly; access it via the '=='
              operator.)
@@ -371,6 +398,102 @@ class struct( object ):
             raise TypeError( "Type of " + name + \
                              " may not be " + type( value ) .__name__ )
 
+def _declaredSlots( cls ):
+    """ Return a tuple of the names declared in real __slots__ class
+        variables by cls and its bases, stopping at struct.
+    """
+    names = []
+    for klass in cls.__mro__:
+        if klass is struct:
+            break
+        slots = klass.__dict__.get( "__slots__", () )
+        if not ( isinstance( slots, tuple ) or isinstance( slots, list ) ):
+            slots = ( slots, )
+        names.extend( slots )
+    return tuple( names )
+
+def _scanSlots( thisClass ):
+    """ Called once per class, when the first instance is created.
+        Builds the _slots dictionary for the class, from either its
+        _slots declaration or its __slots__ declaration.
+    """
+    className = thisClass.__name__
+    realSlots = _declaredSlots( thisClass )
+
+    # If __slots__ but no _slots, convert using type 'object'.
+    # or look for old, deprecated _types variable.
+    #
+    if "_slots" not in dir( thisClass ) and len( realSlots ) != 0:
+        slots = realSlots
+
+        newSlots = []
+        if "_types" in dir( thisClass ):
+            stderr.write( "struct warning: '_types' " + \
+                          "variable is deprecated. (class " + \
+                          className + ").\n" )
+            types = thisClass._types
+            if not ( isinstance( types, tuple ) or \
+                     isinstance( types, list ) ):
+                types = ( types, )
+            if len( types ) != len( slots ):
+                raise TypeError(
+                       "No. of slots differs from no. of types" )
+            for i in range( len( slots ) ):
+                newSlots.append( ( types[ i ], slots[ i ] ) )
+        else:
+            for attrName in slots:
+                newSlots.append( ( object, attrName ) )
+        thisClass._slots = tuple( newSlots )
+        realSlots = ()
+
+    if "_slots" not in dir( thisClass ):
+        raise TypeError( "struct subclasses must have " + \
+                         "either a '_slots' or '__slots__' " + \
+                         "attribute declared." )
+
+    # Do error checking and convert the _slots variable
+    # to a dictionary mapping each variable name to a set
+    # of types.
+    #
+    _normalizeSlotsConstruction( thisClass )
+
+    # A class may declare both, to get typed slots without a __dict__,
+    # but only if they name the same attributes.
+    #
+    if len( realSlots ) != 0 and \
+       set( realSlots ) != set( thisClass._slots.keys() ):
+        raise TypeError( "struct subclasses may not have " + \
+                         "a '_slots' attribute declared if\n" + \
+                         " the standard '__slots__' attribute " + \
+                         "names different attributes." )
+
+    # The above code is only exectuted the first time an object is
+    # created from the new class.
+    thisClass._typesScanned = True
+
+def _makeRowMaker( cls ):
+    """ Generate the trusted constructor returned by struct.rowMaker.
+        Each slot is set directly, through its member descriptor when the
+        class has a real __slots__ entry for it, bypassing __setattr__.
+    """
+    namespace = { "new": object.__new__, "cls": cls,
+                  "setattr": object.__setattr__ }
+    lines = [ "def make( values ):", "    obj = new( cls )" ]
+    i = 0
+    for name in cls._slots:
+        descriptor = getattr( cls, name, None )
+        if type( descriptor ).__name__ == "member_descriptor":
+            namespace[ "set" + str( i ) ] = descriptor.__set__
+            lines.append( "    set" + str( i ) + "( obj, values[ " + \
+                          str( i ) + " ] )" )
+        else:
+            lines.append( "    setattr( obj, " + repr( name ) + \
+                          ", values[ " + str( i ) + " ] )" )
+        i += 1
+    lines.append( "    return obj" )
+    exec( "\n".join( lines ), namespace )
+    return namespace[ "make" ]
+
 def _normalizeSlotsConstruction( cls ):
     """ The form of the _slots variable should be either
         TSet, str
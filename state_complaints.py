@@ -2,23 +2,40 @@
 Name: state_complaints.py
 Author: Ari Bernstein
 Description:  Organizes all the complaints according to the state in which they were reported.
-Pre-condition: utilities.py and display_complaints.py work correctly and are in same directory, csv files are in
+Pre-condition: utilities.py, complaint_statistics.py and display_complaints.py work correctly and are in same directory, csv files are in
 subdirectory labeled 'data'
 """
 
 from utilities import *
+from complaint_table import *
+from complaint_index import *
+from dataset_cache import *
+from mapped_reader import *
+from complaint_statistics import *
 import display_complaints
+import instrumentation
+from collections.abc import Sequence
+import itertools
 
-def make_state_map(dataset):
+@instrumentation.instrumented(countRows=True)
+def make_state_map(dataset, index=None):
     """
     Builds a dictionary organizing complaint objects by state
 
     :param dataset: (returned from read_complaint_data in utilities.py) a dictionary whose keys are complaint IDs and
-    values are the associated instance of the complaint class
+    values are the associated instance of the complaint class, a ComplaintTable, or a MappedComplaintFile (only its
+    State column is decoded)
+
+    :param index: optional ComplaintIndex of the dataset (from complaint_index) to build the map from instead of
+    scanning the dataset
 
     :return:A dictionary mapping upper case state abbreviation values to lists of
     Complaint objects originating in the state.
     """
+    if index is not None:
+        return index.state_map(dataset)
+    if isinstance(dataset, (ComplaintTable, MappedComplaintFile)):
+        return dataset.group_rows("State")
     stateDict = {}
     for key in dataset:
         if not dataset[key].State in stateDict:
@@ -27,18 +44,38 @@ def make_state_map(dataset):
             stateDict[dataset[key].State].append(dataset[key])
     return stateDict
 
+@instrumentation.instrumented(countRows=True)
+def make_state_counts(dataset, index=None):
+    """
+    Streaming reducer counting complaints by state in a single pass, keeping only one count per state
+
+    :param dataset: (returned from read_complaint_data in utilities.py) a dictionary whose keys are complaint IDs and
+    values are the associated instance of the complaint class, a ComplaintTable, a MappedComplaintFile (only its State
+    column is decoded), any iterable of complaints such as iter_complaints, or the path name of a CSV file, which is
+    streamed without keeping its rows (see count_by in complaint_statistics.py)
+
+    :param index: optional ComplaintIndex of the dataset; if given, the dataset is not read at all
+
+    :return: A dictionary mapping upper case state abbreviation values to the number of complaints originating in
+    the state.
+    """
+    if index is not None:
+        return index.state_counts()
+    return count_by(dataset, "State")
+
+@instrumentation.instrumented()
 def list_state_complaints(statemap):
     """
 
     :param statemap: (returned from make_state_map) A dictionary mapping upper case state abbreviation values to lists
-    of Complaint objects originating in the state.
+    of Complaint objects originating in the state. Counts of complaints (returned from make_state_counts) work too.
     :return: Not applicable
     printed output: A list of the number of complaints by state. The list is sorted from the largest
     number to the smallest number.
     """
     sortedBySize = []
     for key in statemap:
-        sortedBySize.append([key, len(statemap[key])])
+        sortedBySize.append([key, complaint_count(statemap[key])])
 
     """Sorts by number of complaints per state"""
     sortedBySize = sorted(sortedBySize, key = lambda x: int(x[1]), reverse = True)
@@ -51,7 +88,8 @@ def list_state_complaints(statemap):
     #return sortedBySize # (so that we can access the list if we want)
 
 
-def query_state_complaints(statemap, statelist, max_count=10):
+@instrumentation.instrumented()
+def query_state_complaints(statemap, statelist, max_count=10, offset=0):
     """
     Allows one to search for complaints by given states (in a list of strings representing state abbreviations)
 
@@ -62,34 +100,55 @@ def query_state_complaints(statemap, statelist, max_count=10):
 
     :param max_count: A number limiting the number of complaints to show per state. Because there may be hundreds of
     complaints. the max_count is an optional parameter. If it is not given an argument value, the default maximum is 10.
-     A number limiting the number of complaints to show per state.
+     A number limiting the number of complaints to show per state. None shows every complaint.
 
-    :return: Not applicable
+    :param offset: number of complaints of each state to skip before the first one shown, so that offset=10,
+    max_count=10 shows the second page of 10. Entries are numbered from offset + 1.
+
+    :return: A dictionary mapping each valid state in the state list to its total number of complaints, so callers
+    can tell how many pages there are
 
     Printed output: For every valid state in the state list, pretty print the first max count number of entries, stopping
     if there are fewer entries in the map than requested. Print “: no entries” after an invalid state name, and
     precede each valid entry with a line of text which contains that entry’s count in square brackets, the state name,
     and a line of 30 ‘=’ characters as shown in the examples.
     """
-    for key in statemap:
-        for i in statelist:
-            if i == key:
-                count = 0
-                for complaint in statemap[key]:
-                    if count != max_count:
-                        print('[ ' + str(count+1) + ' ]  ' + i + "  ==============================")
-                        display_complaints.display_complaint(complaint)
-                        count += 1
-                        print('\n')
+    stop = None if max_count is None else offset + max(max_count, 0)
+    totals = {}
+    """everything is written through one buffer rather than printed line by line"""
+    writer = display_complaints.ComplaintWriter()
+    for state in statelist:
+        complaints = statemap.get(state)
+        if complaints is None:
+            writer.write(state + ": no entries\n")
+            continue
+        totals[state] = len(complaints)
+        """only the complaints on the requested page are looked at (or, for a lazy list, built)"""
+        if isinstance(complaints, Sequence):
+            page = complaints[offset:stop]
+        else:
+            page = itertools.islice(complaints, offset, stop)
+        count = offset
+        for complaint in page:
+            writer.write('[ ' + str(count+1) + ' ]  ' + state + "  ==============================\n")
+            writer.write_complaint(complaint)
+            count += 1
+            writer.write('\n\n')
+    writer.close()
+    return totals
 
 
 def main():
-    newStateMap = make_state_map(read_complaint_data(getFilePath()))
+    complaints = open_report_dataset(getFilePath())
+    """a mapped file groups its State column alone; a table's index is built once and cached with it"""
+    index = complaint_index(complaints) if isinstance(complaints, ComplaintTable) else None
+    newStateMap = make_state_map(complaints, index)
     list_state_complaints(newStateMap)
 
     stateList = []
     i = (input(str.upper("Enter State (e.g. NY) or press ENTER key to stop: ")))
-    stateList.append(str.upper(i))
+    if i != "":
+        stateList.append(str.upper(i))
     while i is not "":
         i = (input(str.upper("Enter State (e.g. NY) or press ENTER key to stop: ")))
         if i is not "":
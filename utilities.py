@@ -4,13 +4,39 @@ Author: Ari Bernstein
 Description: This file contains a set of utilities which includes classes and functions used by the other
 program tasks.
 -Complaint class holds all data for each complaint
--read_complaint_data populates instances of class from spreadsheets
-Pre-condition: csv files containing data for Complaint class instances are in subdirectory called 'data'
+-read_complaint_data populates instances of class from spreadsheets, matching columns to slots by heading name
+-iter_complaints streams instances of class from spreadsheets one row at a time
+-open_complaint_file opens plain, gzip, bz2, xz and zip CSV files alike, decompressing in a separate thread
+-get_complaints looks up many complaints by ID at once
+-ProductPhraseIndex finds complaints by words of their Product and Sub_product
+-PendingRemovals lets the indexes take entries out of large groups without scanning the group for each one
+Reads are timed with the spans of instrumentation.py, which also prints (or, turned off, doesn't) their messages.
+Pre-condition: instrumentation.py is in same directory, csv files containing data for Complaint class instances are in
+subdirectory called 'data'
 """
 
 from rit_lib import *
+from array import array
+from collections.abc import Mapping
+import instrumentation
 import csv
-import time
+import io
+import operator
+import queue
+import re
+import threading
+import zipfile
+import zlib
+
+"""bz2 and lzma are missing from some Python builds; only bz2 and xz files need them"""
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+try:
+    import lzma
+except ImportError:
+    lzma = None
 
 class Complaint(struct):
     """
@@ -21,13 +47,358 @@ class Complaint(struct):
               (str, "Company"), (str, "State"), (str, "ZIP_code"), (str, "Tags"), (str, "Consumer_consent_provided"),
               (str, "Submitted_via"), (str, "Date_sent_to_company"), (str, "Company_response_to_consumer"),
               (str, "Timely_response"), (str, "Consumer_disputed"), (str, "Complaint_ID"))
+    """real __slots__ as well, so that instances don't carry a __dict__"""
+    __slots__ = tuple(name for dataType, name in _slots)
+
+"""Trusted constructor: csv.reader only ever produces strings, so the per-slot type checks done by Complaint(...)
+can be skipped when building complaints from spreadsheet rows"""
+makeComplaint = Complaint.rowMaker()
+
+
+def normalize_heading(row):
+    """
+    Converts the heading (first row) of a complaint CSV file into Complaint slot names
+    :param row: list of column names as they appear in the file, e.g. "Consumer consent provided?"
+    :return: list of column names with spaces and dashes replaced by underscores and question marks removed
+    """
+    heading = []
+    for i in row:
+        new_string = i.replace("-", "_")
+        new_string = new_string.replace(" ", "_")
+        new_string = new_string.replace("?", "")
+        heading.append(new_string)
+    return heading
+
+
+def heading_columns(heading, filepath="CSV file"):
+    """
+    Maps the columns of a complaint CSV file to Complaint slots by name, so files whose columns are reordered, or
+    that have extra or missing columns, can be read directly. Names are compared after normalize_heading, ignoring
+    case; when a name appears twice, the first column is used.
+    :param heading: list of column names as they appear in the file's first row
+    :param filepath: name of the file, for error messages
+    :return: tuple with, for each slot in Complaint._slots order, the position of its column or None if the file
+    doesn't have it
+    """
+    positions = {}
+    for position, name in enumerate(normalize_heading(heading)):
+        positions.setdefault(name.strip().lower(), position)
+    columns = tuple(positions.get(name.lower()) for name in Complaint._slots)
+    if columns[-1] is None:
+        raise ValueError(filepath + " has no Complaint ID column")
+    return columns
+
+
+def compile_extractor(columns, width):
+    """
+    Builds the function turning a row of a file into a row in Complaint._slots order.
+    :param columns: result of heading_columns for the file
+    :param width: number of columns in the file's heading
+    :return: None if the file's rows are already in Complaint._slots order, otherwise a function taking a row (list
+    of strings) and returning a tuple of strings, one per slot, with an empty string for slots the file doesn't have
+    """
+    if width == len(columns) and columns == tuple(range(width)):
+        return None
+    if None not in columns:
+        return operator.itemgetter(*columns)
+    """missing slots read a blank appended to the end of the row"""
+    getter = operator.itemgetter(*[-1 if position is None else position for position in columns])
+
+    def extract(row):
+        row.append("")
+        return getter(row)
+    return extract
+
+
+def compile_schema(heading, filepath="CSV file"):
+    """
+    Maps a file's columns to Complaint slots once and returns the function extracting slot values from each row.
+    :param heading: list of column names as they appear in the file's first row
+    :param filepath: name of the file, for error messages
+    :return: see compile_extractor
+    """
+    return compile_extractor(heading_columns(heading, filepath), len(heading))
+
+def compile_projection(fields):
+    """
+    Helper function for column projection: builds a function that keeps only some fields of a row
+    :param fields: iterable of Complaint slot names to keep, or None to keep every field. Complaint_ID is always kept,
+    since complaints are keyed by it.
+    :return: None if every field is kept, otherwise a function taking a row (list of strings in Complaint._slots
+    order) and returning a new row with every other field replaced by an empty string
+    """
+    if fields is None:
+        return None
+    slotNames = tuple(Complaint._slots)
+    keep = set()
+    for name in fields:
+        if name not in Complaint._slots:
+            raise AttributeError("'Complaint' object has no attribute named '" + name + "'")
+        keep.add(slotNames.index(name))
+    keep.add(slotNames.index("Complaint_ID"))
+    keep = sorted(keep)
+    blank = [""] * len(slotNames)
+
+    def project(row):
+        values = blank[:]
+        for i in keep:
+            values[i] = row[i]
+        return values
+    return project
+
+def compile_row_filter(where):
+    """
+    Helper function for predicate pushdown: builds a function testing rows against conditions on their fields, so
+    rows can be skipped before any Complaint is built
+    :param where: None, or a dictionary mapping Complaint slot names to a condition on that slot's value. A condition
+    is either a string the value must equal (e.g. {"Product": "Mortgage"}), a set/list/tuple of allowed values
+    (e.g. {"State": {"NY", "MN"}}), or a function taking the value and returning True to keep the row. A row is kept
+    only if it meets every condition.
+    :return: None if there are no conditions, otherwise a function taking a row and returning True to keep it
+    """
+    if not where:
+        return None
+    slotNames = tuple(Complaint._slots)
+    tests = []
+    for name in where:
+        if name not in Complaint._slots:
+            raise AttributeError("'Complaint' object has no attribute named '" + name + "'")
+        condition = where[name]
+        if isinstance(condition, str):
+            test = condition.__eq__
+        elif callable(condition):
+            test = condition
+        else:
+            test = frozenset(condition).__contains__
+        tests.append((slotNames.index(name), test))
+
+    def rowFilter(row):
+        for i, test in tests:
+            if not test(row[i]):
+                return False
+        return True
+    return rowFilter
+
+"""First bytes of the compressed files the readers accept, and the name of their compression"""
+COMPRESSION_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"), (b"PK\x03\x04", "zip"))
+
+"""Bytes read from a file at a time, and number of decompressed blocks the decompressing thread may read ahead"""
+READ_BUFFER_SIZE = 1 << 20
+READ_AHEAD_BLOCKS = 8
 
+"""Compressed bytes given to the decompressor at a time; each block is decompressed in one call, without the GIL"""
+COMPRESSED_BLOCK_SIZE = 1 << 18
 
-def read_complaint_data(filepath):
+def compression_of(filepath):
+    """
+    Recognizes a compressed file by its first bytes, whatever its name
+    :param filepath: path name of a file
+    :return: "gzip", "bz2", "xz" or "zip", or None for any other (e.g. plain CSV) file
+    """
+    with open(filepath, "rb") as data_file:
+        start = data_file.read(6)
+    for magic, compression in COMPRESSION_MAGIC:
+        if start.startswith(magic):
+            return compression
+    return None
+
+def _decompressor_maker(filepath, compression):
+    """helper function returning the function that makes a decompressor for one gzip, bz2 or xz stream"""
+    if compression == "gzip":
+        """wbits + 16: zlib reads the gzip header and trailer itself"""
+        return lambda: zlib.decompressobj(zlib.MAX_WBITS + 16)
+    module = bz2 if compression == "bz2" else lzma
+    if module is None:
+        raise ValueError(filepath + " is a " + compression + " file, but this Python has no " +
+                         ("bz2" if compression == "bz2" else "lzma") + " module")
+    return module.BZ2Decompressor if compression == "bz2" else module.LZMADecompressor
+
+def _zip_member(filepath):
+    """helper function opening the CSV file held by a zip archive: its only file, or its only .csv file"""
+    with zipfile.ZipFile(filepath) as archive:
+        names = [name for name in archive.namelist() if not name.endswith("/")]
+        if len(names) > 1:
+            names = [name for name in names if name.lower().endswith(".csv")]
+        if len(names) != 1:
+            raise ValueError(filepath + " must hold a single CSV file, it holds " + ", ".join(archive.namelist()))
+        """the member keeps the archive's file open after the archive is closed"""
+        return archive.open(names[0])
+
+def _needs_input(decompressor, block):
+    """
+    helper function to decompressed_blocks, tells whether a decompressor has given out everything it can from the
+    data given to it so far (bz2 and lzma say so; zlib keeps the data it didn't use in unconsumed_tail, and may hold
+    more output when the last block was full)
+    """
+    if hasattr(decompressor, "needs_input"):
+        return decompressor.needs_input
+    return decompressor.unconsumed_tail == b"" and len(block) < READ_BUFFER_SIZE
+
+def decompressed_blocks(filepath, compression):
+    """
+    Generator of the decompressed data of a compressed file, in blocks of at most READ_BUFFER_SIZE bytes, so memory
+    stays bounded however much the data inflates. Files holding several streams one
+    after the other (as written by cat a.gz b.gz > c.gz) are decompressed stream after stream, as gzip does; zero
+    bytes padding a gzip file after a stream are skipped, as gzip skips them.
+    :param filepath: path name of the file
+    :param compression: its compression, see compression_of
+    :raise EOFError: if the file ends in the middle of a stream
+    """
+    if compression == "zip":
+        with _zip_member(filepath) as member:
+            block = member.read(READ_BUFFER_SIZE)
+            while block:
+                yield block
+                block = member.read(READ_BUFFER_SIZE)
+        return
+    makeDecompressor = _decompressor_maker(filepath, compression)
+    decompressor = makeDecompressor()
+    complete = False
+    needInput = True
+    padding = False
+    data = b""
+    with open(filepath, "rb") as data_file:
+        while True:
+            if needInput:
+                data = data_file.read(COMPRESSED_BLOCK_SIZE)
+                if not data:
+                    break
+            if padding:
+                data = data.lstrip(b"\0")
+                if not data:
+                    needInput = True
+                    continue
+                padding = False
+            """at most READ_BUFFER_SIZE bytes per call, so data that inflates a lot is given out in several blocks
+            and no more compressed data is read until the decompressor has given out all it holds"""
+            block = decompressor.decompress(data, READ_BUFFER_SIZE)
+            if block:
+                yield block
+            if decompressor.eof:
+                """the rest of the data, if any, starts the next stream"""
+                data = decompressor.unused_data
+                decompressor = makeDecompressor()
+                complete = True
+                padding = compression == "gzip"
+                needInput = not data
+            else:
+                complete = False
+                data = getattr(decompressor, "unconsumed_tail", b"")
+                needInput = _needs_input(decompressor, block)
+    if not complete:
+        raise EOFError(filepath + " ended before the end of its compressed data")
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Binary stream reading its data from an iterator of blocks of bytes (such as decompressed_blocks) in a separate
+    thread, up to 'depth' blocks ahead. zlib, bz2 and lzma release the GIL while they decompress, so decompressing the
+    next blocks overlaps with parsing the current one.
+    """
+
+    def __init__(self, blocks, depth=READ_AHEAD_BLOCKS):
+        super().__init__()
+        self._queue = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._block = memoryview(b"")
+        self._position = 0
+        self._finished = False
+        self._thread = threading.Thread(target=self._produce, args=(blocks,), daemon=True)
+        self._thread.start()
+
+    def _produce(self, blocks):
+        """runs in the reading thread: queues the blocks, then b"" at the end of the data, or the error stopping it"""
+        try:
+            for block in blocks:
+                if self._stop.is_set():
+                    return
+                if block:
+                    self._put(block)
+            self._put(b"")
+        except Exception as error:
+            self._put(error)
+        finally:
+            """closes the file a generator of blocks is reading, when the stream is closed before its end"""
+            close = getattr(blocks, "close", None)
+            if close is not None:
+                close()
+
+    def _put(self, item):
+        """helper function queuing an item unless the stream is closed first"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._position == len(self._block):
+            if self._finished:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._finished = True
+                raise item
+            if not item:
+                self._finished = True
+                return 0
+            self._block = memoryview(item)
+            self._position = 0
+        count = min(len(buffer), len(self._block) - self._position)
+        buffer[:count] = self._block[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def close(self):
+        """stops the reading thread, which closes the file it reads"""
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        super().close()
+
+def require_uncompressed(filepath, reader):
+    """
+    Helper function for readers working on byte offsets of a file, which a compressed file doesn't have
+    :param filepath: path name of the file
+    :param reader: name of the reader, for the error message
+    :raise ValueError: if the file is compressed (see compression_of)
+    """
+    compression = compression_of(filepath)
+    if compression is not None:
+        raise ValueError(filepath + " is a " + compression + " file; " + reader + " needs an uncompressed CSV file, "
+                         "use read_complaint_data or read_complaint_table instead")
+
+def open_complaint_file(filepath):
+    """
+    Opens a complaint CSV file as text, decoded the same way open() does, with a READ_BUFFER_SIZE buffer. gzip, bz2, xz
+    and zip files (recognized by their first bytes, see compression_of) are decompressed as they are read, by a
+    separate thread (see ThreadedReader), so they never have to be decompressed to disk first.
+    :param filepath: A string, giving the path name of a CSV data file, compressed or not.
+    :return: a text file object, to use in a with statement
+    """
+    compression = compression_of(filepath)
+    if compression is None:
+        return open(filepath, buffering=READ_BUFFER_SIZE)
+    reader = ThreadedReader(decompressed_blocks(filepath, compression))
+    return io.TextIOWrapper(io.BufferedReader(reader, READ_BUFFER_SIZE))
+
+def read_complaint_data(filepath, fields=None, where=None):
     """
     Populates instances of complaint data from inputted CSV files.
 
-    :param filepath: A string, giving the path name of a CSV data file.
+    :param filepath: A string, giving the path name of a CSV data file. Columns are matched to Complaint slots by
+    their heading names (see heading_columns), so they may be in any order; extra columns are ignored and missing
+    ones are read as empty strings. Only the Complaint ID column is required. The file may be compressed with gzip,
+    bz2, xz or zip; it is then decompressed while it is read (see open_complaint_file).
+
+    :param fields: optional column projection, an iterable of Complaint slot names to fill in, e.g. ("State",). Every
+    other slot is left as an empty string, so those fields are never kept. By default all slots are filled in.
+
+    :param where: optional row predicates, e.g. {"State": {"NY", "MN"}, "Product": "Mortgage"}, applied while the
+    file is parsed so that rows which don't match are never turned into Complaint objects. See compile_row_filter.
 
     :return: A dictionary mapping integer complaint ID values to unique Complaint ob- jects. For every ID, there is
     exactly one Complaint object. The function should preserve the case of all field content characters in each
@@ -41,11 +412,13 @@ def read_complaint_data(filepath):
     • a message reporting the end of reading.
     """
     complaintDict = {}
-    startTime = time.time()
+    project = compile_projection(fields)
+    rowFilter = compile_row_filter(where)
 
-    print("Reading " + filepath)
+    instrumentation.progress("Reading " + filepath)
 
-    with open(filepath) as csv_file:
+    with instrumentation.span("read_complaint_data", bytesRead=instrumentation.file_size(filepath)) as reading, \
+            open_complaint_file(filepath) as csv_file:
         """opens csv file using csv module - this handles all otherwise invalid characters and oddly placed quotations
         and commas"""
         read_csv_file = csv.reader(csv_file, delimiter = ",")
@@ -55,52 +428,328 @@ def read_complaint_data(filepath):
         for row in read_csv_file:
             """Loops through file (except for heading -first row- and builds instance of class. Adds to dictionary)"""
             if notHeadingRow == False:
-                for i in row:
-                    """in heading (first row of csb), replaces spaces, dashes with underscores
-                    and removes question marks)"""
-                    new_string = i.replace("-", "_")
-                    new_string = new_string.replace(" ", "_")
-                    new_string = new_string.replace("?", "")
-                    row[row.index(i)] = new_string
+                """columns are matched to slots by name, so their order in the file doesn't matter"""
+                extract = compile_schema(row, filepath)
                 notHeadingRow = True
 
             elif notHeadingRow == True:
-                complaintDict[int(row[17])] = Complaint(row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7],
-                                                   row[8], row[9], row[10], row[11], row[12], row[13], row[14], row[15],
-                                                   row[16], row[17])
-    endTime = time.time()
-    totalTime = endTime - startTime
-
-    print("Total entries: " + str(len(complaintDict)))
-    print("Time elapsed: " + str(totalTime) + " seconds.")
-    print("Reading complete.")
+                if extract is not None:
+                    row = extract(row)
+                if rowFilter is not None and not rowFilter(row):
+                    continue
+                if project is not None:
+                    row = project(row)
+                complaintDict[int(row[17])] = makeComplaint(row)
+        reading.rows = len(complaintDict)
+
+    instrumentation.report_read(reading, len(complaintDict))
     return complaintDict
 
-def dataFromPhrase(phrase, dictionary):
+def iter_complaint_rows(filepath, fields=None, where=None):
+    """
+    Streams the rows of a CSV file, as sequences of strings in Complaint._slots order, whatever the file's column
+    order (see compile_schema).
+    :param filepath: A string, giving the path name of a CSV data file, compressed or not (see open_complaint_file).
+    :param fields: optional column projection, see read_complaint_data
+    :param where: optional row predicates, see read_complaint_data
+    :return: A generator of rows, in file order; rows not matching 'where' are skipped.
+    """
+    project = compile_projection(fields)
+    rowFilter = compile_row_filter(where)
+    with open_complaint_file(filepath) as csv_file:
+        read_csv_file = csv.reader(csv_file, delimiter = ",")
+        heading = next(read_csv_file, None)
+        extract = None
+        if heading is not None:
+            extract = compile_schema(heading, filepath)
+        for row in read_csv_file:
+            if extract is not None:
+                row = extract(row)
+            if rowFilter is not None and not rowFilter(row):
+                continue
+            if project is not None:
+                row = project(row)
+            yield row
+
+def iter_complaints(filepath, fields=None, verbose=False, where=None):
+    """
+    Streams complaints from a CSV file one row at a time, so that only the current row is ever held in memory.
+    Unlike read_complaint_data, rows are not collected into a dictionary: a Complaint_ID appearing more than once
+    is yielded each time it appears.
+
+    :param filepath: A string, giving the path name of a CSV data file.
+    :param fields: optional iterable of Complaint slot names to fill in, e.g. ("Company", "Product"). Every other
+    slot (except Complaint_ID) is left as an empty string so the rest of the row is never kept. By default all slots
+    are filled in.
+    :param verbose: if True, prints the same messages as read_complaint_data once the file has been read
+    :param where: optional row predicates, see read_complaint_data
+    :return: A generator of Complaint objects, in file order.
+    """
+    if verbose:
+        instrumentation.progress("Reading " + filepath)
+
+    with instrumentation.span("iter_complaints", bytesRead=instrumentation.file_size(filepath)) as reading:
+        total = 0
+        for row in iter_complaint_rows(filepath, fields, where):
+            total += 1
+            yield makeComplaint(row)
+        reading.rows = total
+
+    if verbose:
+        instrumentation.report_read(reading, total)
+
+def dataset_complaints(dataset):
+    """
+    Helper function letting the reports accept any source of complaints
+    :param dataset: a dictionary (or ComplaintTable) from read_complaint_data, or any iterable of Complaint objects
+    such as iter_complaints
+    :return: an iterable of Complaint objects
+    """
+    if isinstance(dataset, Mapping):
+        return dataset.values()
+    return dataset
+
+def complaint_count(entry):
+    """
+    Helper function for maps whose values are either lists of complaints or plain complaint counts
+    :param entry: a list of Complaint objects or an integer number of complaints
+    :return: number of complaints in entry
+    """
+    if isinstance(entry, int):
+        return entry
+    return len(entry)
+
+def phrase_tokens(text):
+    """
+    Helper function splitting text into lower case words for phrase searches, e.g. "Credit reporting, credit repair"
+    -> ["credit", "reporting", "credit", "repair"]
+    """
+    return _WORD.findall(text.lower())
+
+_WORD = re.compile(r"\w+")
+
+
+class PendingRemovals:
+    """
+    Entries (complaint IDs or dataset positions) removed from the groups of an index, each group an array holding an
+    entry at most once, but not yet taken out of the arrays. Taking one entry out of an array scans the whole group,
+    so removals are only recorded here, and each group touched is rewritten once, by compact, before it is next read.
+    Compacting keeps the remaining entries in their order.
+    """
+
+    def __init__(self):
+        """maps id() of each group with removals to the group and the set of entries removed from it"""
+        self.groups = {}
+
+    def remove(self, group, entry):
+        """records entry as removed from group and returns the number of entries left in group"""
+        pending = self.groups.get(id(group))
+        if pending is None:
+            pending = self.groups[id(group)] = (group, set())
+        pending[1].add(entry)
+        return len(group) - len(pending[1])
+
+    def restore(self, group, entry):
+        """
+        Takes back the removal of entry from group, if it is still pending, so that entry keeps its old place in group.
+        :return: True if entry was restored, False if it must be appended to group instead
+        """
+        pending = self.groups.get(id(group))
+        if pending is None or entry not in pending[1]:
+            return False
+        pending[1].discard(entry)
+        return True
+
+    def drop(self, group):
+        """forgets the removals from a group the index no longer holds"""
+        self.groups.pop(id(group), None)
+
+    def compact(self):
+        """takes every pending removal out of its group, rewriting each group once"""
+        for group, removed in self.groups.values():
+            if removed:
+                group[:] = array(group.typecode, [entry for entry in group if entry not in removed])
+        self.groups.clear()
+
+
+class ProductPhraseIndex:
+    """
+    Inverted index over the Product and Sub_product slots, built once when a dataset is loaded. Both slots hold few
+    distinct values, so the index maps each lower case word to the distinct values containing it, and each distinct
+    value to the positions (in dataset order) of the complaints holding it. A phrase query only looks at the distinct
+    values sharing its words, never at the complaints themselves, and nothing in the dataset is modified.
+    After update, a position that moved to another value is listed last among that value's positions; search sorts
+    positions, so its results are in dataset order all the same.
+    """
+    FIELDS = ("Product", "Sub_product")
+
+    def __init__(self, dataset):
+        self.ids = array("q")
+        self.postings = {}
+        self.words = {}
+        self.pending = PendingRemovals()
+        for field in self.FIELDS:
+            self.postings[field] = {}
+            self.words[field] = {}
+
+        if hasattr(dataset, "column"):
+            """ComplaintTable: read the columns without building each Complaint"""
+            self.ids.extend(dataset.ids)
+            for field in self.FIELDS:
+                for position, value in enumerate(dataset.column(field)):
+                    self._add(field, value, position)
+        else:
+            for position, complaintID in enumerate(dataset):
+                complaint = dataset[complaintID]
+                self.ids.append(complaintID)
+                for field in self.FIELDS:
+                    self._add(field, getattr(complaint, field), position)
+
+    def _add(self, field, value, position):
+        """helper function adding one complaint's value of a slot to the index"""
+        postings = self.postings[field]
+        if value not in postings:
+            postings[value] = array("q")
+            words = self.words[field]
+            for word in set(phrase_tokens(value)):
+                if word not in words:
+                    words[word] = set()
+                words[word].add(value)
+        elif self.pending.groups and self.pending.restore(postings[value], position):
+            return
+        postings[value].append(position)
+
+    def update(self, position, complaintID, previous, values):
+        """
+        Keeps the index up to date after the complaint at a dataset position was added or replaced (see
+        ComplaintTable.upsert), instead of building it again.
+        :param position: position of the complaint in the dataset
+        :param complaintID: integer complaint ID
+        :param previous: dictionary mapping slot names to the complaint's values before, or None if it is new
+        :param values: dictionary mapping slot names to the complaint's values now
+        """
+        if previous is None:
+            self.ids.append(complaintID)
+        for field in self.FIELDS:
+            if previous is not None:
+                if previous[field] == values[field]:
+                    continue
+                self._remove(field, previous[field], position)
+            self._add(field, values[field], position)
+
+    def compact(self):
+        """takes positions removed by update out of the postings (see PendingRemovals); search does this itself"""
+        self.pending.compact()
+
+    def _remove(self, field, value, position):
+        """helper function removing one complaint's value of a slot from the index"""
+        postings = self.postings[field]
+        if self.pending.remove(postings[value], position) == 0:
+            self.pending.drop(postings[value])
+            del postings[value]
+            words = self.words[field]
+            for word in set(phrase_tokens(value)):
+                words[word].discard(value)
+                if len(words[word]) == 0:
+                    del words[word]
+
+    def matching_values(self, phrase, field="Product"):
+        """
+        returns the distinct values of a slot containing phrase as whole words, ignoring case and punctuation
+        :param phrase: one or more words, e.g. "mortgage" or "Credit card"
+        :param field: "Product" or "Sub_product"
+        """
+        tokens = phrase_tokens(phrase)
+        if tokens == []:
+            return set()
+        words = self.words[field]
+        candidates = None
+        for token in tokens:
+            values = words.get(token, set())
+            candidates = values if candidates is None else candidates & values
+        if len(tokens) == 1:
+            return set(candidates)
+
+        matches = set()
+        for value in candidates:
+            valueTokens = phrase_tokens(value)
+            for start in range(len(valueTokens) - len(tokens) + 1):
+                if valueTokens[start:start + len(tokens)] == tokens:
+                    matches.add(value)
+                    break
+        return matches
+
+    def positions(self, phrase, fields=FIELDS):
+        """returns the set of dataset positions of the complaints whose slots (any of fields) contain phrase"""
+        self.pending.compact()
+        result = set()
+        for field in fields:
+            postings = self.postings[field]
+            for value in self.matching_values(phrase, field):
+                result.update(postings[value])
+        return result
+
+    def search(self, phrases, fields=FIELDS, mode="or"):
+        """
+        Finds the complaints matching one or more phrases.
+        :param phrases: a phrase, or a list of phrases
+        :param fields: slots to search, any of "Product" and "Sub_product"
+        :param mode: "or" for complaints matching any of the phrases, "and" for complaints matching all of them
+        :return: list of complaint IDs, in dataset order
+        """
+        if isinstance(phrases, str):
+            phrases = [phrases]
+        if mode not in ("and", "or"):
+            raise ValueError("mode must be 'and' or 'or', not " + repr(mode))
+        result = None
+        for phrase in phrases:
+            found = self.positions(phrase, fields)
+            if result is None:
+                result = found
+            elif mode == "and":
+                result &= found
+            else:
+                result |= found
+        if result is None:
+            return []
+        return [self.ids[position] for position in sorted(result)]
+
+
+def phrase_index(dictionary):
+    """
+    Returns the ProductPhraseIndex of a dataset. A ComplaintTable keeps its index in its cache; for a dictionary, a
+    new index is built, so build it once at load time and pass it to dataFromPhrase.
+    :param dictionary: dictionary of complaints from read_complaint_data, or a ComplaintTable
+    """
+    cache = getattr(dictionary, "cache", None)
+    if cache is None:
+        return ProductPhraseIndex(dictionary)
+    if "phrases" not in cache:
+        cache["phrases"] = ProductPhraseIndex(dictionary)
+    return cache["phrases"]
+
+
+def dataFromPhrase(phrase, dictionary, index=None):
     """
     returns classes whose phrase appears in the product slot of a complaint class instance
-    :param phrase: phrase which might appear in product of complaint class instance
+    :param phrase: phrase which might appear in product of complaint class instance (matched as whole words,
+    ignoring case)
     :param dictionary: dictionary of complaints from read_complaint_data
+    :param index: ProductPhraseIndex of the dictionary (see phrase_index); built here if not given
     :return: Not applicable
     printed output: Complaint_ID, Product, Company, and State if complaint class instance's company matches the phrase
     """
-    results = []
     phrase = phrase.strip()
-    # phrase = str.lower(phrase)
+    if phrase == "":
+        return "Phrase is empty."
+    if index is None:
+        index = phrase_index(dictionary)
 
-    for key in dictionary:
-        if phrase.strip() == "":
-            return "Phrase is empty."
-
-        else:
-            dictionary[key].Product = str.lower(dictionary[key].Product)
-
-            if phrase in dictionary[key].Product:
-                tempProduct = dictionary[key].Product.split()
-                for i in tempProduct:
-                    if i == phrase:
-                        results.append(str(dictionary[key].Complaint_ID) + ",  " + dictionary[key].Product.title() + ", " +
-                        dictionary[key].Company + ", " + dictionary[key].State)
+    results = []
+    for complaintID in index.search(phrase, fields=("Product",)):
+        complaint = dictionary[complaintID]
+        results.append(str(complaint.Complaint_ID) + ",  " + complaint.Product.lower().title() + ", " +
+                       complaint.Company + ", " + complaint.State)
     if results != []:
         for i in results:
             print(i)
@@ -112,16 +761,66 @@ def returnClassFromID(dictionary, id):
     returns complaint class instance given class' ID
     :param dictionary: dictionary of complaints from read_complaint_data
     :param id: complaint ID as string or int
-    :return: instance of class associated with class ID
+    :return: instance of class associated with class ID, or None if id is not a whole number or not in dictionary
     """
     if id == "":
         print("Complaint ID field is empty.")
         return None
     else:
-        id = int(id)
-        for key in dictionary:
-            if key == id:
-                return dictionary[key]
+        complaintID = parse_complaint_id(id)
+        if complaintID is None:
+            return None
+        return dictionary.get(complaintID)
+
+def parse_complaint_id(id):
+    """
+    Helper function converting a complaint ID given as string or int to an int
+    :param id: complaint ID as string or int
+    :return: the integer ID, or None if id is not a whole number
+    """
+    if isinstance(id, int):
+        return id
+    try:
+        return int(str(id).strip())
+    except ValueError:
+        return None
+
+def get_complaints(dictionary, ids):
+    """
+    Looks up many complaints by ID at once. Each lookup is a hashed (or, for an on-disk index, binary search) lookup,
+    so the cost depends on the number of IDs asked for, not on the size of the dataset.
+    :param dictionary: dictionary of complaints from read_complaint_data, a ComplaintTable, or a ComplaintIDIndex
+    (from id_index.py) serving complaints straight from the CSV file
+    :param ids: iterable of complaint IDs as strings or ints
+    :return: found, a dictionary mapping each integer ID found to its Complaint (in the order asked for), and missing,
+    a list of the IDs (as given) that are empty, not whole numbers, or not in the dataset
+    """
+    found = {}
+    missing = []
+    wanted = []
+    for id in ids:
+        complaintID = parse_complaint_id(id)
+        if complaintID is None:
+            missing.append(id)
+        else:
+            wanted.append((id, complaintID))
+
+    if hasattr(dictionary, "get_many"):
+        """on-disk indexes read the file in offset order instead of one seek per ID"""
+        complaints = dictionary.get_many([complaintID for id, complaintID in wanted])
+    else:
+        complaints = {}
+        for id, complaintID in wanted:
+            complaint = dictionary.get(complaintID)
+            if complaint is not None:
+                complaints[complaintID] = complaint
+
+    for id, complaintID in wanted:
+        if complaintID in complaints:
+            found[complaintID] = complaints[complaintID]
+        else:
+            missing.append(id)
+    return found, missing
 
 def getFilePath():
     """helper function to append CSV filname to its subdirectory, ./data/..."""
@@ -137,8 +836,9 @@ def main():
         productPhraseList.append(productPhrase)
         productPhrase = input("Enter Product phrase or press ENTER key to stop: ")
 
+    index = phrase_index(complaints)
     for i in productPhraseList:
-        dataFromPhrase(i, complaints)
+        dataFromPhrase(i, complaints, index)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file